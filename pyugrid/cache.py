@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+
+"""
+code to keep the search trees and connectivity of UGrids in a directory
+on disk, so they only need to be built once -- not in every process that
+uses the grid.
+
+This code is called by UGrid.save_cache() and UGrid.load_cache()
+
+Each grid gets its own sub-directory, named by its fingerprint(): a hash
+of the contents of its nodes and faces -- so the same grid, however it
+was loaded, finds its entry, and a changed grid won't find the old one --
+and its index dtype. The arrays are saved as .npy files (in the dtypes
+the grid uses) and memory-mapped back in as they are; the trees (which
+are extension types) are pickled.
+
+NOTE: pickles can run code when they are loaded -- only use a cache
+directory that you trust.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from . import locate
+
+# the arrays that are set on the grid -- in the order they need to be set,
+# as setting one invalidates what depends on it.
+ARRAYS = ('edges', 'face_face_connectivity', 'boundaries',
+          'face_edge_connectivity', 'edge_face_connectivity')
+
+# the trees, by the attribute of the grid they are kept in
+TREES = (('kdtree', '_kdtree'), ('celltree', '_tree'),
+         ('sphere_kdtree', '_sphere_kdtree'))
+
+
+def grid_key(grid):
+    """
+    The name of the cache entry of a grid: its fingerprint() and index
+    dtype -- so the saved arrays are already the dtype the grid uses, and
+    don't need to be converted (read all into memory) when loaded.
+    """
+    index_dtype = grid.index_dtype
+    if index_dtype != 'auto':
+        index_dtype = np.dtype(index_dtype).name
+    return '{}-{}'.format(grid.fingerprint(), index_dtype)
+
+
+def save(grid, directory):
+    """
+    Saves what has been built for the grid to its entry in the cache.
+
+    :param grid: the grid
+    :type grid: UGrid object.
+
+    :param directory: the cache directory -- created if need be.
+
+    :returns: list of the names of what was saved.
+
+    Only what the grid built itself (and that is up to date) is saved --
+    arrays that were passed in are not derived from the nodes and faces.
+    Each file is written to a temporary name, then renamed, so another
+    process reading the entry never sees half a file.
+    """
+    entry = os.path.join(directory, grid_key(grid))
+    if not os.path.isdir(entry):
+        try:
+            os.makedirs(entry)
+        except OSError:
+            # made by another process in the meantime
+            if not os.path.isdir(entry):
+                raise
+    saved = []
+    for name in ARRAYS:
+        array = getattr(grid, '_' + name)
+        if (array is None or name not in grid._built or
+                name in grid._stale):
+            continue
+        _save_item(entry, name, {'built': grid._built[name]},
+                   {'': array})
+        saved.append(name)
+
+    if grid._node_face_connectivity is not None:
+        offsets, indices = grid._node_face_connectivity
+        _save_item(entry, 'node_face_connectivity', {},
+                   {'offsets': offsets, 'indices': indices})
+        saved.append('node_face_connectivity')
+
+    bins = grid._bins
+    if bins is not None:
+        _save_item(entry, 'bins',
+                   {'origin': bins.origin.tolist(),
+                    'bin_size': float(bins.bin_size),
+                    'shape': list(bins.shape)},
+                   {'offsets': bins.offsets, 'indices': bins.indices})
+        saved.append('bins')
+
+    for name, attr in TREES:
+        tree = getattr(grid, attr)
+        if tree is None:
+            continue
+        try:
+            data = pickle.dumps(tree, protocol=pickle.HIGHEST_PROTOCOL)
+        except (TypeError, pickle.PicklingError):
+            # not all versions of the trees can be pickled
+            continue
+        _write(entry, name + '.pickle', data)
+        _write(entry, name + '.json', b'{}')
+        saved.append(name)
+    _touch(entry)
+    return saved
+
+
+def load(grid, directory):
+    """
+    Loads whatever is in the cache for the grid that it doesn't have yet.
+
+    :param grid: the grid
+    :type grid: UGrid object.
+
+    :param directory: the cache directory
+
+    :returns: list of the names of what was loaded -- empty if the grid
+              has no entry.
+
+    The arrays are memory-mapped copy-on-write: only read from disk as
+    they are used, and changes to them are never written back.
+    """
+    entry = os.path.join(directory, grid_key(grid))
+    if not os.path.isdir(entry):
+        return []
+    items = _items(entry)
+    loaded = []
+    for name in ARRAYS:
+        if (name in items and name not in grid._built and
+                getattr(grid, '_' + name) is None):
+            array = np.load(os.path.join(entry, name + '.npy'),
+                            mmap_mode='c')
+            grid._set(name, _as_index(grid, array),
+                      built=items[name]['built'])
+            loaded.append(name)
+
+    if ('node_face_connectivity' in items and
+            grid._node_face_connectivity is None):
+        offsets, indices = _load_arrays(entry, 'node_face_connectivity',
+                                        ('offsets', 'indices'))
+        grid._node_face_connectivity = (offsets, _as_index(grid, indices))
+        loaded.append('node_face_connectivity')
+
+    if 'bins' in items and grid._bins is None:
+        meta = items['bins']
+        offsets, indices = _load_arrays(entry, 'bins', ('offsets', 'indices'))
+        grid._bins = locate.FaceBins.from_arrays(grid.nodes, grid.faces,
+                                                 np.array(meta['origin']),
+                                                 meta['bin_size'],
+                                                 tuple(meta['shape']),
+                                                 offsets, indices)
+        loaded.append('bins')
+
+    for name, attr in TREES:
+        if name in items and getattr(grid, attr) is None:
+            with open(os.path.join(entry, name + '.pickle'), 'rb') as infile:
+                setattr(grid, attr, pickle.load(infile))
+            loaded.append(name)
+    # so recently used entries are the last evicted
+    _touch(entry)
+    return loaded
+
+
+def evict(directory, max_size=None, max_age=None):
+    """
+    Removes old entries from the cache.
+
+    :param directory: the cache directory
+
+    :param max_size=None: the most bytes to keep -- the least recently
+                          used entries are removed until it fits.
+    :param max_age=None: remove the entries not used in this many seconds.
+
+    :returns: list of the keys of the entries that were removed.
+    """
+    if not os.path.isdir(directory):
+        return []
+    entries = []
+    for key in os.listdir(directory):
+        path = os.path.join(directory, key)
+        if not os.path.isdir(path):
+            continue
+        size = sum(os.path.getsize(os.path.join(path, filename))
+                   for filename in os.listdir(path))
+        entries.append((os.path.getmtime(path), size, key))
+    entries.sort()
+
+    now = time.time()
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for used, size, key in entries:
+        too_old = max_age is not None and now - used > max_age
+        too_big = max_size is not None and total > max_size
+        if not (too_old or too_big):
+            continue
+        shutil.rmtree(os.path.join(directory, key), ignore_errors=True)
+        total -= size
+        removed.append(key)
+    return removed
+
+
+def _save_item(entry, name, meta, arrays):
+    """
+    Saves the arrays of one item, then its meta data -- which marks it
+    as complete.
+    """
+    for part, array in arrays.items():
+        filename = '.'.join(p for p in (name, part, 'npy') if p)
+        fd, tmp = tempfile.mkstemp(dir=entry, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as outfile:
+            np.save(outfile, np.asarray(array))
+        os.rename(tmp, os.path.join(entry, filename))
+    _write(entry, name + '.json', json.dumps(meta).encode('ascii'))
+
+
+def _write(entry, filename, data):
+    fd, tmp = tempfile.mkstemp(dir=entry, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as outfile:
+        outfile.write(data)
+    os.rename(tmp, os.path.join(entry, filename))
+
+
+def _items(entry):
+    """
+    The complete items in an entry, with their meta data.
+    """
+    items = {}
+    for filename in os.listdir(entry):
+        if filename.endswith('.json'):
+            with open(os.path.join(entry, filename)) as infile:
+                items[filename[:-5]] = json.load(infile)
+    return items
+
+
+def _as_index(grid, array):
+    """
+    A loaded index array in the grid's index dtype -- as is, memory-mapped,
+    if it is already: it was saved by a grid with the same index dtype.
+    """
+    if grid.index_dtype == 'auto' or array.dtype == grid.index_dtype:
+        return array
+    return grid._as_index(array)
+
+
+def _load_arrays(entry, name, parts):
+    return [np.load(os.path.join(entry, '{}.{}.npy'.format(name, part)),
+                    mmap_mode='c') for part in parts]
+
+
+def _touch(entry):
+    try:
+        os.utime(entry, None)
+    except OSError:
+        # evicted by another process
+        pass
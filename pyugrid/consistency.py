@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+"""
+code to check that a UGrid is consistent: indexes in range, no degenerate
+or duplicate faces, etc.
+
+This code is called by UGrid.check_consistent()
+
+It is all vectorized -- a few passes over the arrays, so it should be fast
+enough to run on every grid as it is loaded.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+from collections import OrderedDict
+
+import numpy as np
+
+from .util import edge_keys, key_nodes
+
+
+class ConsistencyReport(OrderedDict):
+    """
+    The result of UGrid.check_consistent()
+
+    A dict of the checks that were run, each holding what failed it:
+
+    'bad_shapes': names of arrays that are the wrong shape
+    'face_nodes_out_of_range': indexes of faces with bad node indexes
+    'edge_nodes_out_of_range': indexes of edges with bad node indexes
+    'boundary_nodes_out_of_range': indexes of boundaries with bad node
+                                   indexes
+    'connectivity_out_of_range': names of connectivity arrays with bad
+                                 indexes
+    'degenerate_faces': indexes of faces with a repeated node, or no area
+    'duplicate_faces': indexes of faces that repeat an earlier face
+    'inconsistent_orientation': indexes of faces wound the other way from
+                                the majority
+    'non_manifold_edges': (N, 2) array of the nodes of edges shared by
+                          more than two faces
+    'bad_data_lengths': names of UVars that don't match the grid
+
+    Checks that could not be run (no faces, etc.) are not there.
+    """
+
+    @property
+    def ok(self):
+        """
+        True if all the checks passed.
+        """
+        return all(len(found) == 0 for found in self.values())
+
+    def __str__(self):
+        if self.ok:
+            return "UGrid is consistent"
+        msg = ["UGrid is not consistent:"]
+        for check, found in self.items():
+            if len(found):
+                msg.append("  {}: {}".format(check, len(found)))
+        return "\n".join(msg)
+
+
+def check_grid(grid, quick=False, sample_size=100000):
+    """
+    Checks the grid for consistency.
+
+    :param grid: the grid to check
+    :type grid: UGrid object.
+
+    :param quick=False: if True, only a random sample of the faces, edges
+                        and boundaries is checked.
+    :param sample_size=100000: the size of the sample for a quick check.
+
+    :returns: a ConsistencyReport
+
+    If any of the arrays are the wrong shape, only 'bad_shapes' is
+    checked: the other checks can't index into them.
+
+    NOTE: passing the UGrid object in to avoid circular references,
+    while keeping the checking code in its own file.
+    """
+    # not at the top: ugrid imports this module
+    from .ugrid import _signed_areas
+
+    report = ConsistencyReport()
+    num_nodes = len(grid.nodes)
+    faces = grid.faces
+    rs = np.random.RandomState(0)
+
+    def sample(array):
+        """a random sample of the rows, and their indexes"""
+        if not quick or len(array) <= sample_size:
+            return np.arange(len(array)), array
+        rows = np.sort(rs.choice(len(array), sample_size, replace=False))
+        return rows, array[rows]
+
+    report['bad_shapes'] = _bad_shapes(grid)
+    if report['bad_shapes']:
+        return report
+
+    if faces is not None:
+        face_ind, face_sample = sample(faces)
+        bad = _out_of_range(face_sample, num_nodes)
+        report['face_nodes_out_of_range'] = face_ind[bad]
+        # the rest of the face checks only make sense with good indexes.
+        face_ind = face_ind[~bad]
+        face_sample = face_sample[~bad]
+
+        vertices = face_sample.T
+        areas = _signed_areas(grid.nodes[:, 0][vertices],
+                              grid.nodes[:, 1][vertices])
+        scale = np.abs(areas).max() if len(areas) else 0.0
+        repeated = np.zeros(len(face_sample), dtype=bool)
+        num_vertices = face_sample.shape[1]
+        for i in range(num_vertices):
+            for j in range(i + 1, num_vertices):
+                repeated |= face_sample[:, i] == face_sample[:, j]
+        degenerate = repeated | (np.abs(areas) <= scale * 1e-12)
+        report['degenerate_faces'] = face_ind[degenerate]
+
+        report['duplicate_faces'] = face_ind[_duplicate_rows(face_sample)]
+
+        positive = areas > 0
+        majority = positive[~degenerate].sum() * 2 >= (~degenerate).sum()
+        wrong_way = (positive != majority) & ~degenerate
+        report['inconsistent_orientation'] = face_ind[wrong_way]
+
+        report['non_manifold_edges'] = _non_manifold_edges(face_sample,
+                                                           num_nodes)
+
+    for name, location in (('edges', 'edge'), ('boundaries', 'boundary')):
+        array = getattr(grid, name)
+        if array is not None:
+            ind, array_sample = sample(array)
+            bad = _out_of_range(array_sample, num_nodes)
+            report[location + '_nodes_out_of_range'] = ind[bad]
+
+    report['connectivity_out_of_range'] = _bad_connectivity(grid)
+    report['bad_data_lengths'] = _bad_data_lengths(grid)
+    return report
+
+
+def _out_of_range(indexes, num):
+    """
+    Flags the rows that have an index outside [0, num)
+    """
+    indexes = np.asarray(indexes)
+    if indexes.size == 0:
+        return np.zeros(len(indexes), dtype=bool)
+    return ((indexes < 0) | (indexes >= num)).any(axis=1)
+
+
+def _duplicate_rows(faces):
+    """
+    Flags the faces that use the same nodes as an earlier face.
+    """
+    if len(faces) == 0:
+        return np.zeros((0,), dtype=bool)
+    rows = np.sort(faces, axis=1)
+    order = np.lexsort(rows.T[::-1])
+    rows = rows[order]
+    same = np.zeros(len(rows), dtype=bool)
+    same[1:] = (rows[1:] == rows[:-1]).all(axis=1)
+    duplicate = np.zeros(len(rows), dtype=bool)
+    duplicate[order] = same
+    return duplicate
+
+
+def _non_manifold_edges(faces, num_nodes):
+    """
+    The edges that are shared by more than two faces.
+    """
+    if len(faces) == 0:
+        return np.zeros((0, 2), dtype=np.intp)
+    keys = edge_keys(faces, num_nodes).ravel()
+    keys, counts = np.unique(keys, return_counts=True)
+    keys = keys[counts > 2]
+    return np.column_stack(key_nodes(keys, num_nodes))
+
+
+def _bad_shapes(grid):
+    """
+    The names of the arrays that don't have the right shape.
+    """
+    bad = []
+    if grid.nodes.ndim != 2 or grid.nodes.shape[1] != 2:
+        bad.append('nodes')
+    num_faces = num_edges = num_vertices = None
+    if grid.faces is not None:
+        num_faces = len(grid.faces)
+        if (grid.faces.ndim != 2 or grid.faces.shape[1] < 3 or
+                grid.faces.dtype.kind not in 'iu'):
+            bad.append('faces')
+        else:
+            num_vertices = grid.faces.shape[1]
+    if grid.edges is not None:
+        num_edges = len(grid.edges)
+    shapes = [('edges', (None, 2)),
+              ('boundaries', (None, 2)),
+              ('face_face_connectivity', (num_faces, num_vertices)),
+              ('face_edge_connectivity', (num_faces, num_vertices)),
+              ('edge_face_connectivity', (num_edges, 2)),
+              ('face_coordinates', (num_faces, 2)),
+              ('edge_coordinates', (num_edges, 2)),
+              ]
+    if grid.boundaries is not None:
+        shapes.append(('boundary_coordinates', (len(grid.boundaries), 2)))
+    for name, shape in shapes:
+        array = getattr(grid, name)
+        if array is None:
+            continue
+        if (array.ndim != 2 or
+           any(expected is not None and expected != actual
+               for expected, actual in zip(shape, array.shape))):
+            bad.append(name)
+    return bad
+
+
+def _bad_connectivity(grid):
+    """
+    The names of the connectivity arrays that point outside of what they
+    connect to.
+    """
+    bad = []
+    num_faces = len(grid.faces) if grid.faces is not None else 0
+    num_edges = len(grid.edges) if grid.edges is not None else 0
+    for name, num, flag in (('face_face_connectivity', num_faces, True),
+                            ('face_edge_connectivity', num_edges, False),
+                            ('edge_face_connectivity', num_faces, True)):
+        array = getattr(grid, name)
+        if array is None or array.size == 0:
+            continue
+        low = -1 if flag else 0
+        if array.min() < low or array.max() >= num:
+            bad.append(name)
+    return bad
+
+
+def _bad_data_lengths(grid):
+    """
+    The names of the UVars that don't match the size of the grid.
+    """
+    sizes = {'node': len(grid.nodes)}
+    for location, name in (('face', 'faces'),
+                           ('edge', 'edges'),
+                           ('boundary', 'boundaries')):
+        array = getattr(grid, name)
+        sizes[location] = None if array is None else len(array)
+    return [uvar.name for uvar in grid.data.values()
+            if len(uvar.data) != sizes.get(uvar.location)]
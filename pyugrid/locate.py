@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+
+"""
+code to find the faces of a UGrid that points are in
+
+This is used by UGrid.locate_faces(method='bins'): a uniform grid of bins
+over the faces, each holding the faces whose bounding box overlaps it,
+then a vectorized check of the faces in each point's bin. It's all numpy,
+so it works without any compiled extras.
+
+For faces on a sphere (locate_faces(spherical=True)) the same bins are
+used on the six sides of a cube around it.
+
+And by UGrid.locate_faces(hint=...): a walk across the faces from where
+each point was last found.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+
+from .util import csr_rows
+
+
+class FaceBins(object):
+    """
+    A uniform grid of bins over the faces of a grid, each holding the
+    faces whose bounding box overlaps it.
+    """
+
+    def __init__(self, nodes, faces, faces_per_bin, chunk_size):
+        """
+        Bins the faces.
+
+        :param nodes: (N, 2) array of the node coordinates
+        :param faces: (M, num_vertices) array of the nodes of each face
+
+        :param faces_per_bin: about how many faces to have in each bin --
+                              sets the number of bins.
+        :param chunk_size: number of faces to work on at once.
+
+        As the bins cover the area of the grid about once, the faces are
+        in a couple of bins each on average, however big or small they
+        are.
+        """
+        self.nodes = nodes
+        self.faces = faces
+        x = np.asarray(nodes[:, 0], dtype=np.float64)
+        y = np.asarray(nodes[:, 1], dtype=np.float64)
+        num_faces = len(faces)
+
+        # the bounding box of each face
+        bounds = np.empty((4, num_faces))
+        for start in range(0, num_faces, chunk_size):
+            vertices = faces[start:start + chunk_size].T
+            for coord, row in ((x, 0), (y, 2)):
+                values = coord[vertices]
+                bounds[row, start:start + chunk_size] = values.min(axis=0)
+                bounds[row + 1, start:start + chunk_size] = values.max(axis=0)
+        x_min, x_max, y_min, y_max = bounds
+
+        if num_faces:
+            self.origin = np.array((x_min.min(), y_min.min()))
+            width = x_max.max() - self.origin[0]
+            height = y_max.max() - self.origin[1]
+        else:
+            self.origin = np.zeros(2)
+            width = height = 0.0
+        num_bins = max(num_faces / faces_per_bin, 1)
+        if width > 0 and height > 0:
+            self.bin_size = np.sqrt(width * height / num_bins)
+        else:
+            self.bin_size = max(width, height, 1.0) / num_bins
+        self.shape = (int(width // self.bin_size) + 1,
+                      int(height // self.bin_size) + 1)
+
+        # every bin each face's bounding box overlaps
+        ix0, iy0 = self._bin_indexes(x_min, y_min)
+        ix1, iy1 = self._bin_indexes(x_max, y_max)
+        nx = ix1 - ix0 + 1
+        counts = nx * (iy1 - iy0 + 1)
+        face_of = np.repeat(np.arange(num_faces), counts)
+        run_start = np.repeat(np.cumsum(counts) - counts, counts)
+        within = np.arange(counts.sum()) - run_start
+        bins = ((iy0[face_of] + within // nx[face_of]) * self.shape[0] +
+                ix0[face_of] + within % nx[face_of])
+
+        # sort by bin, then face -- packed into one key, as sorting the
+        # values is a lot quicker than a stable argsort.
+        keys = np.sort(bins.astype(np.int64) * max(num_faces, 1) + face_of)
+        num_bins = self.shape[0] * self.shape[1]
+        self.offsets = np.zeros(num_bins + 1, dtype=np.intp)
+        np.cumsum(np.bincount(bins, minlength=num_bins),
+                  out=self.offsets[1:])
+        self.indices = (keys % max(num_faces, 1)).astype(np.intp)
+
+    @classmethod
+    def from_arrays(cls, nodes, faces, origin, bin_size, shape, offsets,
+                    indices):
+        """
+        Makes the bins from their (saved) parts, without binning the faces
+        again.
+        """
+        bins = cls.__new__(cls)
+        bins.nodes = nodes
+        bins.faces = faces
+        bins.origin = origin
+        bins.bin_size = bin_size
+        bins.shape = shape
+        bins.offsets = offsets
+        bins.indices = indices
+        return bins
+
+    def _bin_indexes(self, x, y):
+        """
+        The (column, row) of the bins the coordinates are in -- clipped to
+        the grid of bins.
+        """
+        ix = np.floor((x - self.origin[0]) / self.bin_size).astype(np.intp)
+        iy = np.floor((y - self.origin[1]) / self.bin_size).astype(np.intp)
+        np.clip(ix, 0, self.shape[0] - 1, out=ix)
+        np.clip(iy, 0, self.shape[1] - 1, out=iy)
+        return ix, iy
+
+    def locate(self, points, chunk_size):
+        """
+        The face each point is in, or -1 if it is not in any.
+
+        :param points: (N, 2) array of points
+        :param chunk_size: about how many (point, face) pairs to check at
+                           once.
+
+        Where a point is on the edge between faces, the lowest numbered
+        one is returned.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        found = np.empty(len(points), dtype=np.intp)
+        found.fill(-1)
+        if len(self.indices) == 0:
+            return found
+        faces_per_bin = len(self.indices) / (len(self.offsets) - 1)
+        points_per_chunk = max(int(chunk_size / max(faces_per_bin, 1)), 1)
+        x, y = self.nodes[:, 0], self.nodes[:, 1]
+        extent = self.origin + self.bin_size * np.array(self.shape)
+        for start in range(0, len(points), points_per_chunk):
+            chunk = points[start:start + points_per_chunk]
+            px, py = chunk[:, 0], chunk[:, 1]
+            in_box = ((px >= self.origin[0]) & (px <= extent[0]) &
+                      (py >= self.origin[1]) & (py <= extent[1]))
+            rows = np.nonzero(in_box)[0]
+            ix, iy = self._bin_indexes(px[rows], py[rows])
+            candidates, row_of = csr_rows(self.offsets, self.indices,
+                                          iy * self.shape[0] + ix)
+            row_of = rows[row_of]
+            vertices = self.faces[candidates].T
+            inside = points_in_faces(px[row_of], py[row_of],
+                                     x[vertices], y[vertices])
+            # the first face found for each point: the candidates are in
+            # order of point, then face.
+            hits = row_of[inside]
+            first = np.ones(len(hits), dtype=bool)
+            first[1:] = hits[1:] != hits[:-1]
+            found[start + hits[first]] = candidates[inside][first]
+        return found
+
+
+class SphereBins(object):
+    """
+    Bins for faces on a sphere: the faces are projected onto the six faces
+    of a cube around it, from its center (a gnomonic projection), and
+    binned on each with FaceBins.
+
+    Great circles project to straight lines, so the sides of the faces
+    stay straight, and the (planar) point in face checks are exact for
+    faces with great circle sides. There are no seams at the antimeridian
+    or singularities at the poles.
+
+    The faces must be small enough to be on one side of the sphere from
+    any point in them -- less than about 30 degrees across is safe.
+    """
+
+    def __init__(self, vectors, faces, faces_per_bin, chunk_size):
+        """
+        Bins the faces.
+
+        :param vectors: (N, 3) array of the nodes, as unit vectors
+        :param faces: (M, num_vertices) array of the nodes of each face
+
+        :param faces_per_bin: about how many faces to have in each bin.
+        :param chunk_size: number of faces to work on at once.
+        """
+        num_nodes = len(vectors)
+        self.cube = []
+        for axis in range(3):
+            for sign in (1.0, -1.0):
+                # the faces all in front of this side of the cube, that
+                # overlap it: their projected nodes
+                projected = _gnomonic(vectors, axis, sign)
+                in_front = sign * vectors[:, axis] > 0
+                selected = []
+                for start in range(0, len(faces), chunk_size):
+                    vertices = faces[start:start + chunk_size].T
+                    keep = in_front[vertices].all(axis=0)
+                    for coord in projected.T:
+                        values = coord[vertices]
+                        keep &= (values.min(axis=0) <= 1)
+                        keep &= (values.max(axis=0) >= -1)
+                    selected.append(start + np.nonzero(keep)[0])
+                face_ids = np.concatenate(selected) if selected else \
+                    np.zeros((0,), dtype=np.intp)
+
+                # just the nodes of those faces
+                cube_faces = faces[face_ids]
+                used = np.zeros(num_nodes, dtype=bool)
+                used[cube_faces] = True
+                node_map = np.cumsum(used) - 1
+                bins = FaceBins(projected[used], node_map[cube_faces],
+                                faces_per_bin, chunk_size)
+                self.cube.append((axis, sign, face_ids, bins))
+
+    def locate(self, vectors, chunk_size):
+        """
+        The face each point is in, or -1 if it is not in any.
+
+        :param vectors: (N, 3) array of the points, as unit vectors
+        :param chunk_size: about how many (point, face) pairs to check at
+                           once.
+        """
+        vectors = np.asarray(vectors, dtype=np.float64).reshape(-1, 3)
+        found = np.empty(len(vectors), dtype=np.intp)
+        found.fill(-1)
+        # each point is looked for on the side of the cube it's in front of
+        axis_of = np.argmax(np.abs(vectors), axis=1)
+        positive = vectors[np.arange(len(vectors)), axis_of] > 0
+        for axis, sign, face_ids, bins in self.cube:
+            rows = np.nonzero((axis_of == axis) & (positive == (sign > 0)))[0]
+            if len(rows) == 0:
+                continue
+            local = bins.locate(_gnomonic(vectors[rows], axis, sign),
+                                chunk_size)
+            hit = local >= 0
+            found[rows[hit]] = face_ids[local[hit]]
+        return found
+
+
+def _gnomonic(vectors, axis, sign):
+    """
+    Projects unit vectors onto the side of the cube with its center at
+    sign along axis: (N, 2) array of the other two coordinates, scaled so
+    the point is on that side.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        main = sign * vectors[:, axis]
+        return np.column_stack((vectors[:, (axis + 1) % 3] / main,
+                                vectors[:, (axis + 2) % 3] / main))
+
+
+def points_in_faces(px, py, vx, vy):
+    """
+    Checks if each of a number of points is in a face.
+
+    :param px, py: (N,) arrays of the coordinates of the points
+    :param vx, vy: (num_vertices, N) arrays of the coordinates of the
+                   vertices of the face to check each point against.
+
+    :returns: (N,) boolean array -- True if in the face, or on its edge.
+
+    The point is in the face if it is on the same side of all the edges:
+    the faces can be wound either way, but must be convex.
+    """
+    num_vertices = len(vx)
+    all_left = np.ones(len(px), dtype=bool)
+    all_right = np.ones(len(px), dtype=bool)
+    any_off = np.zeros(len(px), dtype=bool)
+    for i in range(num_vertices):
+        j = (i + 1) % num_vertices
+        cross = ((vx[j] - vx[i]) * (py - vy[i]) -
+                 (vy[j] - vy[i]) * (px - vx[i]))
+        all_left &= cross >= 0
+        all_right &= cross <= 0
+        any_off |= cross != 0
+    # a face with no area has every point on its line on all its edges
+    return (all_left | all_right) & any_off
+
+
+def walk(nodes, faces, face_face, points, start, max_steps=20):
+    """
+    Finds the faces the points are in by walking across the grid from a
+    face each one is known to be in or near: e.g. where a particle was on
+    the last time step.
+
+    :param nodes: (N, 2) array of the node coordinates -- or (N, 3) of
+                  unit vectors, for faces on a sphere with great circle
+                  sides.
+    :param faces: (M, num_vertices) array of the nodes of each face
+    :param face_face: (M, num_vertices) array of the neighbor of each
+                      face across each of its edges, or -1
+    :param points: (P, 2) array of points -- or (P, 3) of unit vectors
+    :param start: (P,) array of the face to start each point from -- -1
+                  if not known.
+    :param max_steps=20: the most faces to step across for each point.
+
+    :returns: (P,) array of the face each point is in, or -1 if the walk
+              didn't find it: the start was not known, it walked off the
+              grid, or it took too many steps.
+
+    All the points take a step at once: each one that is not in its face
+    steps across the edge it is furthest outside of.
+    """
+    dims = nodes.shape[1]
+    points = np.asarray(points, dtype=np.float64).reshape(-1, dims)
+    found = np.empty(len(points), dtype=np.intp)
+    found.fill(-1)
+    active = np.nonzero(np.asarray(start) >= 0)[0]
+    current = np.asarray(start, dtype=np.intp)[active]
+    for _ in range(max_steps + 1):
+        if len(active) == 0:
+            break
+        vertices = faces[current].T
+        if dims == 2:
+            inside, twice_area = _planar_edge_distances(
+                points[active].T, [nodes[:, k][vertices] for k in range(2)])
+        else:
+            inside, twice_area = _spherical_edge_distances(
+                points[active].T, [nodes[:, k][vertices] for k in range(3)])
+        # positive inside counter-clockwise faces -- flip the clockwise
+        inside[:, twice_area < 0] *= -1
+        # an edge of no length doesn't keep anything out
+        inside[np.isnan(inside)] = np.inf
+
+        arrived = (inside >= 0).all(axis=0) & (twice_area != 0)
+        found[active[arrived]] = current[arrived]
+        # step out across the edge the point is furthest outside of
+        edge = np.argmin(inside, axis=0)
+        current = np.asarray(face_face[current, edge], dtype=np.intp)
+        moving = ~arrived & (current >= 0)
+        active = active[moving]
+        current = current[moving]
+    return found
+
+
+def _planar_edge_distances(point, vertices):
+    """
+    The (signed) distance of each point inside each edge of its face, and
+    twice the area of the face -- both positive if it's counter-clockwise.
+
+    :param point: (px, py) arrays of the points
+    :param vertices: (vx, vy) (num_vertices, N) arrays of the coordinates
+                     of the vertices
+    """
+    px, py = point
+    vx, vy = vertices
+    num_vertices = len(vx)
+    inside = np.empty((num_vertices, len(px)))
+    twice_area = np.zeros(len(px))
+    for i in range(num_vertices):
+        j = (i + 1) % num_vertices
+        dx = vx[j] - vx[i]
+        dy = vy[j] - vy[i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inside[i] = ((dx * (py - vy[i]) - dy * (px - vx[i])) /
+                         np.hypot(dx, dy))
+        twice_area += vx[i] * vy[j] - vx[j] * vy[i]
+    return inside, twice_area
+
+
+def _spherical_edge_distances(point, vertices):
+    """
+    The same for faces on a sphere, with great circle sides: the sine of
+    the angle of each point inside the plane of each side, and something
+    with the sign of the area -- the vector area of the face, projected
+    onto its middle.
+
+    :param point: (px, py, pz) arrays of the points, as unit vectors
+    :param vertices: (vx, vy, vz) (num_vertices, N) arrays of the vertices,
+                     as unit vectors
+    """
+    px, py, pz = point
+    vx, vy, vz = vertices
+    num_vertices = len(vx)
+    inside = np.empty((num_vertices, len(px)))
+    area = [np.zeros(len(px)) for _ in range(3)]
+    for i in range(num_vertices):
+        j = (i + 1) % num_vertices
+        # the normal of the plane of the side
+        nx = vy[i] * vz[j] - vz[i] * vy[j]
+        ny = vz[i] * vx[j] - vx[i] * vz[j]
+        nz = vx[i] * vy[j] - vy[i] * vx[j]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inside[i] = ((nx * px + ny * py + nz * pz) /
+                         np.sqrt(nx ** 2 + ny ** 2 + nz ** 2))
+        area[0] += nx
+        area[1] += ny
+        area[2] += nz
+    middle = [v.sum(axis=0) for v in (vx, vy, vz)]
+    twice_area = sum(a * m for a, m in zip(area, middle))
+    return inside, twice_area
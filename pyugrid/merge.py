@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+"""
+code to merge a number of UGrids into one
+
+This code is called by UGrid.merge(), to stitch together tiled or nested
+meshes: the nodes and faces are concatenated, the nodes that coincide
+along the seams are merged, and the connectivity rebuilt once at the end.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+
+from .util import component_labels, edge_keys, segment_keys
+from .uvar import UVar
+
+
+# the half of the 3x3 block of neighboring cells that is searched from each
+# cell -- the other half is found from the other side.
+_NEIGHBOR_CELLS = ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def merge_nodes(nodes, tol=0.0):
+    """
+    Finds the nodes that are within tol of each other.
+
+    :param nodes: (N, 2) array of node coordinates
+    :param tol=0.0: the distance within which nodes are the same. If 0,
+                    only exactly equal nodes are merged.
+
+    :returns: node_map, first_node: the index in the merged nodes of each
+              node, and the index of the first of the nodes merged into
+              each merged node -- which is the one kept. The merged nodes
+              keep the order of their first nodes.
+
+    The nodes are hashed into square cells of size tol, so only the nodes
+    in neighboring cells are compared: O(N) comparisons, plus a sort.
+    Merging is transitive: if a is within tol of b, and b of c, all three
+    are merged, even if a and c are further apart than tol.
+    """
+    nodes = np.asarray(nodes)
+    num_nodes = len(nodes)
+    if tol < 0:
+        raise ValueError("tol must be zero or positive")
+    if num_nodes == 0:
+        return np.zeros((0,), dtype=np.intp), np.zeros((0,), dtype=np.intp)
+
+    if tol == 0:
+        # sort, so equal nodes are together -- lowest index first
+        order = np.lexsort(nodes.T[::-1])
+        sorted_nodes = nodes[order]
+        new_run = np.ones(num_nodes, dtype=bool)
+        new_run[1:] = (sorted_nodes[1:] != sorted_nodes[:-1]).any(axis=1)
+        run = np.cumsum(new_run) - 1
+        label = np.empty(num_nodes, dtype=np.intp)
+        label[order] = order[new_run][run]
+    else:
+        label = _cluster_nodes(nodes, tol)
+
+    # number the merged nodes in order of their first node
+    is_first = label == np.arange(num_nodes)
+    rank = np.cumsum(is_first) - 1
+    return rank[label], np.nonzero(is_first)[0]
+
+
+def _cluster_nodes(nodes, tol):
+    """
+    Labels each node with the lowest index of the nodes within tol of it
+    (and so on, transitively) -- by a spatial hash.
+    """
+    num_nodes = len(nodes)
+    cells = np.floor((nodes - nodes.min(axis=0)) / tol).astype(np.int64)
+    # one row of cells past the last, so the neighbors of the top row can't
+    # wrap around onto the next column.
+    num_rows = cells[:, 1].max() + 3
+    keys = cells[:, 0] * num_rows + cells[:, 1] + 1
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+
+    # work in sorted order, so the searches are in order too
+    first_nodes = []
+    second_nodes = []
+    for dx, dy in _NEIGHBOR_CELLS:
+        neighbor_keys = keys + (dx * num_rows + dy)
+        start = np.searchsorted(keys, neighbor_keys, side='left')
+        end = np.searchsorted(keys, neighbor_keys, side='right')
+        counts = end - start
+        first = np.repeat(np.arange(num_nodes), counts)
+        run_start = np.cumsum(counts) - counts
+        second = (np.repeat(start - run_start, counts) +
+                  np.arange(counts.sum()))
+        if (dx, dy) == (0, 0):
+            keep = first < second  # each pair once, and not with itself
+            first = first[keep]
+            second = second[keep]
+        first = order[first]
+        second = order[second]
+        diff = nodes[first] - nodes[second]
+        close = (diff ** 2).sum(axis=1) <= tol ** 2
+        first_nodes.append(first[close])
+        second_nodes.append(second[close])
+    first = np.concatenate(first_nodes)
+    second = np.concatenate(second_nodes)
+
+    return component_labels(num_nodes, first, second)
+
+
+def merge_grids(klass, grids, tol=0.0, mesh_name=None, index_dtype=None,
+                node_dtype=None):
+    """
+    Merges the grids into one.
+
+    :param klass: the class of grid to create.
+    :param grids: sequence of UGrids, all with the same number of vertices
+                  per face.
+    :param tol=0.0: the distance within which nodes are merged.
+    :param mesh_name=None: name of the new mesh -- default: the first one's.
+    :param index_dtype=None: dtype of the index arrays -- default: the
+                             first grid's.
+    :param node_dtype=None: dtype of the coordinates -- default: the first
+                            grid's.
+
+    :returns: the merged grid.
+
+    NOTE: passing the UGrid class in to avoid circular references,
+    while keeping the merging code in its own file.
+    """
+    grids = list(grids)
+    if not grids:
+        raise ValueError("at least one grid is needed to merge")
+    first_grid = grids[0]
+    if any(grid.faces is None for grid in grids):
+        raise ValueError("all the grids must have faces to be merged")
+    num_vertices = set(grid.num_vertices for grid in grids)
+    if len(num_vertices) > 1:
+        raise ValueError("the grids to merge must all have the same "
+                         "number of vertices per face, not: {}"
+                         .format(sorted(num_vertices)))
+
+    node_offsets = np.cumsum([0] + [len(grid.nodes) for grid in grids])
+    nodes = np.concatenate([grid.nodes for grid in grids])
+    node_map, first_node = merge_nodes(nodes, tol)
+    num_nodes = len(first_node)
+
+    faces = np.concatenate([np.asarray(grid.faces, dtype=np.intp) + offset
+                            for grid, offset in zip(grids, node_offsets)])
+    arrays = {'nodes': nodes[first_node],
+              'faces': node_map[faces]}
+    # where each element of the merged grid comes from, in the
+    # concatenation of all the grids: for slicing the data.
+    sources = {'node': first_node,
+               'face': np.arange(len(faces))}
+
+    if all(grid.face_coordinates is not None for grid in grids):
+        arrays['face_coordinates'] = np.concatenate(
+            [grid.face_coordinates for grid in grids])
+
+    for name, location in (('edges', 'edge'), ('boundaries', 'boundary')):
+        if any(getattr(grid, name) is None for grid in grids):
+            continue
+        segments = node_map[np.concatenate(
+            [np.asarray(getattr(grid, name), dtype=np.intp) + offset
+             for grid, offset in zip(grids, node_offsets)])]
+        keys = segment_keys(segments[:, 0], segments[:, 1], num_nodes)
+        # drop the duplicates along the seams, and any collapsed to a point
+        keep = np.zeros(len(segments), dtype=bool)
+        keep[np.unique(keys, return_index=True)[1]] = True
+        keep &= segments[:, 0] != segments[:, 1]
+        if name == 'boundaries':
+            # a boundary along a seam is not a boundary any more
+            face_keys, counts = np.unique(edge_keys(arrays['faces'],
+                                                    num_nodes),
+                                          return_counts=True)
+            keep &= np.isin(keys, face_keys[counts == 1])
+        sources[location] = np.nonzero(keep)[0]
+        arrays[name] = segments[keep]
+        coord_name = location + '_coordinates'
+        if all(getattr(grid, coord_name) is not None for grid in grids):
+            arrays[coord_name] = np.concatenate(
+                [getattr(grid, coord_name) for grid in grids])[keep]
+
+    grid = klass(mesh_name=(first_grid.mesh_name if mesh_name is None
+                            else mesh_name),
+                 index_dtype=(first_grid.index_dtype if index_dtype is None
+                              else index_dtype),
+                 node_dtype=(first_grid.node_dtype if node_dtype is None
+                             else node_dtype),
+                 **arrays)
+
+    # rebuild the connectivity any of the grids had, once, for it all
+    if any(g.face_face_connectivity is not None for g in grids):
+        grid.build_face_face_connectivity()
+    if grid.edges is not None:
+        if any(g.face_edge_connectivity is not None for g in grids):
+            grid.build_face_edge_connectivity()
+        if any(g.edge_face_connectivity is not None for g in grids):
+            grid.build_edge_face_connectivity()
+
+    _merge_data(grid, grids, sources)
+    return grid
+
+
+def _merge_data(grid, grids, sources):
+    """
+    Adds the data of the grids to the merged grid: the variables with the
+    same name and location are concatenated. Where a grid does not have a
+    variable, its part is masked.
+    """
+    names = []
+    for each in grids:
+        for uvar in each.data.values():
+            if (uvar.name, uvar.location) not in names:
+                names.append((uvar.name, uvar.location))
+
+    sizes = {'node': lambda g: len(g.nodes),
+             'face': lambda g: len(g.faces),
+             'edge': lambda g: 0 if g.edges is None else len(g.edges),
+             'boundary': lambda g: (0 if g.boundaries is None
+                                    else len(g.boundaries))}
+    for name, location in names:
+        if location not in sources:
+            continue  # not all the grids have the edges, etc.
+        parts = []
+        attributes = None
+        for each in grids:
+            uvar = each.data.get(name)
+            if uvar is not None and uvar.location == location:
+                parts.append(np.asarray(uvar.data))
+                if attributes is None:
+                    attributes = dict(uvar.attributes)
+            else:
+                parts.append(None)
+        template = next(part for part in parts if part is not None)
+        if any(part is None for part in parts):
+            parts = [np.ma.masked_all((sizes[location](each),) +
+                                      template.shape[1:], template.dtype)
+                     if part is None else part
+                     for each, part in zip(grids, parts)]
+            data = np.ma.concatenate(parts)
+        else:
+            data = np.concatenate(parts)
+        grid.add_data(UVar(name, location, data=data[sources[location]],
+                           attributes=attributes))
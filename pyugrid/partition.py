@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+"""
+code to split a UGrid into a number of spatially compact parts
+
+This code is called by UGrid.partition(), so that work on a big grid can
+be spread across processes: each part is a grid of its own, with maps back
+to the full grid, and optionally a halo of the neighboring faces.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+from collections import namedtuple
+
+import numpy as np
+
+from .util import csr_rows
+
+
+class Partition(namedtuple('Partition', ['grid', 'node_map', 'face_map',
+                                         'num_owned'])):
+    """
+    One part of a partitioned grid.
+
+    grid: the UGrid of the part -- its owned faces first, then the halo.
+    node_map: the index in the full grid of each node of the part
+    face_map: the index in the full grid of each face of the part
+    num_owned: the number of faces owned by the part -- the rest are halo
+    """
+    __slots__ = ()
+
+
+def label_faces(grid, num_parts, method='rcb'):
+    """
+    Assigns each face of the grid to one of num_parts parts.
+
+    :param grid: the grid to split
+    :type grid: UGrid object.
+
+    :param num_parts: the number of parts.
+
+    :param method='rcb': 'rcb' for recursive coordinate bisection of the
+                         face centers, 'graph' for recursive bisection of
+                         the face graph (face_face_connectivity) by
+                         breadth first search.
+
+    :returns: (num_faces,) array of the part each face is in.
+
+    The parts are as near equal in size as possible.
+    """
+    if num_parts < 1:
+        raise ValueError("num_parts must be at least 1")
+    labels = np.zeros(len(grid.faces), dtype=np.intp)
+    if method == 'rcb':
+        centers = grid.nodes[grid.faces].mean(axis=1)
+
+        def split(faces, num_first):
+            return _coordinate_split(centers, faces, num_first)
+    elif method == 'graph':
+        if grid.face_face_connectivity is None:
+            grid.build_face_face_connectivity()
+        face_face = np.asarray(grid.face_face_connectivity, dtype=np.intp)
+
+        def split(faces, num_first):
+            return _graph_split(face_face, faces, num_first)
+    else:
+        raise ValueError('"method" must be one of: "rcb", "graph"')
+
+    # each entry: (faces, the first part label, the number of parts)
+    todo = [(np.arange(len(grid.faces)), 0, num_parts)]
+    while todo:
+        faces, first_label, parts = todo.pop()
+        if parts == 1:
+            labels[faces] = first_label
+            continue
+        parts_first = parts // 2
+        num_first = len(faces) * parts_first // parts
+        first, second = split(faces, num_first)
+        todo.append((first, first_label, parts_first))
+        todo.append((second, first_label + parts_first, parts - parts_first))
+    return labels
+
+
+def _coordinate_split(centers, faces, num_first):
+    """
+    Splits the faces across the longer side of their bounding box, with
+    num_first faces on the low side.
+    """
+    points = centers[faces]
+    if len(points) == 0:
+        return faces, faces
+    axis = np.argmax(points.max(axis=0) - points.min(axis=0))
+    if 0 < num_first < len(faces):
+        order = np.argpartition(points[:, axis], num_first)
+    else:
+        order = np.arange(len(faces))
+    return faces[order[:num_first]], faces[order[num_first:]]
+
+
+def _graph_split(face_face, faces, num_first):
+    """
+    Splits the faces by breadth first search across face_face, starting
+    at a face far from the others: the first num_first faces reached go
+    in the first part.
+    """
+    if len(faces) == 0:
+        return faces, faces
+    inside = np.zeros(len(face_face) + 1, dtype=bool)  # [-1] stays False
+    inside[faces] = True
+    # start from a face on the edge: the last reached from an arbitrary one
+    start = _breadth_first(face_face, inside, faces[0])[-1]
+    order = _breadth_first(face_face, inside, start)
+    if len(order) < len(faces):
+        # not all connected -- the unreached faces go last
+        reached = np.zeros(len(face_face), dtype=bool)
+        reached[order] = True
+        order = np.concatenate((order, faces[~reached[faces]]))
+    return order[:num_first], order[num_first:]
+
+
+def _breadth_first(face_face, inside, start):
+    """
+    The faces reached from start, in breadth first order, without leaving
+    the faces flagged as inside. One vectorized step for each level.
+    """
+    visited = ~inside.copy()
+    visited[start] = True
+    levels = [np.array([start])]
+    frontier = levels[0]
+    while len(frontier):
+        neighbors = face_face[frontier].ravel()
+        neighbors = np.unique(neighbors[~visited[neighbors]])
+        visited[neighbors] = True
+        levels.append(neighbors)
+        frontier = neighbors
+    return np.concatenate(levels)
+
+
+def add_halo(grid, faces, layers):
+    """
+    Adds layers of neighboring faces: those sharing a node.
+
+    :param grid: the full grid
+    :param faces: the faces owned by a part
+    :param layers: the number of layers of neighbors to add
+
+    :returns: the halo faces, in the order they were reached
+    """
+    offsets, indices = grid.node_face_connectivity
+    included = np.zeros(len(grid.faces), dtype=bool)
+    included[faces] = True
+    halo = []
+    frontier = faces
+    for _ in range(layers):
+        nodes = np.unique(grid.faces[frontier])
+        neighbors = np.unique(csr_rows(offsets, indices, nodes)[0])
+        frontier = neighbors[~included[neighbors]]
+        if len(frontier) == 0:
+            break
+        included[frontier] = True
+        halo.append(frontier)
+    return np.concatenate(halo) if halo else np.zeros((0,), dtype=np.intp)
+
+
+def partition_grid(grid, num_parts, method='rcb', halo=0):
+    """
+    Splits the grid into num_parts grids.
+
+    :param grid: the grid to split
+    :type grid: UGrid object.
+
+    :param num_parts: the number of parts.
+
+    :param method='rcb': how to split it -- see label_faces.
+
+    :param halo=0: the number of layers of neighboring faces to add to each
+                   part.
+
+    :returns: list of Partition namedtuples.
+
+    NOTE: passing the UGrid object in to avoid circular references,
+    while keeping the partitioning code in its own file.
+    """
+    labels = label_faces(grid, num_parts, method)
+    order = np.argsort(labels, kind='stable')
+    bounds = np.searchsorted(labels[order], np.arange(num_parts + 1))
+    parts = []
+    for part in range(num_parts):
+        owned = order[bounds[part]:bounds[part + 1]]
+        face_map = np.concatenate((owned, add_halo(grid, owned, halo)))
+        sub_grid, maps = grid._extract(face_map)
+        parts.append(Partition(sub_grid, maps['node'], maps['face'],
+                               len(owned)))
+    return parts
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""
+code to compute quality metrics of the faces of a UGrid: areas, angles,
+aspect ratios, etc.
+
+This code is called by UGrid.quality()
+
+It is all vectorized -- one pass over the faces, a chunk at a time.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+from collections import OrderedDict
+
+import numpy as np
+
+METRICS = ('area', 'min_angle', 'max_angle', 'aspect_ratio', 'edge_ratio')
+
+
+class MeshQuality(OrderedDict):
+    """
+    The result of UGrid.quality()
+
+    A dict of the quality metrics, each an array with a value for every
+    face:
+
+    'area': area of the face
+    'min_angle': smallest interior angle (degrees)
+    'max_angle': largest interior angle (degrees)
+    'aspect_ratio': circumradius / (2 * inradius) for triangles, ratio of
+                    the principal axes of the vertices for other faces --
+                    1 for an equilateral triangle or a square, and up
+                    from there.
+    'edge_ratio': longest edge / shortest edge
+
+    Degenerate faces get an area and angles of 0, and ratios of inf.
+    """
+
+    def histogram(self, metric, bins=10, range=None):
+        """
+        Histogram of one of the metrics.
+
+        :param metric: name of the metric: 'area', 'min_angle', etc.
+        :param bins=10: number of bins, or the bin edges
+        :param range=None: (min, max) of the bins -- default is the range
+                           of the (finite) values.
+
+        :returns: counts, bin_edges -- as from numpy.histogram. Faces with
+                  values that are not finite (inf ratios of degenerate
+                  faces) are left out.
+        """
+        values = self[metric]
+        values = values[np.isfinite(values)]
+        return np.histogram(values, bins=bins, range=range)
+
+    def summary(self):
+        """
+        The min, mean and max of each metric, as a dict of
+        (min, mean, max) tuples -- of the finite values.
+        """
+        summary = OrderedDict()
+        for metric, values in self.items():
+            values = values[np.isfinite(values)]
+            if len(values):
+                summary[metric] = (values.min(), values.mean(dtype=np.float64),
+                                   values.max())
+            else:
+                summary[metric] = (np.nan, np.nan, np.nan)
+        return summary
+
+    def __str__(self):
+        msg = ["{:<14}{:>14}{:>14}{:>14}".format("metric", "min", "mean",
+                                                 "max")]
+        for metric, values in self.summary().items():
+            msg.append("{:<14}{:>14.6g}{:>14.6g}{:>14.6g}".format(metric,
+                                                                  *values))
+        return "\n".join(msg)
+
+
+def face_quality(grid, chunk_size):
+    """
+    Computes the quality metrics of all the faces of the grid.
+
+    :param grid: the grid
+    :type grid: UGrid object.
+
+    :param chunk_size: the number of faces to work on at once.
+
+    :returns: a MeshQuality, with arrays of the grid's node_dtype.
+
+    NOTE: passing the UGrid object in to avoid circular references,
+    while keeping the quality code in its own file.
+    """
+    x = np.asarray(grid.nodes[:, 0], dtype=np.float64)
+    y = np.asarray(grid.nodes[:, 1], dtype=np.float64)
+    faces = grid.faces
+    num_faces = len(faces)
+    quality = MeshQuality((metric, np.empty(num_faces, dtype=grid.node_dtype))
+                          for metric in METRICS)
+    for start in range(0, num_faces, chunk_size):
+        stop = min(start + chunk_size, num_faces)
+        # one contiguous array per vertex is a lot faster to work on
+        # than (num_faces, num_vertices, 2)
+        vertices = faces[start:stop].T
+        for metric, values in _polygon_metrics(x[vertices],
+                                               y[vertices]).items():
+            quality[metric][start:stop] = values
+    return quality
+
+
+def _polygon_metrics(x, y):
+    """
+    The metrics of each of a number of polygons.
+
+    :param x, y: (num_vertices, num_faces) arrays of the coordinates of
+                 their vertices
+
+    :returns: dict of (num_faces,) arrays
+    """
+    num_vertices = len(x)
+    # edge i runs from vertex i to vertex i + 1
+    dx = [x[(i + 1) % num_vertices] - x[i] for i in range(num_vertices)]
+    dy = [y[(i + 1) % num_vertices] - y[i] for i in range(num_vertices)]
+    lengths = [np.hypot(dx[i], dy[i]) for i in range(num_vertices)]
+
+    signed_area = sum(x[i] * y[(i + 1) % num_vertices] -
+                      x[(i + 1) % num_vertices] * y[i]
+                      for i in range(num_vertices)) / 2
+    area = np.abs(signed_area)
+    sign = np.where(signed_area < 0, -1.0, 1.0)
+
+    # interior angle at vertex i: from the edge out (i) round to the edge
+    # back (-edge i - 1), counter-clockwise for counter-clockwise faces.
+    min_angle = max_angle = None
+    for i in range(num_vertices):
+        cross = dx[i - 1] * dy[i] - dy[i - 1] * dx[i]
+        dot = -(dx[i] * dx[i - 1] + dy[i] * dy[i - 1])
+        angle = np.degrees(np.arctan2(cross * sign, dot)) % 360.0
+        if min_angle is None:
+            min_angle = angle
+            max_angle = angle.copy()
+        else:
+            np.minimum(min_angle, angle, out=min_angle)
+            np.maximum(max_angle, angle, out=max_angle)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        edge_ratio = np.maximum.reduce(lengths) / np.minimum.reduce(lengths)
+        if num_vertices == 3:
+            aspect_ratio = _triangle_aspect_ratio(*lengths)
+        else:
+            aspect_ratio = _principal_axes_ratio(x, y)
+
+    degenerate = area == 0
+    min_angle[degenerate] = 0.0
+    max_angle[degenerate] = 0.0
+    edge_ratio[degenerate] = np.inf
+    aspect_ratio[degenerate] = np.inf
+    return {'area': area,
+            'min_angle': min_angle,
+            'max_angle': max_angle,
+            'aspect_ratio': aspect_ratio,
+            'edge_ratio': edge_ratio}
+
+
+def _triangle_aspect_ratio(a, b, c):
+    """
+    circumradius / (2 * inradius) of triangles with sides of lengths
+    a, b, c: abc / (8 (s - a)(s - b)(s - c))
+    """
+    s = (a + b + c) / 2
+    denominator = 8 * (s - a) * (s - b) * (s - c)
+    # round off can make it a hair negative for (nearly) flat triangles
+    return np.where(denominator > 0, a * b * c / denominator, np.inf)
+
+
+def _principal_axes_ratio(x, y):
+    """
+    Ratio of the long to the short principal axis of the vertices of
+    polygons: the square root of the ratio of the eigenvalues of their
+    covariance.
+    """
+    x = x - x.mean(axis=0)
+    y = y - y.mean(axis=0)
+    xx = (x ** 2).mean(axis=0)
+    yy = (y ** 2).mean(axis=0)
+    xy = (x * y).mean(axis=0)
+    half_trace = (xx + yy) / 2
+    root = np.sqrt(((xx - yy) / 2) ** 2 + xy ** 2)
+    return np.sqrt((half_trace + root) / (half_trace - root))
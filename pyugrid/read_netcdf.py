@@ -74,6 +74,10 @@ grid_defs = [{'grid_attr': 'faces',  # Name in UGrid object.
               'role': 'edge_node_connectivity',  # Name in mesh variable.
               'num_ind': 2,  # Number of idx (3 for faces, 2 for segments).
               },
+             {'grid_attr': 'edge_face_connectivity',  # Name in UGrid object.
+              'role': 'edge_face_connectivity',  # Name in mesh variable.
+              'num_ind': 2,  # Number of idx (3 for faces, 2 for segments).
+              },
              ]
 # definitions for various coordinate arrays
 coord_defs = [{'grid_attr': 'nodes',  # Attribute name in UGrid object.
@@ -160,7 +164,8 @@ def load_grid_from_nc_dataset(nc, grid, mesh_name=None, load_data=True):
 
         coord_vars = [nc.variables[name] for name in coord_names]
         num_node = len(coord_vars[0])
-        nodes = np.empty((num_node, 2), dtype=np.float64)
+        # Read straight into the dtype the grid uses.
+        nodes = np.empty((num_node, 2), dtype=grid.node_dtype)
         for var in coord_vars:
             try:
                 standard_name = var.standard_name
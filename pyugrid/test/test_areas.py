@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+Tests of the face and node (dual) areas.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+
+from pyugrid import UGrid
+
+from .utilities import rect_grid, twenty_one_triangles
+
+
+def test_face_areas():
+    grid = twenty_one_triangles()
+    areas = grid.face_areas
+
+    points = grid.nodes[grid.faces]
+    a = points[:, 1] - points[:, 0]
+    b = points[:, 2] - points[:, 0]
+    assert np.allclose(areas,
+                       np.abs(a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]) / 2)
+    assert grid.face_areas is areas
+
+
+def test_node_areas_rect():
+    grid = rect_grid(4, 3)
+    node_areas = grid.node_areas.reshape(3, 4)
+
+    assert np.isclose(node_areas.sum(), grid.face_areas.sum())
+    # interior nodes get a whole unit square, corners that share one face or
+    # two, sides in between
+    assert np.allclose(node_areas[1, 1:3], 1)
+    assert np.allclose(node_areas[0, 0], 1 / 3)
+    assert np.allclose(node_areas[0, 3], 1 / 6)
+
+
+def test_node_areas_quads():
+    # a 2 X 1 rectangle of two 1 X 1 quads
+    grid = UGrid([(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1)],
+                 [(0, 1, 4, 3), (1, 2, 5, 4)])
+    assert np.allclose(grid.face_areas, 1)
+    assert np.allclose(grid.node_areas, [0.25, 0.5, 0.25, 0.25, 0.5, 0.25])
+
+
+def test_node_areas_uneven_quad():
+    grid = UGrid([(0, 0), (4, 0), (4, 1), (0, 1)], [(0, 1, 2, 3)])
+    assert np.allclose(grid.node_areas, 1)
+
+    grid = UGrid([(0, 0), (3, 0), (1, 1), (0, 1)], [(0, 1, 2, 3)])
+    assert np.isclose(grid.node_areas.sum(), 2)
+
+
+def test_spherical_areas():
+    # one octant of the sphere, as one triangle
+    grid = UGrid([(0, 0), (90, 0), (0, 90)], [(0, 1, 2)])
+    grid.build_face_areas(spherical=True, radius=1.0)
+    assert np.allclose(grid.face_areas, np.pi / 2)
+
+    # small faces are close to planar -- 1 degree square at the equator
+    grid = UGrid([(0, 0), (1, 0), (1, 1), (0, 1)], [(0, 1, 2, 3)])
+    grid.build_face_areas(spherical=True)
+    km_per_degree = 6371.0088 * np.pi / 180
+    assert np.isclose(grid.face_areas[0] / 1e6, km_per_degree ** 2,
+                      rtol=1e-4)
+
+
+def test_spherical_node_areas():
+    grid = rect_grid(5, 4)
+    grid.build_face_areas(spherical=True)
+    assert np.isclose(grid.node_areas.sum(), grid.face_areas.sum())
+
+
+def test_areas_rebuilt_same_way():
+    grid = UGrid([(0, 0), (90, 0), (0, 90)], [(0, 1, 2)])
+    grid.build_face_areas(spherical=True, radius=1.0)
+    node_areas = grid.node_areas
+
+    grid.nodes = [(0, 0), (90, 0), (45, 90)]
+    assert np.allclose(grid.face_areas, np.pi / 2)
+    assert grid.node_areas is not node_areas
+    assert np.allclose(grid.node_areas, np.pi / 6)
+
+    grid.nodes = [(0, 0), (45, 0), (0, 90)]
+    assert np.allclose(grid.face_areas, np.pi / 4)
+
+
+def test_areas_changed_faces():
+    grid = rect_grid(4, 3)
+    assert np.isclose(grid.node_areas.sum(), 6)
+
+    grid.faces = grid.faces[:3]
+    assert len(grid.face_areas) == 3
+    assert np.isclose(grid.node_areas.sum(), 1.5)
+
+
+def test_chunks():
+    grid = rect_grid(10, 8, shuffle=True)
+    grid.build_face_areas(chunk_size=7)
+    grid.build_node_areas(chunk_size=7)
+    assert np.allclose(grid.node_areas.sum(), 63)
+    assert np.allclose(grid.node_areas.reshape(8, 10)[1:-1, 1:-1], 1)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+"""
+Tests of the on-disk cache of search trees and connectivity.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from pyugrid import UGrid
+from pyugrid import cache
+
+from .utilities import rect_grid, twenty_one_triangles
+
+
+def test_round_trip(tmpdir):
+    directory = str(tmpdir)
+    grid = rect_grid(10, 8)
+    grid.build_edges(edge_face=True)
+    grid.build_face_face_connectivity()
+    grid.build_boundaries()
+    grid.node_face_connectivity
+    grid.locate_faces((1.5, 1.2), 'bins')
+    grid.locate_nodes([(1.1, 1.2)])
+    saved = grid.save_cache(directory)
+    assert sorted(saved) == sorted(['edges', 'face_face_connectivity',
+                                    'boundaries', 'face_edge_connectivity',
+                                    'edge_face_connectivity',
+                                    'node_face_connectivity', 'bins',
+                                    'kdtree'])
+
+    # the same grid, loaded another way
+    other = UGrid(grid.nodes.copy(), grid.faces.copy())
+    assert sorted(other.load_cache(directory)) == sorted(saved)
+    for name in cache.ARRAYS:
+        assert np.array_equal(getattr(other, name), getattr(grid, name))
+    for a, b in zip(other.node_face_connectivity,
+                    grid.node_face_connectivity):
+        assert np.array_equal(a, b)
+    points = np.random.RandomState(0).uniform(0, 9, (100, 2))
+    assert np.array_equal(other.locate_faces(points, 'bins'),
+                          grid.locate_faces(points, 'bins'))
+    assert np.array_equal(other.locate_nodes(points),
+                          grid.locate_nodes(points))
+    # rebuilt the same way when the nodes change
+    assert other._built['edges'] == {'edge_face': True}
+
+
+def test_loaded_arrays_writable(tmpdir):
+    directory = str(tmpdir)
+    grid = rect_grid(4, 3)
+    grid.build_face_face_connectivity()
+    grid.save_cache(directory)
+
+    other = UGrid(grid.nodes.copy(), grid.faces.copy())
+    other.load_cache(directory)
+    other.face_face_connectivity[0, 0] = 5
+    other.orient_faces(ccw=False)
+    # not written back
+    again = UGrid(grid.nodes, grid.faces)
+    again.load_cache(directory)
+    assert np.array_equal(again.face_face_connectivity,
+                          grid.face_face_connectivity)
+
+
+def test_keyed_by_contents(tmpdir):
+    directory = str(tmpdir)
+    grid = rect_grid(4, 3)
+    grid.build_edges()
+    grid.save_cache(directory)
+
+    assert UGrid(grid.nodes * 2, grid.faces).load_cache(directory) == []
+    assert UGrid(grid.nodes, grid.faces[:-1]).load_cache(directory) == []
+    assert cache.grid_key(grid) == cache.grid_key(UGrid(grid.nodes,
+                                                        grid.faces))
+
+
+@pytest.mark.parametrize("index_dtype", [np.int32, np.int64, 'auto'])
+def test_loaded_memory_mapped(tmpdir, index_dtype):
+    directory = str(tmpdir)
+    grid = rect_grid(10, 8)
+    grid = UGrid(grid.nodes, grid.faces, index_dtype=index_dtype)
+    grid.build_edges(edge_face=True)
+    grid.node_face_connectivity
+    grid.save_cache(directory)
+
+    other = UGrid(grid.nodes, grid.faces, index_dtype=index_dtype)
+    other.load_cache(directory)
+    # used straight from the file, not converted into memory
+    for name in ('edges', 'face_edge_connectivity', 'edge_face_connectivity'):
+        array = getattr(other, name)
+        assert isinstance(array, np.memmap)
+        assert array.dtype == getattr(grid, name).dtype
+    for array in other.node_face_connectivity:
+        assert isinstance(array, np.memmap)
+
+    # a grid with another index dtype has its own entry
+    index_dtype = np.int16 if index_dtype == 'auto' else 'auto'
+    assert UGrid(grid.nodes, grid.faces,
+                 index_dtype=index_dtype).load_cache(directory) == []
+
+
+def test_passed_in_not_saved(tmpdir):
+    directory = str(tmpdir)
+    grid = twenty_one_triangles()
+    grid.edges = [(0, 1)]
+    assert grid.save_cache(directory) == []
+
+    # and what the grid already has is kept
+    grid.build_face_face_connectivity()
+    grid.save_cache(directory)
+    other = twenty_one_triangles()
+    other.edges = [(0, 1)]
+    other.load_cache(directory)
+    assert other.edges.tolist() == [[0, 1]]
+
+
+def test_stale_not_saved(tmpdir):
+    grid = rect_grid(4, 3)
+    grid.build_face_face_connectivity()
+    grid.nodes = grid.nodes * 2
+    grid.build_edges()
+    grid.faces = grid.faces[:-1]
+    assert grid.save_cache(str(tmpdir)) == []
+
+
+def test_evict(tmpdir):
+    directory = str(tmpdir)
+    grids = [rect_grid(4 + i, 3) for i in range(3)]
+    for i, grid in enumerate(grids):
+        grid.build_edges()
+        grid.save_cache(directory)
+        path = os.path.join(directory, cache.grid_key(grid))
+        # used 100, 50 and 0 seconds ago
+        used = time.time() - 100 + 50 * i
+        os.utime(path, (used, used))
+
+    assert cache.evict(directory, max_age=75) == [cache.grid_key(grids[0])]
+    size = sum(os.path.getsize(os.path.join(root, f))
+               for root, _, files in os.walk(directory) for f in files)
+    assert cache.evict(directory, max_size=size - 1) == \
+        [cache.grid_key(grids[1])]
+    assert 'edges' in grids[2].save_cache(directory, max_size=0)
+    assert os.listdir(directory) == []
+
+
+def test_no_grid(tmpdir):
+    with pytest.raises(ValueError):
+        UGrid().save_cache(str(tmpdir))
+    assert UGrid().load_cache(str(tmpdir)) == []
+    assert cache.evict(os.path.join(str(tmpdir), 'nothing'), max_size=0) == []
+
+
+def test_orient_faces_new_entry(tmpdir):
+    directory = str(tmpdir)
+    grid = rect_grid(5, 4)
+    faces = grid.faces.copy()
+    faces[::2] = faces[::2, ::-1]  # some of them clockwise
+    grid = UGrid(grid.nodes, faces.copy())
+    fingerprint = grid.fingerprint()
+    grid.build_face_face_connectivity()
+    grid.locate_faces((1.5, 1.2), 'bins')
+
+    assert len(grid.orient_faces())
+    assert grid.fingerprint() != fingerprint
+    assert grid._bins is None
+    grid.save_cache(directory)
+
+    # the grid as it was has no entry -- so builds its own
+    other = UGrid(grid.nodes, faces.copy())
+    assert other.load_cache(directory) == []
+    other.build_face_face_connectivity()
+    assert np.array_equal(other.face_face_connectivity,
+                          other._build_face_face_connectivity_loop())
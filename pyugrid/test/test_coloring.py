@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""
+Tests of coloring the faces, and adding up face values at the nodes with
+it.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+import pytest
+
+from pyugrid import UGrid
+from pyugrid.util import colored_scatter_add
+
+from .utilities import rect_grid
+
+
+def check_coloring(grid, colors):
+    assert colors.min() == 0
+    for color in range(colors.max() + 1):
+        nodes = grid.faces[colors == color].ravel()
+        assert len(nodes) == len(np.unique(nodes))
+
+
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_face_coloring(shuffle):
+    grid = rect_grid(30, 20, shuffle=shuffle)
+    colors = grid.face_coloring()
+    check_coloring(grid, colors)
+    # each face of a rect_grid shares nodes with at most 12 others
+    assert colors.max() + 1 <= 13
+
+
+def test_many_colors():
+    # a fan of 100 triangles around one node: 100 colors
+    angles = np.linspace(0, 2 * np.pi, 100, endpoint=False)
+    nodes = np.concatenate(([(0, 0)],
+                            np.column_stack((np.cos(angles),
+                                             np.sin(angles)))))
+    faces = [(0, i + 1, (i + 1) % 100 + 1) for i in range(100)]
+    grid = UGrid(nodes, faces)
+    colors = grid.face_coloring()
+    assert sorted(colors) == list(range(100))
+
+
+def test_coloring_cached():
+    grid = rect_grid(10, 8)
+    colors = grid.face_coloring()
+    assert grid.face_coloring() is colors
+
+    grid.nodes = grid.nodes * 2
+    assert grid.face_coloring() is colors
+
+    grid.faces = grid.faces[::2]
+    assert grid.face_coloring() is not colors
+    check_coloring(grid, grid.face_coloring())
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_sum_to_nodes(workers):
+    grid = rect_grid(30, 20, shuffle=True)
+    values = np.arange(len(grid.faces), dtype=np.float64)
+    expected = np.zeros(len(grid.nodes))
+    np.add.at(expected, grid.faces, values[:, None])
+    assert np.allclose(grid.sum_to_nodes(values, workers=workers), expected)
+
+    # one value for each node of each face
+    values = np.random.RandomState(1).rand(*grid.faces.shape)
+    expected = np.zeros(len(grid.nodes))
+    np.add.at(expected, grid.faces, values)
+    assert np.allclose(grid.sum_to_nodes(values, workers=workers), expected)
+
+
+def test_colored_scatter_add():
+    out = np.ones(4)
+    colored_scatter_add(out, [(0, 1), (1, 2), (2, 3)], [1.0, 2.0, 3.0],
+                        [0, 1, 0], workers=2)
+    assert out.tolist() == [2.0, 4.0, 6.0, 4.0]
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+"""
+Tests of finding the connected pieces of a grid.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+
+from pyugrid import UGrid, UVar
+from pyugrid.util import component_labels
+
+from .utilities import rect_grid, twenty_one_triangles
+
+
+def islands():
+    """
+    A 6 X 5 node rectangular grid, a single triangle off to the side, and
+    a pair of triangles touching the big piece at just a corner.
+    """
+    grid = rect_grid(6, 5, shuffle=True)
+    num_nodes = len(grid.nodes)
+    nodes = np.concatenate((grid.nodes,
+                            [(10, 10), (11, 10), (11, 11),
+                             (6, 4), (5, 5), (6, 5)]))
+    faces = np.concatenate((grid.faces,
+                            [(num_nodes, num_nodes + 1, num_nodes + 2),
+                             (num_nodes - 1, num_nodes + 3, num_nodes + 5),
+                             (num_nodes - 1, num_nodes + 5, num_nodes + 4)]))
+    return UGrid(nodes, faces)
+
+
+def test_component_labels():
+    label = component_labels(7, [5, 2, 3, 6], [4, 3, 1, 5])
+    assert label.tolist() == [0, 1, 1, 1, 4, 4, 4]
+
+
+def test_component_labels_chain():
+    rs = np.random.RandomState(3)
+    order = rs.permutation(10000)
+    label = component_labels(10000, order[:-1], order[1:])
+    assert np.all(label == 0)
+
+
+def test_one_piece():
+    grid = twenty_one_triangles()
+    assert np.all(grid.connected_components() == 0)
+
+
+def test_connected_components():
+    grid = islands()
+    labels = grid.connected_components()
+    num_big = len(grid.faces) - 3
+    assert np.all(labels[:num_big] == 0)
+    assert labels[num_big:].tolist() == [1, 2, 2]
+
+
+def test_drop_small_components():
+    grid = islands()
+    grid.add_data(UVar('depth', 'face', data=np.arange(len(grid.faces))))
+    big, maps = grid.drop_small_components(3)
+
+    assert len(big.faces) == len(grid.faces) - 3
+    assert len(big.nodes) == 30
+    assert np.array_equal(big.data['depth'].data, maps['face'])
+    assert np.all(big.connected_components() == 0)
+
+    assert len(grid.drop_small_components(2)[0].faces) == len(grid.faces) - 1
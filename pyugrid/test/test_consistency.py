@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""
+Tests of checking the consistency of a grid.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+
+from pyugrid import UGrid, UVar
+
+from .utilities import two_triangles, twenty_one_triangles, rect_grid
+
+
+def test_consistent():
+    grid = twenty_one_triangles()
+    grid.build_face_face_connectivity()
+    grid.build_face_coordinates()
+    report = grid.check_consistent()
+
+    assert report.ok
+    assert str(report) == "UGrid is consistent"
+    assert 'duplicate_faces' in report
+
+
+def test_out_of_range():
+    grid = two_triangles()
+    grid.faces = [(0, 1, 2), (1, 4, 2)]
+    grid.boundaries = [(0, 1), (-1, 2)]
+    report = grid.check_consistent()
+
+    assert not report.ok
+    assert report['face_nodes_out_of_range'].tolist() == [1]
+    assert report['boundary_nodes_out_of_range'].tolist() == [1]
+    assert report['edge_nodes_out_of_range'].tolist() == []
+
+
+def test_degenerate_and_duplicate():
+    nodes = [(0, 0), (1, 0), (0, 1), (2, 0), (1, 1)]
+    faces = [(0, 1, 2),
+             (1, 4, 2),
+             (1, 1, 2),  # repeated node
+             (0, 1, 3),  # no area
+             (2, 0, 1),  # same as the first
+             ]
+    report = UGrid(nodes, faces).check_consistent()
+
+    assert report['degenerate_faces'].tolist() == [2, 3]
+    assert report['duplicate_faces'].tolist() == [4]
+
+
+def test_orientation_and_non_manifold():
+    nodes = [(0, 0), (1, 0), (0, 1), (1, 1), (0.5, -1)]
+    faces = [(0, 1, 2),
+             (1, 3, 2),
+             (2, 1, 4),  # clockwise, and a third face on edge (1, 2)
+             ]
+    report = UGrid(nodes, faces).check_consistent()
+
+    assert report['inconsistent_orientation'].tolist() == [2]
+    assert report['non_manifold_edges'].tolist() == [[1, 2]]
+
+
+def test_bad_shapes_and_connectivity():
+    grid = two_triangles()
+    grid.build_face_face_connectivity()
+    grid.face_face_connectivity[1, 0] = 5
+    grid.add_data(UVar('depth', 'node', data=[1, 2, 3, 4]))
+    grid.data['depth'].data = [1, 2, 3]
+    report = grid.check_consistent()
+
+    assert report['bad_shapes'] == []
+    assert report['connectivity_out_of_range'] == ['face_face_connectivity']
+    assert report['bad_data_lengths'] == ['depth']
+
+    # the rest isn't checked once something is the wrong shape
+    grid.face_coordinates = [(0, 0)]
+    report = grid.check_consistent()
+    assert list(report.items()) == [('bad_shapes', ['face_coordinates'])]
+    assert not report.ok
+
+
+def test_bad_faces():
+    grid = two_triangles()
+    for faces in ([0, 1, 2], [(0, 1), (1, 2)], [(0., 1., 2.)]):
+        grid._faces = np.array(faces)
+        report = grid.check_consistent()
+        assert list(report.items()) == [('bad_shapes', ['faces'])]
+
+
+def test_quick():
+    grid = rect_grid(200, 100)
+    faces = grid.faces.copy()
+    faces[::10, 0] = len(grid.nodes)
+    grid.faces = faces
+    report = grid.check_consistent(quick=True, sample_size=1000)
+
+    found = report['face_nodes_out_of_range']
+    assert 50 < len(found) < 150
+    assert np.all(found % 10 == 0)
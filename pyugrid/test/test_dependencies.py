@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""
+Tests of keeping the derived arrays, search trees, etc. up to date
+as the grid is changed.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+import pytest
+
+from .utilities import two_triangles, twenty_one_triangles
+
+
+def test_kdtree_reset_with_nodes():
+    grid = twenty_one_triangles()
+    assert grid.locate_nodes((4.58, 5.08)) == 6
+
+    nodes = grid.nodes.copy()
+    nodes[6] = (100, 100)
+    grid.nodes = nodes
+    assert grid._kdtree is None
+    assert grid.locate_nodes((4.58, 5.08)) != 6
+
+
+def test_same_nodes_keeps_kdtree():
+    grid = twenty_one_triangles()
+    grid.locate_nodes((4.58, 5.08))
+    tree = grid._kdtree
+
+    grid.nodes = grid.nodes.copy()
+    assert grid._kdtree is tree
+
+
+def test_mark_changed():
+    grid = twenty_one_triangles()
+    grid.locate_nodes((4.58, 5.08))
+
+    grid.nodes[6] = (100, 100)
+    grid.mark_changed('nodes')
+    assert grid.locate_nodes((4.58, 5.08)) != 6
+
+
+def test_mark_changed_bad_name():
+    grid = two_triangles()
+    with pytest.raises(ValueError):
+        grid.mark_changed('nodez')
+
+
+def test_built_connectivity_rebuilt():
+    grid = two_triangles()
+    grid.build_face_face_connectivity()
+    grid.build_boundaries()
+    assert grid.face_face_connectivity.tolist() == [[-1, 1, -1], [-1, -1, 0]]
+
+    # swap the diagonal
+    grid.faces = [(0, 1, 3), (0, 3, 2)]
+    assert grid.face_face_connectivity.tolist() == [[-1, -1, 1], [0, -1, -1]]
+    assert sorted(grid.boundaries.tolist()) == [[0, 1], [1, 3], [2, 0],
+                                                [3, 2]]
+
+
+def test_same_faces_keeps_connectivity():
+    grid = two_triangles()
+    grid.build_face_face_connectivity()
+    face_face = grid.face_face_connectivity
+
+    grid.faces = [(0, 1, 2), (1, 3, 2)]
+    assert grid.face_face_connectivity is face_face
+
+
+def test_passed_in_connectivity_dropped():
+    grid = two_triangles()
+    grid.face_face_connectivity = [[-1, 1, -1], [-1, -1, 0]]
+
+    grid.faces = [(0, 1, 3), (0, 3, 2)]
+    assert grid.face_face_connectivity is None
+
+
+def test_passed_in_edges_kept():
+    grid = two_triangles()
+    edges = grid.edges
+    grid.build_face_edge_connectivity()
+
+    # same edges, faces in the other order
+    grid.faces = [(1, 3, 2), (0, 1, 2)]
+    assert grid.edges is edges
+    assert grid.face_edge_connectivity.tolist() == [[1, 2, 4], [0, 4, 3]]
+
+
+def test_built_edges_rebuilt():
+    grid = two_triangles()
+    grid.build_edges(edge_face=True)
+    grid.build_edge_coordinates()
+
+    grid.faces = [(0, 1, 3), (0, 3, 2)]
+    assert grid.edges.tolist() == [[0, 1], [0, 2], [0, 3], [1, 3], [2, 3]]
+    assert grid.edge_face_connectivity.tolist() == [[0, -1], [1, -1],
+                                                    [0, 1], [0, -1],
+                                                    [1, -1]]
+    assert np.allclose(grid.edge_coordinates[2], (1.6, 1.1))
+
+
+def test_face_coordinates_rebuilt_same_method():
+    grid = twenty_one_triangles()
+    grid.build_face_coordinates(method='circumcenter')
+
+    grid.nodes = grid.nodes * 2
+    coords = grid.face_coordinates
+    dist = np.hypot(*(grid.nodes[grid.faces] - coords[:, None, :]).T)
+    assert np.allclose(dist, dist[:1])
+
+
+def test_delete_faces():
+    grid = two_triangles()
+    grid.build_face_face_connectivity()
+    grid.build_boundaries()
+
+    del grid.faces
+    assert grid.face_face_connectivity is None
+    assert grid.boundaries is None
@@ -3,15 +3,16 @@
 """
 Testing of code to find nodes.
 
-Currently only nearest neighbor.
-
 """
 
 from __future__ import (absolute_import, division, print_function)
 
 import numpy as np
 
-from .utilities import twenty_one_triangles
+from pyugrid import UGrid
+from pyugrid.ugrid import _kdtree_query
+
+from .utilities import rect_grid, twenty_one_triangles
 
 
 def test_locate_node():
@@ -58,5 +59,95 @@ def test_locate_middle():
     assert ugrid.locate_nodes((3, 4.99999999999)) == 2
 
 
+def brute_force_distances(grid, points):
+    points = np.asarray(points, dtype=np.float64)
+    return np.hypot(*(points[:, None, :] - grid.nodes[None, :, :]).T).T
+
+
+def test_k_nearest():
+    ugrid = twenty_one_triangles()
+    points = np.random.RandomState(0).uniform(0, 12, (50, 2))
+    indices, distances = ugrid.locate_nodes(points, k=3,
+                                            return_distances=True)
+    assert indices.shape == (50, 3)
+
+    dist = brute_force_distances(ugrid, points)
+    assert np.allclose(distances, np.sort(dist, axis=1)[:, :3])
+    assert np.allclose(np.take_along_axis(dist, indices, axis=1), distances)
+
+
+def test_max_distance():
+    ugrid = twenty_one_triangles()
+    points = [(4.58, 5.08), (100, 100)]
+    indices, distances = ugrid.locate_nodes(points, return_distances=True,
+                                            max_distance=1.0)
+    assert indices.tolist() == [6, -1]
+    assert np.isinf(distances[1])
+    assert ugrid.locate_nodes((4.58, 5.08), max_distance=1.0) == 6
+
+    indices = ugrid.locate_nodes(points, k=2, max_distance=1.0)
+    assert indices[1].tolist() == [-1, -1]
+
+
+def test_workers():
+    ugrid = rect_grid(30, 20)
+    points = np.random.RandomState(1).uniform(0, 29, (1000, 2))
+    assert np.array_equal(ugrid.locate_nodes(points, k=4, workers=1),
+                          ugrid.locate_nodes(points, k=4, workers=2))
+
+
+def test_nodes_within():
+    ugrid = twenty_one_triangles()
+    points = np.random.RandomState(2).uniform(0, 12, (50, 2))
+    radius = np.linspace(0, 4, 50)
+    offsets, indices, distances = ugrid.nodes_within(points, radius,
+                                                     return_distances=True)
+    dist = brute_force_distances(ugrid, points)
+    assert len(offsets) == 51
+    for i in range(50):
+        nodes = indices[offsets[i]:offsets[i + 1]]
+        assert nodes.tolist() == np.nonzero(dist[i] <= radius[i])[0].tolist()
+        assert np.allclose(dist[i, nodes],
+                           distances[offsets[i]:offsets[i + 1]])
+
+
+def test_nodes_within_one_point():
+    ugrid = rect_grid(4, 3)
+    offsets, indices = ugrid.nodes_within((1.1, 1), 1.01, workers=1)
+    assert offsets.tolist() == [0, 4]
+    assert indices.tolist() == [1, 5, 6, 9]
+
+
+def test_k_more_than_nodes():
+    ugrid = UGrid([(0, 0), (1, 0), (0, 1)], [(0, 1, 2)])
+    indices, distances = ugrid.locate_nodes([(0.1, 0)], k=5,
+                                            return_distances=True)
+    assert indices.tolist() == [[0, 1, 2, -1, -1]]
+    assert np.isinf(distances[0, 3:]).all()
+
+
+def test_kdtree_query_workers():
+    calls = []
+
+    def old_query(points, k=1, n_jobs=1):
+        calls.append(n_jobs)
+        return k
+
+    # workers only passed when asked for -- as n_jobs to older scipy
+    assert _kdtree_query(old_query, None, k=2) == 2
+    assert _kdtree_query(old_query, None, k=2, workers=3) == 2
+    assert calls == [1, 3]
+
+
 if __name__ == '__main__':
+    test_locate_node()
     test_locate_nodes()
+    test_locate_exact()
+    test_locate_middle()
+    test_k_nearest()
+    test_max_distance()
+    test_workers()
+    test_nodes_within()
+    test_nodes_within_one_point()
+    test_k_more_than_nodes()
+    test_kdtree_query_workers()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""
+Tests of the content fingerprint of grids.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+
+from pyugrid import UGrid
+from pyugrid.util import hash_arrays
+
+from .utilities import rect_grid, twenty_one_triangles
+
+
+def test_hash_arrays_blocks_and_workers():
+    a = np.arange(10000).reshape(-1, 2)
+    b = np.linspace(0, 1, 333)
+    expected = hash_arrays([a, None, b], workers=1)
+    # the same blocks, however many threads hash them
+    assert hash_arrays([a, None, b], workers=4) == expected
+    assert (hash_arrays([a, b], block_size=100, workers=1) ==
+            hash_arrays([a, b], block_size=100, workers=3))
+
+
+def test_hash_arrays_contents():
+    a = np.arange(10).reshape(-1, 2)
+    assert hash_arrays([a]) != hash_arrays([a.reshape(-1)])
+    assert hash_arrays([a]) != hash_arrays([a.astype(np.int32)])
+    assert (hash_arrays([a], [np.int64]) ==
+            hash_arrays([a.astype(np.uint16)], [np.int64]))
+    assert hash_arrays([a, None]) != hash_arrays([None, a])
+    b = a.copy()
+    b[-1, -1] += 1
+    assert hash_arrays([a], block_size=8) != hash_arrays([b], block_size=8)
+
+
+def test_same_grid():
+    grid = rect_grid(4, 3)
+    other = UGrid(grid.nodes, grid.faces, index_dtype='auto',
+                  node_dtype=np.float32)
+    assert other.faces.dtype != grid.faces.dtype
+    assert grid.fingerprint() == other.fingerprint()
+    assert grid.equals(other)
+    assert not grid.equals(twenty_one_triangles())
+
+
+def test_memoized():
+    grid = rect_grid(4, 3)
+    fingerprint = grid.fingerprint()
+    assert grid._fingerprint == fingerprint
+
+    grid.nodes[0, 0] = -1
+    assert grid.fingerprint() == fingerprint
+    grid.mark_changed('nodes')
+    assert grid.fingerprint() != fingerprint
+
+    grid.nodes[0, 0] = 0
+    grid.mark_changed('nodes')
+    assert grid.fingerprint() == fingerprint
+    grid.faces = grid.faces[::-1]
+    assert grid.fingerprint() != fingerprint
+
+
+def test_built_arrays_left_out():
+    grid = rect_grid(4, 3)
+    fingerprint = grid.fingerprint()
+    grid.build_edges()
+    grid.build_boundaries()
+    grid.build_face_face_connectivity()
+    assert grid.fingerprint() == fingerprint
+
+    # but edges passed in are part of the grid
+    grid.edges = grid.edges[:3]
+    assert grid.fingerprint() != fingerprint
+    grid.build_edges()
+    assert grid.fingerprint() == fingerprint
@@ -8,8 +8,12 @@ Testing of various utilities to manipulate the grid.
 from __future__ import (absolute_import, division, print_function)
 
 import numpy as np
+import pytest
 
-from .utilities import two_triangles, twenty_one_triangles
+from pyugrid import UGrid
+from pyugrid.ugrid import IND_DT
+
+from .utilities import two_triangles, twenty_one_triangles, rect_grid
 
 
 def test_build_face_face_connectivity_small():
@@ -33,6 +37,29 @@ def test_build_face_face_connectivity_big():
     assert face_face[20].tolist() == [19, -1, -1]
 
 
+def test_build_face_face_connectivity_matches_loop():
+    for ugrid in (twenty_one_triangles(), rect_grid(),
+                  rect_grid(shuffle=True)):
+        ugrid.build_face_face_connectivity()
+
+        assert np.array_equal(ugrid.face_face_connectivity,
+                              ugrid._build_face_face_connectivity_loop())
+
+
+def test_build_face_face_connectivity_non_manifold():
+    """
+    Random faces share edges between more than two faces -- the
+    vectorized version should still pair them up just like the loop does.
+
+    """
+    faces = np.random.RandomState(0).randint(0, 12, size=(200, 3))
+    ugrid = UGrid(nodes=np.zeros((12, 2)), faces=faces)
+    ugrid.build_face_face_connectivity()
+
+    assert np.array_equal(ugrid.face_face_connectivity,
+                          ugrid._build_face_face_connectivity_loop())
+
+
 def test_build_edges():
     ugrid = two_triangles()
     ugrid.build_edges()
@@ -52,6 +79,56 @@ def test_build_face_coordinates():
                                 (2.1, 1.43333333)])
 
 
+def test_build_face_coordinates_chunked():
+    grid = rect_grid(shuffle=True)
+    grid.build_face_coordinates()
+    coords = grid.face_coordinates
+    grid.build_face_coordinates(chunk_size=7)
+
+    assert np.array_equal(grid.face_coordinates, coords)
+
+
+def test_build_face_coordinates_circumcenter():
+    grid = twenty_one_triangles()
+    grid.build_face_coordinates(method='circumcenter')
+    coords = grid.face_coordinates
+
+    # equidistant from all three nodes
+    dist = np.hypot(*(grid.nodes[grid.faces] - coords[:, None, :]).T)
+    assert np.allclose(dist, dist[:1])
+
+
+def test_build_face_coordinates_incenter():
+    grid = twenty_one_triangles()
+    grid.build_face_coordinates(method='incenter')
+    coords = grid.face_coordinates
+
+    # equidistant from all three sides
+    p1 = grid.nodes[grid.faces]
+    p2 = np.roll(p1, -1, axis=1)
+    side = p2 - p1
+    to_center = coords[:, None, :] - p1
+    dist = (np.abs(side[..., 0] * to_center[..., 1] -
+                   side[..., 1] * to_center[..., 0]) /
+            np.hypot(side[..., 0], side[..., 1]))
+    assert np.allclose(dist, dist[:, :1])
+
+
+def test_build_face_coordinates_centroid():
+    nodes = [(0, 0), (4, 0), (4, 1), (1, 1), (1, 4), (0, 4)]
+    grid = UGrid(nodes, faces=[(0, 1, 2, 3, 4, 5)])
+    grid.build_face_coordinates(method='centroid')
+    # an L shape: a 4 x 1 rectangle plus a 1 x 3 one on top
+    expected = (4 * np.array((2, 0.5)) + 3 * np.array((0.5, 2.5))) / 7
+    assert np.allclose(grid.face_coordinates[0], expected)
+
+
+def test_build_face_coordinates_bad_method():
+    grid = two_triangles()
+    with pytest.raises(ValueError):
+        grid.build_face_coordinates(method='middle')
+
+
 def test_build_edge_coordinates():
     grid = two_triangles()
     grid.build_edge_coordinates()
@@ -99,3 +176,129 @@ def test_build_boundaries_big():
                            [13, 12], [14, 16], [15, 13], [16, 18], [17, 15],
                            [18, 19], [19, 17]]
     assert boundaries == expected_boundaries
+
+
+def test_build_edges_face_edge_connectivity():
+    ugrid = twenty_one_triangles()
+    ugrid.build_edges(edge_face=True)
+    edges = ugrid.edges
+    face_edge = ugrid.face_edge_connectivity
+    edge_face = ugrid.edge_face_connectivity
+
+    # sorted, unique (low, high) pairs
+    assert np.all(edges[:, 0] < edges[:, 1])
+    assert len(np.unique(edges, axis=0)) == len(edges)
+    assert np.array_equal(edges, np.array(sorted(edges.tolist())))
+
+    # each edge of each face points at the right edge
+    for i, face in enumerate(ugrid.faces):
+        for j in range(3):
+            nodes = sorted((face[j], face[(j + 1) % 3]))
+            assert edges[face_edge[i, j]].tolist() == nodes
+            assert i in edge_face[face_edge[i, j]]
+
+    # boundary edges have a single face
+    assert (edge_face[:, 1] == -1).sum() == 19
+
+
+def test_build_face_edge_connectivity_existing_edges():
+    ugrid = two_triangles()
+    ugrid.build_face_edge_connectivity()
+
+    # the edges passed in are kept, in their order
+    assert ugrid.edges.tolist() == [[0, 1], [1, 3], [3, 2], [2, 0], [1, 2]]
+    assert ugrid.face_edge_connectivity.tolist() == [[0, 4, 3], [1, 2, 4]]
+
+    ugrid.build_edge_face_connectivity()
+    assert ugrid.edge_face_connectivity.tolist() == [[0, -1], [1, -1],
+                                                     [1, -1], [0, -1],
+                                                     [0, 1]]
+
+
+def test_build_face_edge_connectivity_missing_edges():
+    ugrid = two_triangles()
+    ugrid.edges = [(0, 1), (1, 3)]
+    with pytest.raises(ValueError):
+        ugrid.build_face_edge_connectivity()
+
+
+def test_boundary_rings():
+    ugrid = twenty_one_triangles()
+    rings, orientation = ugrid.boundary_rings()
+
+    # the outer boundary, then the hole
+    assert len(rings) == 2
+    assert sorted(rings[0].tolist()) == [0, 1, 2, 5, 7, 11, 12, 13, 14, 15,
+                                         16, 17, 18, 19]
+    assert sorted(rings[1].tolist()) == [3, 4, 6, 9, 10]
+    # faces are counter-clockwise -- so the hole goes the other way.
+    assert orientation.tolist() == [1, -1]
+
+    # each ring should follow the boundary segments
+    segments = set(map(tuple, ugrid._boundary_segments().tolist()))
+    for ring in rings:
+        for start, end in zip(ring, np.roll(ring, -1)):
+            assert (start, end) in segments
+
+
+def test_build_boundaries_ordered():
+    ugrid = twenty_one_triangles()
+    ugrid.build_boundaries(ordered=True)
+    boundaries = ugrid.boundaries
+
+    assert len(boundaries) == 19
+    # each segment ends where the next starts, except between rings
+    assert (boundaries[1:, 0] != boundaries[:-1, 1]).sum() == 1
+
+
+def test_boundary_rings_many_islands():
+    ugrid = rect_grid(30, 20, shuffle=True)
+    # punch out a few holes
+    centers = ugrid.nodes[ugrid.faces].mean(axis=1)
+    keep = np.ones(len(ugrid.faces), dtype=bool)
+    for x, y in [(5, 5), (15, 10), (24, 14)]:
+        keep &= ~((abs(centers[:, 0] - x) < 2) & (abs(centers[:, 1] - y) < 2))
+    ugrid = UGrid(ugrid.nodes, ugrid.faces[keep])
+    rings, orientation = ugrid.boundary_rings()
+
+    assert len(rings) == 4
+    assert orientation.tolist() == [1, -1, -1, -1]
+    assert len(rings[0]) == 2 * (29 + 19)
+    assert [len(ring) for ring in rings[1:]] == [16, 16, 16]
+
+
+def test_node_face_connectivity():
+    ugrid = twenty_one_triangles()
+    offsets, indices = ugrid.node_face_connectivity
+
+    # the offsets can go past the largest face index
+    assert offsets.dtype == np.intp
+    assert indices.dtype == IND_DT
+    assert len(offsets) == len(ugrid.nodes) + 1
+    for node in range(len(ugrid.nodes)):
+        faces = indices[offsets[node]:offsets[node + 1]].tolist()
+        around = (ugrid.faces == node).any(axis=1)
+        assert faces == np.nonzero(around)[0].tolist()
+
+
+def test_node_node_connectivity():
+    ugrid = two_triangles()
+    offsets, indices = ugrid.node_node_connectivity
+
+    neighbors = [indices[offsets[i]:offsets[i + 1]].tolist() for i in range(4)]
+    assert neighbors == [[1, 2], [0, 2, 3], [0, 1, 3], [1, 2]]
+    assert offsets.dtype == np.intp
+    assert indices.dtype == IND_DT
+
+
+def test_node_connectivity_reset_with_faces():
+    ugrid = two_triangles()
+    offsets, indices = ugrid.node_face_connectivity
+    ugrid.node_node_connectivity
+
+    # swap the diagonal
+    ugrid.faces = [(0, 1, 3), (0, 3, 2)]
+    offsets, indices = ugrid.node_face_connectivity
+    assert indices[offsets[0]:offsets[1]].tolist() == [0, 1]
+    offsets, indices = ugrid.node_node_connectivity
+    assert indices[offsets[1]:offsets[2]].tolist() == [0, 3]
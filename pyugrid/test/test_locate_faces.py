@@ -1,15 +1,20 @@
 import numpy as np
 import pytest
-from .utilities import twenty_one_triangles
 
+from pyugrid import UGrid
+from pyugrid import locate
+from pyugrid.locate import FaceBins
 
-# used to parametrize tests for both methods
+from .utilities import rect_grid, twenty_one_triangles
+
+
+# used to parametrize tests for all the methods
 try:
     import cell_tree2d #noqa
-    methods = ['simple', 'celltree']
+    methods = ['simple', 'bins', 'celltree']
 except:
-    # no cell tree -- only test simple
-    methods = ['simple']
+    # no cell tree -- only test simple and bins
+    methods = ['simple', 'bins']
 
 
 @pytest.mark.parametrize("method", methods)
@@ -24,6 +29,8 @@ def test_multi(method):
     ugrid = twenty_one_triangles()
     face = ugrid.locate_faces(np.array(((4, 6.5), (7, 2))), method)
     assert (face == np.array((6, 0))).all()
+    # the same type, whatever the method
+    assert face.dtype == np.intp
 
 
 @pytest.mark.parametrize("method", methods)
@@ -36,4 +43,153 @@ def test_oob(method):
     assert np.array_equal(face, np.array((-1, )))
 
 
+def brute_force(grid, points):
+    """
+    The faces the points are in, or -1 -- checking every face.
+    """
+    found = np.empty(len(points), dtype=np.intp)
+    found.fill(-1)
+    for i, face in enumerate(grid.faces):
+        x, y = grid.nodes[face].T
+        inside = np.ones(len(points), dtype=bool)
+        for j in range(len(face)):
+            k = (j + 1) % len(face)
+            inside &= ((x[k] - x[j]) * (points[:, 1] - y[j]) -
+                       (y[k] - y[j]) * (points[:, 0] - x[j])) > 0
+        found[inside] = i
+    return found
+
+
+def test_bins_random_points():
+    grid = rect_grid(30, 20, shuffle=True)
+    nodes = grid.nodes.copy()
+    nodes[:, 0] *= 1 + nodes[:, 0] / 10  # not all the same size
+    grid.nodes = nodes
+    points = np.random.RandomState(0).uniform(-1, 70, (5000, 2))
+
+    # small chunks, to check the chunking
+    found = grid.locate_faces(points, 'bins')
+    assert np.array_equal(found, brute_force(grid, points))
+    assert np.array_equal(grid._bins.locate(points, 100), found)
+
+
+@pytest.mark.parametrize("faces_per_bin", [0.1, 1, 10])
+def test_bins_sizes(faces_per_bin):
+    grid = twenty_one_triangles()
+    points = np.random.RandomState(1).uniform(0, 10, (1000, 2))
+    grid.build_face_bins(faces_per_bin)
+    assert np.array_equal(grid.locate_faces(points, 'bins'),
+                          brute_force(grid, points))
+
+
+def test_bins_quads_clockwise():
+    grid = UGrid([(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1)],
+                 [(0, 3, 4, 1), (1, 2, 5, 4)])
+    found = grid.locate_faces([(0.5, 0.5), (1.5, 0.2), (2.5, 0.5)], 'bins')
+    assert found.tolist() == [0, 1, -1]
+
+
+def test_bins_on_edge():
+    grid = rect_grid(3, 3)
+    # on the diagonal between faces 0 and 4, and on a node
+    assert grid.locate_faces((0.5, 0.5), 'bins') == 0
+    assert grid.locate_faces((1, 1), 'bins') == 0
+
+
+def test_bins_rebuilt():
+    grid = rect_grid(3, 3)
+    assert grid.locate_faces((5, 5), 'bins') == -1
+    grid.nodes = grid.nodes * 3
+    assert grid._bins is None
+    assert grid.locate_faces((5, 5), 'bins') == 3
+
+
+def test_bins_one_line():
+    # all the nodes in a line -- no area to bin
+    bins = FaceBins(np.array([(0, 0), (1, 0), (2, 0)], dtype=np.float64),
+                    np.array([(0, 1, 2)]), 1.0, 100)
+    assert bins.locate([(0.5, 0)], 100).tolist() == [-1]
+
+
+def test_walk_moving_points():
+    grid = rect_grid(30, 20, shuffle=True)
+    rs = np.random.RandomState(2)
+    points = rs.uniform(0, 29, (2000, 2)) * (1, 19 / 29)
+    faces = grid.locate_faces(points, 'bins')
+    for step in range(5):
+        points = points + rs.uniform(-1.5, 1.5, points.shape)
+        faces = grid.locate_faces(points, 'bins', hint=faces)
+        assert np.array_equal(faces, brute_force(grid, points))
+
+
+def test_walk_only():
+    grid = rect_grid(10, 8)
+    grid.build_face_face_connectivity()
+    points = np.array([(0.2, 0.1), (8.5, 6.7), (4.5, 3.2), (20, 1)])
+    start = np.array([0, 0, -1, 0])
+    found = locate.walk(grid.nodes, grid.faces, grid.face_face_connectivity,
+                        points, start)
+    expected = brute_force(grid, points)
+    assert found[:2].tolist() == expected[:2].tolist()
+    # not known, and walked off the grid
+    assert found[2:].tolist() == [-1, -1]
+    # too far to walk
+    assert locate.walk(grid.nodes, grid.faces, grid.face_face_connectivity,
+                       points[1:2], [0], max_steps=3).tolist() == [-1]
+
+
+def test_walk_clockwise_quads():
+    grid = UGrid([(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1)],
+                 [(0, 3, 4, 1), (4, 5, 2, 1)])
+    found = grid.locate_faces([(1.5, 0.2), (0.5, 0.5), (2.5, 0.5)], 'bins',
+                              hint=[0, 1, 1])
+    assert found.tolist() == [1, 0, -1]
+
+
+def test_walk_bad_hints():
+    grid = rect_grid(4, 3)
+    points = [(0.2, 0.1), (2.5, 1.8)]
+    assert grid.locate_faces(points, 'bins', hint=[-1, 100]).tolist() == \
+        grid.locate_faces(points, 'bins').tolist()
+    assert grid.locate_faces((0.2, 0.1), 'bins', hint=3) == 0
+    with pytest.raises(ValueError):
+        grid.locate_faces(points, 'bins', hint=[0])
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_workers(workers):
+    grid = rect_grid(30, 20, shuffle=True)
+    points = np.random.RandomState(3).uniform(-1, 30, (25000, 2))
+    found = grid.locate_faces(points, 'bins', workers=workers)
+    assert np.array_equal(found, brute_force(grid, points))
+
+    moved = points + 0.5
+    assert np.array_equal(grid.locate_faces(moved, 'bins', hint=found,
+                                            workers=workers),
+                          brute_force(grid, moved))
+
+
+def test_workers_builds_once():
+    grid = rect_grid(10, 8)
+    points = np.random.RandomState(4).uniform(0, 9, (30000, 2))
+    found = grid.locate_faces(points, 'bins', hint=np.zeros(30000, int),
+                              workers=4)
+    assert grid._bins is not None
+    assert grid.face_face_connectivity is not None
+    assert np.array_equal(found, grid.locate_faces(points, 'bins',
+                                                   workers=1))
+    with pytest.raises(ValueError):
+        grid.locate_faces(points, 'nothing', workers=4)
+
+
+def test_simple_matches_bins():
+    grid = rect_grid(30, 20, shuffle=True)
+    points = np.random.RandomState(5).uniform(-1, 30, (3000, 2))
+    assert np.array_equal(grid.locate_faces(points, 'simple'),
+                          grid.locate_faces(points, 'bins'))
 
+    quads = UGrid([(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1)],
+                  [(0, 3, 4, 1), (1, 2, 5, 4)])
+    found = quads.locate_faces([(0.5, 0.5), (1.5, 0.2), (2.5, 0.5),
+                                (1, 0.5)], 'simple')
+    assert found.tolist() == [0, 1, -1, 0]
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""
+Tests of merging grids into one.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+import pytest
+
+from pyugrid import UGrid, UVar
+from pyugrid.merge import merge_nodes
+
+from .utilities import rect_grid, two_triangles
+
+
+def two_tiles(jitter=0.0):
+    """
+    Two 10 X 8 node rectangular grids, side by side, sharing the column of
+    nodes at x = 9 -- with those of the right one moved by up to jitter.
+    """
+    left = rect_grid(10, 8)
+    right = rect_grid(10, 8)
+    nodes = right.nodes.copy()
+    nodes[:, 0] += 9
+    seam = nodes[:, 0] == 9
+    nodes[seam] += np.random.RandomState(0).uniform(-jitter, jitter,
+                                                    (seam.sum(), 2))
+    right.nodes = nodes
+    return left, right
+
+
+def test_merge_nodes_exact():
+    nodes = [(0, 0), (1, 0), (0, 0), (2, 2), (1, 0)]
+    node_map, first_node = merge_nodes(nodes)
+    assert node_map.tolist() == [0, 1, 0, 2, 1]
+    assert first_node.tolist() == [0, 1, 3]
+
+
+def test_merge_nodes_transitive():
+    nodes = [(0, 0), (5, 5), (0.8, 0), (1.6, 0), (5, 5.5)]
+    node_map, first_node = merge_nodes(nodes, tol=1.0)
+    assert node_map.tolist() == [0, 1, 0, 0, 1]
+    assert first_node.tolist() == [0, 1]
+
+
+def test_merge_nodes_brute_force():
+    rs = np.random.RandomState(1)
+    nodes = rs.uniform(0, 10, (500, 2))
+    nodes = np.concatenate((nodes, nodes[:100] + rs.uniform(-0.01, 0.01,
+                                                            (100, 2))))
+    node_map, first_node = merge_nodes(nodes, tol=0.05)
+
+    dist = np.hypot(*(nodes[:, None, :] - nodes[None, :, :]).T)
+    close = dist <= 0.05
+    same = node_map[:, None] == node_map[None, :]
+    assert np.all(same[close])
+    # and no more than that: one merged node per cluster of close nodes
+    from scipy.sparse.csgraph import connected_components
+    assert len(first_node) == connected_components(close)[0]
+
+
+def test_merge_nodes_negative_tol():
+    with pytest.raises(ValueError):
+        merge_nodes([(0, 0)], tol=-1)
+
+
+@pytest.mark.parametrize("jitter", [0.0, 1e-9])
+def test_merge(jitter):
+    left, right = two_tiles(jitter)
+    grid = UGrid.merge([left, right], tol=1e-6 if jitter else 0.0)
+
+    assert len(grid.nodes) == 2 * 80 - 8
+    assert len(grid.faces) == len(left.faces) + len(right.faces)
+    assert np.array_equal(grid.nodes[:80], left.nodes)
+    assert np.allclose(grid.nodes[grid.faces[len(left.faces):]],
+                       right.nodes[right.faces])
+    assert grid.check_consistent().ok
+
+
+def test_merge_edges_boundaries():
+    left, right = two_tiles()
+    for grid in left, right:
+        grid.build_edges()
+        grid.build_boundaries()
+        grid.build_face_face_connectivity()
+    merged = UGrid.merge([left, right])
+
+    whole = rect_grid(19, 8)
+    whole.build_edges()
+    whole.build_boundaries()
+    assert len(merged.edges) == len(whole.edges)
+    assert len(merged.boundaries) == len(whole.boundaries)
+    # rebuilt across the seam
+    assert (merged.face_face_connectivity >= 0).sum() == \
+        (left.face_face_connectivity >= 0).sum() * 2 + 2 * 7
+
+
+def test_merge_data():
+    left, right = two_tiles()
+    left.add_data(UVar('depth', 'node', data=np.arange(80.0)))
+    right.add_data(UVar('depth', 'node', data=np.arange(80.0) + 100))
+    left.add_data(UVar('u', 'face', data=np.ones(len(left.faces)),
+                       attributes={'units': 'm/s'}))
+    grid = UGrid.merge([left, right])
+
+    depth = grid.data['depth'].data
+    assert np.array_equal(depth[:80], np.arange(80.0))
+    # the seam nodes come from the left grid
+    assert depth[80:].min() > 100
+
+    u = grid.data['u']
+    assert u.attributes == {'units': 'm/s'}
+    assert np.ma.count(u.data) == len(left.faces)
+    assert u.data.mask[len(left.faces):].all()
+
+
+def test_merge_different_faces():
+    quads = UGrid([(0, 0), (1, 0), (1, 1), (0, 1)], [(0, 1, 2, 3)])
+    with pytest.raises(ValueError):
+        UGrid.merge([two_triangles(), quads])
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""
+Tests of winding all the faces the same way.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+
+from pyugrid import UGrid
+
+from .utilities import rect_grid, two_triangles
+
+
+def mixed_grid():
+    """
+    A rect_grid with every third face wound clockwise.
+    """
+    grid = rect_grid(6, 5, shuffle=True)
+    faces = grid.faces.copy()
+    faces[::3] = faces[::3, ::-1]
+    return UGrid(grid.nodes, faces)
+
+
+def signed_areas(grid):
+    points = grid.nodes[grid.faces]
+    a = points[:, 1] - points[:, 0]
+    b = points[:, 2] - points[:, 0]
+    return (a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0]) / 2
+
+
+def test_orientation():
+    assert rect_grid().orientation == 'ccw'
+    grid = mixed_grid()
+    assert grid.orientation == 'mixed'
+
+    grid.faces = grid.faces[::3]
+    assert grid.orientation == 'cw'
+
+
+def test_orient_faces():
+    grid = mixed_grid()
+    original = grid.faces.copy()
+    flipped = grid.orient_faces()
+
+    assert flipped.tolist() == list(range(0, len(original), 3))
+    assert np.all(signed_areas(grid) > 0)
+    assert grid.orientation == 'ccw'
+    # the same nodes, and the same first node
+    assert np.array_equal(np.sort(grid.faces, axis=1),
+                          np.sort(original, axis=1))
+    assert np.array_equal(grid.faces[:, 0], original[:, 0])
+
+    assert grid.orient_faces().size == 0
+
+
+def test_orient_faces_cw():
+    grid = mixed_grid()
+    grid.orient_faces(ccw=False)
+    assert np.all(signed_areas(grid) < 0)
+    assert grid.orientation == 'cw'
+
+
+def test_connectivity_kept():
+    grid = mixed_grid()
+    grid.build_edges()
+    grid.build_face_face_connectivity()
+    grid.build_face_edge_connectivity()
+    face_face = grid.face_face_connectivity
+    grid.orient_faces(chunk_size=7)
+
+    assert grid.face_face_connectivity is face_face
+    reference = UGrid(grid.nodes, grid.faces, edges=grid.edges)
+    reference.build_face_face_connectivity()
+    reference.build_face_edge_connectivity()
+    assert np.array_equal(grid.face_face_connectivity,
+                          reference.face_face_connectivity)
+    assert np.array_equal(grid.face_edge_connectivity,
+                          reference.face_edge_connectivity)
+
+
+def test_quads():
+    grid = UGrid([(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1)],
+                 [(0, 3, 4, 1), (1, 2, 5, 4)])
+    grid.build_face_face_connectivity()
+    assert grid.orient_faces().tolist() == [0]
+    assert grid.faces.tolist() == [[0, 1, 4, 3], [1, 2, 5, 4]]
+    assert grid.face_face_connectivity.tolist() == [[-1, 1, -1, -1],
+                                                    [-1, -1, -1, 0]]
+
+
+def test_built_boundaries_rebuilt():
+    grid = two_triangles()
+    grid.faces = [(0, 2, 1), (1, 3, 2)]
+    grid.build_boundaries()
+    grid.orient_faces()
+    assert sorted(grid.boundaries.tolist()) == [[0, 1], [1, 3], [2, 0],
+                                                [3, 2]]
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""
+Tests of splitting a grid into parts.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+import pytest
+
+from pyugrid import UVar
+from pyugrid.partition import label_faces
+
+from .utilities import rect_grid, twenty_one_triangles
+
+
+@pytest.mark.parametrize("method", ['rcb', 'graph'])
+@pytest.mark.parametrize("num_parts", [1, 2, 3, 7])
+def test_label_faces(method, num_parts):
+    grid = rect_grid(30, 20, shuffle=True)
+    labels = label_faces(grid, num_parts, method)
+
+    counts = np.bincount(labels, minlength=num_parts)
+    assert len(counts) == num_parts
+    assert counts.max() - counts.min() <= num_parts
+
+
+@pytest.mark.parametrize("method", ['rcb', 'graph'])
+def test_parts_compact(method):
+    grid = rect_grid(40, 40, shuffle=True)
+    labels = label_faces(grid, 4, method)
+    grid.build_face_face_connectivity()
+    face_face = grid.face_face_connectivity
+
+    # few of the face to face links should cross between parts
+    has_neighbor = face_face >= 0
+    cut = (labels[:, None] != labels[face_face]) & has_neighbor
+    assert cut.sum() < 0.05 * has_neighbor.sum()
+
+
+def test_partition():
+    grid = rect_grid(30, 20, shuffle=True)
+    depth = grid.nodes[:, 0] + grid.nodes[:, 1] * 100
+    grid.add_data(UVar('depth', 'node', data=depth))
+    parts = grid.partition(3)
+
+    owned = np.concatenate([part.face_map[:part.num_owned] for part in parts])
+    assert sorted(owned) == list(range(len(grid.faces)))
+    for part in parts:
+        sub = part.grid
+        assert np.array_equal(sub.nodes, grid.nodes[part.node_map])
+        assert np.array_equal(part.node_map[sub.faces],
+                              grid.faces[part.face_map])
+        assert np.array_equal(sub.data['depth'].data, depth[part.node_map])
+        assert sub.check_consistent().ok
+
+
+def test_partition_halo():
+    grid = twenty_one_triangles()
+    grid.build_face_face_connectivity()
+    parts = grid.partition(2, halo=1)
+
+    for part in parts:
+        owned = part.face_map[:part.num_owned]
+        halo = part.face_map[part.num_owned:]
+        assert len(halo) > 0
+        assert not np.intersect1d(owned, halo).size
+        # every halo face shares a node with an owned face
+        owned_nodes = grid.faces[owned].ravel()
+        assert np.isin(grid.faces[halo], owned_nodes).any(axis=1).all()
+        # and no face that does is left out
+        touching = np.isin(grid.faces, owned_nodes).any(axis=1)
+        assert sorted(np.nonzero(touching)[0]) == sorted(part.face_map)
+        # connectivity is local: neighbors outside the part are -1
+        face_face = part.grid.face_face_connectivity
+        assert face_face.max() < len(part.face_map)
+
+
+def test_bad_method():
+    grid = twenty_one_triangles()
+    with pytest.raises(ValueError):
+        grid.partition(2, method='metis')
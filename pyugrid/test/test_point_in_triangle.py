@@ -2,7 +2,7 @@ from __future__ import (absolute_import, division, print_function)
 
 import numpy as np
 
-from pyugrid.util import point_in_tri
+from pyugrid.util import point_in_tri, points_in_tris
 
 
 def test_point_in_tri():
@@ -19,3 +19,81 @@ def test_point_in_tri():
             assert point_in_tri(dataset['triangle'], point)
         for point in dataset['points_outside']:
             assert ~point_in_tri(dataset['triangle'], point)
+
+
+def test_point_in_tri_weights():
+    triangle = np.array([[0., 0.], [1., 0.], [0., 1.]])
+    assert np.allclose(point_in_tri(triangle, (0.2, 0.3), return_weights=True),
+                       (0.5, 0.2, 0.3))
+    assert point_in_tri(triangle, (1., 1.), return_weights=True) is False
+
+
+def test_points_in_tris():
+    nodes = np.array([(0., 0.), (1., 0.), (0., 1.), (1., 1.)])
+    tris = np.array([(0, 1, 2),
+                     (0, 2, 1),  # clockwise
+                     (1, 3, 2),
+                     (0, 1, 2),
+                     (0, 1, 2)])
+    points = [(0.25, 0.25), (0.25, 0.25), (0.25, 0.25), (0.5, 0.5), (0, 0)]
+    inside, weights = points_in_tris(points, nodes, tris,
+                                     return_weights=True)
+    assert inside.tolist() == [True, True, False, True, True]
+    assert np.allclose(weights[0], (0.5, 0.25, 0.25))
+    assert np.allclose(weights[1], (0.5, 0.25, 0.25))
+    assert np.allclose(weights[3], (0, 0.5, 0.5))
+    assert np.allclose(weights[4], (1, 0, 0))
+    # clamped onto the triangle, adding up to one: (0.75, -0.5, 0.75)
+    # becomes (0.5, 0.5) -- on the edge facing the point
+    assert np.allclose(weights[2], (0.5, 0, 0.5))
+    assert np.allclose(weights.sum(axis=1), 1)
+
+
+def test_points_in_tris_matches_interpolation():
+    nodes = np.random.RandomState(0).uniform(0, 1, (300, 2))
+    tris = np.arange(300).reshape(-1, 3)
+    points = np.random.RandomState(1).uniform(0, 1, (100, 2))
+    inside, weights = points_in_tris(points, nodes, tris, True)
+    # the weights put the points back where they were
+    interpolated = (weights[:, :, None] * nodes[tris]).sum(axis=1)
+    assert np.allclose(interpolated[inside], points[inside])
+    assert not np.allclose(interpolated[~inside], points[~inside])
+
+
+def test_points_in_tris_out_and_degenerate():
+    nodes = np.array([(0., 0.), (1., 0.), (2., 0.)])
+    inside = np.ones(2, dtype=bool)
+    weights = np.zeros((2, 3))
+    result = points_in_tris([(0.5, 0), (3, 0)], nodes, [(0, 1, 2)] * 2,
+                            return_weights=True, out=(inside, weights))
+    assert result[0] is inside and result[1] is weights
+    assert not inside.any()
+    assert np.isnan(weights).all()
+    assert points_in_tris([(0.5, 0)], nodes, [(0, 1, 2)]).tolist() == [False]
+
+
+def test_points_in_tris_work():
+    nodes = np.array([(0., 0.), (2., 0.), (0., 2.)])
+    points = np.array([(0.5, 0.5), (3., 3.), (1., 1.)])
+    tris = [(0, 1, 2), (0, 2, 1), (0, 2, 1)]
+    work = np.empty((10, 3))
+    expected = points_in_tris(points, nodes, tris, True)
+    for _ in range(2):
+        result = points_in_tris(points, nodes, tris, True, work=work)
+        assert np.array_equal(result[0], expected[0])
+        assert np.array_equal(result[1], expected[1])
+    assert expected[0].tolist() == [True, False, True]
+
+
+def test_tolerance():
+    triangle = np.array([(0., 0.), (1., 0.), (0., 1.)])
+    # just below the bottom edge -- the weights are off by 2e-7, within
+    # epsilon, which point_in_tri (as it always has) allows.
+    point = (0.5, -1e-7)
+    assert point_in_tri(triangle, point)
+    assert point_in_tri(triangle[::-1], point)
+    assert not points_in_tris(point, triangle, np.arange(3))[0]
+    assert points_in_tris(point, triangle, np.arange(3), tolerance=1e-5)[0]
+    assert not point_in_tri(triangle, (0.5, -1e-3))
+    assert np.allclose(point_in_tri(triangle, point, return_weights=True),
+                       (0.5, 0.5, 0.0))
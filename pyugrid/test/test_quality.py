@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+Tests of the mesh quality metrics.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+
+from pyugrid import UGrid
+
+from .utilities import rect_grid, twenty_one_triangles
+
+
+def test_right_triangles():
+    grid = rect_grid(4, 3)
+    q = grid.quality()
+
+    assert np.allclose(q['area'], 0.5)
+    assert np.allclose(q['min_angle'], 45)
+    assert np.allclose(q['max_angle'], 90)
+    assert np.allclose(q['edge_ratio'], np.sqrt(2))
+    # R = sqrt(2) / 2, r = (2 - sqrt(2)) / 2
+    assert np.allclose(q['aspect_ratio'], np.sqrt(2) / 2 / (2 - np.sqrt(2)))
+
+
+def test_equilateral():
+    grid = UGrid([(0, 0), (1, 0), (0.5, np.sqrt(3) / 2)], [(0, 1, 2)])
+    q = grid.quality()
+    assert np.allclose(q['min_angle'], 60)
+    assert np.allclose(q['max_angle'], 60)
+    assert np.allclose(q['aspect_ratio'], 1)
+    assert np.allclose(q['area'], np.sqrt(3) / 4)
+
+
+def test_clockwise_and_degenerate():
+    grid = UGrid([(0, 0), (1, 0), (0, 1), (2, 0)],
+                 [(0, 2, 1),  # clockwise
+                  (0, 1, 3)])  # flat
+    q = grid.quality()
+    assert np.allclose(q['area'], [0.5, 0])
+    assert np.allclose(q['max_angle'][0], 90)
+    assert q['min_angle'][1] == 0
+    assert np.isinf(q['aspect_ratio'][1])
+    assert np.isinf(q['edge_ratio'][1])
+
+
+def test_quads():
+    grid = UGrid([(0, 0), (2, 0), (2, 1), (0, 1), (1, 2)],
+                 [(0, 1, 2, 3)])
+    q = grid.quality()
+    assert np.allclose(q['area'], 2)
+    assert np.allclose(q['min_angle'], 90)
+    assert np.allclose(q['aspect_ratio'], 2)
+    assert np.allclose(q['edge_ratio'], 2)
+
+
+def test_concave_angle():
+    grid = UGrid([(0, 0), (2, 0), (1, 1), (1, 2)],
+                 [(0, 1, 2, 3)])
+    assert grid.quality()['max_angle'][0] > 180
+
+
+def test_chunks():
+    grid = twenty_one_triangles()
+    q = grid.quality()
+    grid._quality = None
+    q_chunked = grid.quality(chunk_size=4)
+    for metric in q:
+        assert np.array_equal(q[metric], q_chunked[metric])
+
+
+def test_histogram_summary():
+    grid = rect_grid(4, 3)
+    q = grid.quality()
+    counts, bins = q.histogram('min_angle', bins=9, range=(0, 90))
+    assert counts.sum() == len(grid.faces)
+    assert counts[4] == len(grid.faces)
+
+    summary = q.summary()
+    assert list(summary) == ['area', 'min_angle', 'max_angle',
+                             'aspect_ratio', 'edge_ratio']
+    assert np.allclose(summary['area'], (0.5, 0.5, 0.5))
+    assert 'min_angle' in str(q)
+
+
+def test_cached_until_changed():
+    grid = rect_grid(4, 3)
+    q = grid.quality()
+    assert grid.quality() is q
+
+    grid.nodes = grid.nodes * 2
+    q2 = grid.quality()
+    assert q2 is not q
+    assert np.allclose(q2['area'], 2)
+
+    grid.faces = grid.faces[:3]
+    assert len(grid.quality()['area']) == 3
+
+
+def test_node_dtype():
+    grid = rect_grid(4, 3)
+    grid = UGrid(grid.nodes, grid.faces, node_dtype=np.float32)
+    assert grid.quality()['area'].dtype == np.float32
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+Tests of reordering the nodes and faces of a grid.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+import pytest
+
+from pyugrid import UVar
+from pyugrid.util import hilbert_index
+
+from .utilities import rect_grid, twenty_one_triangles
+
+try:
+    import scipy  # noqa
+    methods = ['hilbert', 'rcm']
+except ImportError:
+    methods = ['hilbert']
+
+
+def face_corners(grid):
+    """The set of faces, as coordinates -- independent of the order."""
+    return sorted(map(tuple, grid.nodes[grid.faces].reshape(-1, 6).tolist()))
+
+
+def scrambled_grid():
+    grid = rect_grid(40, 30, shuffle=True)
+    node_order = np.random.RandomState(1).permutation(len(grid.nodes))
+    node_rank = np.argsort(node_order)
+    grid.nodes = grid.nodes[node_order]
+    grid.faces = node_rank[grid.faces]
+    return grid
+
+
+@pytest.mark.parametrize("method", methods)
+def test_reorder_same_grid(method):
+    grid = scrambled_grid()
+    expected = face_corners(grid)
+
+    grid.reorder(method)
+    assert face_corners(grid) == expected
+
+
+@pytest.mark.parametrize("method", methods)
+def test_reorder_locality(method):
+    grid = scrambled_grid()
+    spread = np.ptp(grid.faces, axis=1).mean()
+
+    grid.reorder(method)
+    # the nodes of each face should now be much closer together
+    assert np.ptp(grid.faces, axis=1).mean() < spread / 10
+
+
+@pytest.mark.parametrize("method", methods)
+def test_reorder_connectivity(method):
+    grid = twenty_one_triangles()
+    grid.build_face_face_connectivity()
+    grid.build_edges(edge_face=True)
+    grid.build_face_coordinates()
+    grid.build_boundary_coordinates()
+
+    grid.reorder(method)
+    face_face = grid.face_face_connectivity
+    face_edge = grid.face_edge_connectivity
+    edge_face = grid.edge_face_connectivity
+
+    assert np.array_equal(face_face,
+                          grid._build_face_face_connectivity_loop())
+    assert np.allclose(grid.face_coordinates,
+                       grid.nodes[grid.faces].mean(axis=1))
+    assert np.allclose(grid.boundary_coordinates,
+                       grid.nodes[grid.boundaries].mean(axis=1))
+    for i, face in enumerate(grid.faces):
+        for j in range(3):
+            nodes = sorted((face[j], face[(j + 1) % 3]))
+            assert sorted(grid.edges[face_edge[i, j]]) == nodes
+            assert i in edge_face[face_edge[i, j]]
+
+
+@pytest.mark.parametrize("method", methods)
+def test_reorder_data(method):
+    grid = rect_grid(20, 10, shuffle=True)
+    nodes = grid.nodes.copy()
+    depth = UVar('depth', 'node', data=nodes[:, 0] * 10 + nodes[:, 1])
+    grid.add_data(depth)
+    area = UVar('area', 'face', data=np.arange(len(grid.faces)))
+    grid.add_data(area)
+    faces = grid.faces.copy()
+
+    node_order, face_order = grid.reorder(method)
+    assert np.array_equal(grid.nodes, nodes[node_order])
+    assert np.array_equal(grid.data['depth'].data,
+                          grid.nodes[:, 0] * 10 + grid.nodes[:, 1])
+    assert np.array_equal(grid.data['area'].data, face_order)
+    assert np.array_equal(node_order[grid.faces], faces[face_order])
+
+
+def test_reorder_bad_method():
+    grid = twenty_one_triangles()
+    with pytest.raises(ValueError):
+        grid.reorder('random')
+
+
+def test_hilbert_index():
+    # the 2nd order curve through a 4 x 4 grid of points
+    x, y = np.meshgrid(np.arange(4), np.arange(4))
+    points = np.column_stack((x.ravel(), y.ravel()))
+    index = hilbert_index(points, order=2)
+
+    assert sorted(index) == list(range(16))
+    # each step along the curve is to a neighboring point
+    path = points[np.argsort(index)]
+    assert np.all(np.abs(np.diff(path, axis=0)).sum(axis=1) == 1)
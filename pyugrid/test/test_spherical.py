@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+"""
+Tests of searching lon/lat grids on the sphere.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+import pytest
+
+from pyugrid import UGrid
+from pyugrid.util import unit_vectors
+
+
+def global_grid(num_lon=36, num_lat=17):
+    """
+    Triangles all the way around the globe, from 80S to 80N, with a fan
+    of them around each pole.
+    """
+    lon = np.arange(num_lon) * 360.0 / num_lon - 180
+    lat = np.linspace(-80, 80, num_lat)
+    nodes = np.array([(x, y) for y in lat for x in lon] + [(0, -90), (0, 90)])
+    south, north = len(nodes) - 2, len(nodes) - 1
+
+    faces = []
+    for j in range(num_lat - 1):
+        for i in range(num_lon):
+            a = j * num_lon + i
+            b = j * num_lon + (i + 1) % num_lon  # around the antimeridian
+            faces.append((a, b, b + num_lon))
+            faces.append((a, b + num_lon, a + num_lon))
+    top = (num_lat - 1) * num_lon
+    for i in range(num_lon):
+        faces.append(((i + 1) % num_lon, i, south))
+        faces.append((top + i, top + (i + 1) % num_lon, north))
+    return UGrid(nodes, faces)
+
+
+def random_points(num, seed=0):
+    xyz = np.random.RandomState(seed).normal(size=(num, 3))
+    xyz /= np.sqrt((xyz ** 2).sum(axis=1))[:, None]
+    return np.column_stack((np.degrees(np.arctan2(xyz[:, 1], xyz[:, 0])),
+                            np.degrees(np.arcsin(xyz[:, 2]))))
+
+
+def brute_force(grid, points):
+    """
+    The faces the points are in -- checking every face, on the sphere.
+    """
+    nodes = unit_vectors(grid.nodes[:, 0], grid.nodes[:, 1])
+    points = unit_vectors(points[:, 0], points[:, 1])
+    found = np.empty(len(points), dtype=np.intp)
+    found.fill(-1)
+    for i, face in enumerate(grid.faces):
+        v = nodes[face]
+        sign = np.sign(np.dot(np.cross(v[0], v[1]), v[2]))
+        inside = np.ones(len(points), dtype=bool)
+        for j in range(len(face)):
+            normal = np.cross(v[j], v[(j + 1) % len(face)])
+            inside &= sign * np.dot(points, normal) > 0
+        found[inside] = i
+    return found
+
+
+def great_circle(a, b):
+    a = unit_vectors(a[..., 0], a[..., 1])
+    b = unit_vectors(b[..., 0], b[..., 1])
+    return np.arccos(np.clip((a * b).sum(axis=-1), -1, 1))
+
+
+def test_locate_faces():
+    grid = global_grid()
+    points = random_points(2000)
+    # and some right by the antimeridian and the poles
+    points = np.concatenate((points, [(179.9, 1.0), (-179.9, -1.0),
+                                      (45.0, 89.9), (-135, -89.9)]))
+    found = grid.locate_faces(points, spherical=True)
+    assert np.array_equal(found, brute_force(grid, points))
+    assert (found >= 0).all()
+
+
+def test_across_antimeridian():
+    grid = global_grid()
+    face = grid.locate_faces((179.0, 0.5), spherical=True)
+    assert sorted(grid.nodes[grid.faces[face], 0]) == [-180, -180, 170]
+    # the planar search finds the face running the long way round
+    assert grid.locate_faces((179.0, 0.5), 'bins') != face
+
+
+def test_bad_method():
+    grid = global_grid()
+    with pytest.raises(ValueError):
+        grid.locate_faces((10.0, 10.0), 'nothing', spherical=True)
+    with pytest.raises(ValueError):
+        grid.locate_faces((10.0, 10.0), 'nothing', hint=[0],
+                          spherical=True)
+
+
+def test_walk():
+    grid = global_grid()
+    points = random_points(500, seed=1)
+    faces = grid.locate_faces(points, spherical=True)
+    rs = np.random.RandomState(2)
+    for step in range(3):
+        points[:, 0] = (points[:, 0] + rs.uniform(-15, 15, len(points)) +
+                        180) % 360 - 180
+        points[:, 1] = np.clip(points[:, 1] + rs.uniform(-5, 5, len(points)),
+                               -89.5, 89.5)
+        faces = grid.locate_faces(points, hint=faces, spherical=True)
+        assert np.array_equal(faces, brute_force(grid, points))
+
+
+def test_locate_nodes():
+    grid = global_grid()
+    north = len(grid.nodes) - 1
+    assert grid.locate_nodes((170, 89), spherical=True) == north
+    assert grid.locate_nodes((170, 89)) != north
+
+    points = random_points(200)
+    indices, distances = grid.locate_nodes(points, k=3, spherical=True,
+                                           return_distances=True)
+    all_distances = great_circle(points[:, None, :], grid.nodes[None, :, :])
+    assert np.allclose(distances, np.sort(all_distances, axis=1)[:, :3])
+    assert np.allclose(np.take_along_axis(all_distances, indices, axis=1),
+                       distances)
+
+
+def test_max_distance():
+    grid = global_grid()
+    indices, distances = grid.locate_nodes([(175, 0), (170.5, 0)],
+                                           max_distance=np.radians(1),
+                                           spherical=True,
+                                           return_distances=True)
+    assert indices[0] == -1 and np.isinf(distances[0])
+    assert grid.nodes[indices[1]].tolist() == [170, 0]
+    assert np.isclose(distances[1], np.radians(0.5))
+
+
+def test_nodes_within():
+    grid = global_grid()
+    points = random_points(100, seed=3)
+    offsets, indices, distances = grid.nodes_within(points, np.radians(12),
+                                                    spherical=True,
+                                                    return_distances=True)
+    all_distances = great_circle(points[:, None, :], grid.nodes[None, :, :])
+    for i in range(len(points)):
+        nodes = indices[offsets[i]:offsets[i + 1]]
+        expected = np.nonzero(all_distances[i] <= np.radians(12))[0]
+        assert nodes.tolist() == expected.tolist()
+        assert np.allclose(distances[offsets[i]:offsets[i + 1]],
+                           all_distances[i, nodes])
+
+
+def test_rebuilt():
+    grid = global_grid()
+    grid.locate_faces((0, 0), spherical=True)
+    grid.locate_nodes((0, 0), spherical=True)
+    assert grid._sphere_bins is not None
+    nodes = grid.nodes.copy()
+    nodes[:, 0] = (nodes[:, 0] + 360 + 5) % 360 - 180
+    grid.nodes = nodes
+    assert grid._sphere_bins is None
+    assert grid._sphere_kdtree is None
+    assert grid._node_vectors is None
+    points = random_points(300, seed=4)
+    assert np.array_equal(grid.locate_faces(points, spherical=True),
+                          brute_force(grid, points))
+
+
+@pytest.mark.parametrize("faces_per_bin", [0.5, 4])
+def test_quads(faces_per_bin):
+    lon = np.arange(0, 360, 10.0) - 180
+    lat = np.arange(-60, 61, 10.0)
+    nodes = np.array([(x, y) for y in lat for x in lon])
+    faces = [(j * 36 + i, j * 36 + (i + 1) % 36, (j + 1) * 36 + (i + 1) % 36,
+              (j + 1) * 36 + i)
+             for j in range(len(lat) - 1) for i in range(36)]
+    grid = UGrid(nodes, faces)
+    grid.build_face_bins(faces_per_bin, spherical=True)
+    points = random_points(1000, seed=5)
+    assert np.array_equal(grid.locate_faces(points, spherical=True),
+                          brute_force(grid, points))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""
+Tests of cutting out part of a grid.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+
+from pyugrid import UVar
+from pyugrid.util import points_in_polygon
+
+from .utilities import rect_grid, twenty_one_triangles
+
+
+def test_subset_bbox():
+    grid = rect_grid(10, 8)
+    sub, maps = grid.subset(bbox=(2, 2, 5, 4))
+
+    # 3 x 2 squares, two triangles each
+    assert len(sub.faces) == 12
+    assert len(sub.nodes) == 12
+    assert sub.nodes[:, 0].min() == 2
+    assert sub.nodes[:, 1].max() == 4
+    assert np.array_equal(sub.nodes, grid.nodes[maps['node']])
+    assert np.array_equal(maps['node'][sub.faces], grid.faces[maps['face']])
+
+
+def test_subset_polygon():
+    grid = rect_grid(10, 10)
+    # a triangle: only the faces below the diagonal
+    sub, maps = grid.subset(polygon=[(-0.5, -0.5), (9.5, -0.5), (9.5, 9.5)])
+
+    # both triangles of the squares below the diagonal, and the lower
+    # right triangle of the ones on it
+    assert len(sub.faces) == 9 * 8 + 9
+    assert np.all(sub.nodes[:, 0] >= sub.nodes[:, 1])
+    below = np.all(grid.nodes[grid.faces][:, :, 0] >=
+                   grid.nodes[grid.faces][:, :, 1], axis=1)
+    assert sorted(maps['face']) == sorted(np.nonzero(below)[0])
+
+
+def test_subset_faces_and_connectivity():
+    grid = twenty_one_triangles()
+    grid.build_face_face_connectivity()
+    grid.build_edges(edge_face=True)
+    grid.build_face_coordinates()
+    grid.add_data(UVar('depth', 'node', data=np.arange(20.0)))
+    grid.add_data(UVar('flux', 'edge', data=np.arange(len(grid.edges))))
+    sub, maps = grid.subset(faces=[0, 2, 3, 6, 8])
+
+    assert sub.check_consistent().ok
+    assert np.array_equal(sub.face_face_connectivity,
+                          sub._build_face_face_connectivity_loop())
+    assert np.array_equal(sub.face_coordinates,
+                          grid.face_coordinates[maps['face']])
+    assert np.array_equal(sub.data['depth'].data, maps['node'])
+    assert np.array_equal(sub.data['flux'].data, maps['edge'])
+    # the edges are all the edges of the faces
+    sub_edges = maps['node'][sub.edges]
+    assert np.array_equal(sub_edges, grid.edges[maps['edge']])
+    sub_faces = grid.faces[maps['face']]
+    face_edges = np.sort(np.stack((sub_faces, np.roll(sub_faces, -1, axis=1)),
+                                  axis=2).reshape(-1, 2), axis=1)
+    assert len(sub.edges) == len(np.unique(face_edges, axis=0))
+
+
+def test_subset_views():
+    grid = rect_grid(10, 8)
+    grid.build_face_coordinates()
+    # the lower right triangles of the first row: a run of faces
+    sub, maps = grid.subset(faces=np.arange(9), copy=False)
+    assert np.shares_memory(sub.face_coordinates, grid.face_coordinates)
+    assert not np.shares_memory(sub.nodes, grid.nodes)
+
+    # the first row of squares: a run of nodes
+    sub, maps = grid.subset(bbox=(0, 0, 9, 1), copy=False)
+    assert np.shares_memory(sub.nodes, grid.nodes)
+    assert np.array_equal(sub.nodes, grid.nodes[maps['node']])
+    assert np.array_equal(maps['node'][sub.faces], grid.faces[maps['face']])
+
+    sub, maps = grid.subset(bbox=(0, 0, 9, 1))
+    assert not np.shares_memory(sub.nodes, grid.nodes)
+
+
+def test_points_in_polygon():
+    square = [(0, 0), (2, 0), (2, 2), (0, 2)]
+    points = [(1, 1), (3, 1), (-1, 1), (1.9, 0.1), (1, 2.5)]
+    assert points_in_polygon(points, square).tolist() == [True, False, False,
+                                                          True, False]
@@ -9,8 +9,10 @@ More specific functionality is other test modules.
 
 from __future__ import (absolute_import, division, print_function)
 
+import numpy as np
+
 from pyugrid import UGrid
-from pyugrid.ugrid import IND_DT, NODE_DT
+from pyugrid.ugrid import IND_DT, NODE_DT, index_dtype_for
 
 # FIXME: Break `test_full_set` into small unittests and check if the grid here
 # is the same as `two_triangles`. If so use that.
@@ -63,3 +65,104 @@ def test_full_set():
     assert grid.faces.shape[1] == 3
     assert grid.edges.shape[1] == 2
     assert grid.boundaries.shape[1] == 2
+
+
+def test_auto_index_dtype():
+    grid = UGrid(nodes=nodes,
+                 faces=faces,
+                 edges=edges,
+                 boundaries=boundaries,
+                 index_dtype='auto',
+                 )
+    assert grid.faces.dtype == np.uint16
+    assert grid.edges.dtype == np.uint16
+    assert grid.boundaries.dtype == np.uint16
+
+    grid.build_face_face_connectivity()
+    # needs to hold -1 for "no neighbor"
+    assert grid.face_face_connectivity.dtype == np.int16
+    assert grid.face_face_connectivity.tolist() == [[-1, 1, -1], [-1, -1, 0]]
+
+    grid.build_edges(edge_face=True)
+    assert grid.edges.dtype == np.uint16
+    assert grid.face_edge_connectivity.dtype == np.uint16
+    assert grid.edge_face_connectivity.dtype == np.int16
+
+
+def test_auto_index_dtype_full():
+    # the largest node index just fits in a uint16
+    x, y = np.meshgrid(np.arange(256.0), np.arange(256.0))
+    ind = np.arange(256 * 256).reshape(256, 256)
+    quads = np.column_stack((ind[:-1, :-1].ravel(), ind[:-1, 1:].ravel(),
+                             ind[1:, 1:].ravel(), ind[1:, :-1].ravel()))
+    expected = UGrid(np.column_stack((x.ravel(), y.ravel())), quads)
+    expected.build_edges(edge_face=True)
+    expected.build_face_face_connectivity()
+    expected.build_boundaries()
+
+    grid = UGrid(expected.nodes, quads, index_dtype='auto')
+    assert grid.faces.dtype == np.uint16
+    assert grid.faces.max() == 2 ** 16 - 1
+    grid.build_edges(edge_face=True)
+    grid.build_face_face_connectivity()
+    grid.build_boundaries()
+    assert grid.edges.dtype == np.uint16
+    for name in ('edges', 'face_edge_connectivity', 'edge_face_connectivity',
+                 'face_face_connectivity', 'boundaries'):
+        assert np.array_equal(getattr(grid, name), getattr(expected, name))
+    assert np.array_equal(grid.node_node_connectivity[1],
+                          expected.node_node_connectivity[1])
+
+    # and with the edges given
+    grid = UGrid(expected.nodes, quads, edges=expected.edges[::-1],
+                 index_dtype='auto')
+    grid.build_face_edge_connectivity()
+    assert np.array_equal(grid.edges[grid.face_edge_connectivity],
+                          expected.edges[expected.face_edge_connectivity])
+
+
+def test_edges_past_packing():
+    # node indexes too big to pack an edge into one int64 key
+    big = 2 ** 33
+    faces = np.array([(0, 1, 2), (1, 3, 2), (3, 4, 2)])
+    expected = UGrid(faces=faces, index_dtype=np.int64)
+    expected.build_edges(edge_face=True)
+    expected.build_face_face_connectivity()
+
+    grid = UGrid(faces=faces + big, index_dtype=np.int64)
+    grid.build_edges(edge_face=True)
+    grid.build_face_face_connectivity()
+    assert np.array_equal(grid.edges - big, expected.edges)
+    for name in ('face_edge_connectivity', 'edge_face_connectivity',
+                 'face_face_connectivity'):
+        assert np.array_equal(getattr(grid, name), getattr(expected, name))
+
+    grid = UGrid(faces=faces + big, edges=expected.edges[::-1] + big,
+                 index_dtype=np.int64)
+    grid.build_face_edge_connectivity()
+    assert np.array_equal(grid.edges[grid.face_edge_connectivity] - big,
+                          expected.edges[expected.face_edge_connectivity])
+
+
+def test_index_dtype_for():
+    assert index_dtype_for(0, 2 ** 16 - 1) == np.uint16
+    assert index_dtype_for(0, 2 ** 16) == np.uint32
+    assert index_dtype_for(0, 2 ** 32) == np.int64
+    assert index_dtype_for(-1, 2 ** 15 - 1) == np.int16
+    assert index_dtype_for(-1, 2 ** 31) == np.int64
+
+
+def test_fixed_dtypes():
+    grid = UGrid(nodes=nodes,
+                 faces=faces,
+                 index_dtype=np.int64,
+                 node_dtype=np.float32,
+                 )
+    assert grid.nodes.dtype == np.float32
+    assert grid.faces.dtype == np.int64
+
+    grid.build_face_coordinates()
+    assert grid.face_coordinates.dtype == np.float32
+    offsets, indices = grid.node_face_connectivity
+    assert offsets.dtype == np.int64
+    assert indices.dtype == np.int64
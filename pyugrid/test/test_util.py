@@ -64,3 +64,31 @@ def test_as_test_asarraylike_dummy():
     dum = DummyArrayLike()
     result = util.asarraylike(dum)
     assert result is dum
+
+
+def test_segment_keys():
+    first = np.array([3, 1, 0, 2])
+    second = np.array([1, 3, 2, 3])
+    for num_nodes in (4, util.MAX_PACKED_NODES + 1):
+        keys = util.segment_keys(first, second, num_nodes)
+        # the same segment, whichever way round, gets the same key
+        assert keys[0] == keys[1]
+        unique, inverse = np.unique(keys, return_inverse=True)
+        assert inverse.tolist() == [1, 1, 0, 2]
+        low, high = util.key_nodes(unique, num_nodes)
+        assert low.tolist() == [0, 1, 2]
+        assert high.tolist() == [2, 3, 3]
+    assert keys.dtype == util.SEGMENT_KEY_DT
+
+
+def test_edge_keys_past_packing():
+    # node indexes too big to pack (low, high) into one int64
+    big = 2 ** 33
+    faces = np.array([(0, 1, 2), (1, 3, 2)])
+    keys = util.edge_keys(faces + big)
+    assert keys.dtype == util.SEGMENT_KEY_DT
+    small = util.edge_keys(faces)
+    assert np.array_equal(np.argsort(keys.ravel(), kind='stable'),
+                          np.argsort(small.ravel(), kind='stable'))
+    low, high = util.key_nodes(keys, None)
+    assert np.array_equal(low - big, util.key_nodes(small, 4)[0])
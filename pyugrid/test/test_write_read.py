@@ -10,7 +10,7 @@ from __future__ import (absolute_import, division, print_function)
 import os
 import numpy as np
 
-from pyugrid.ugrid import UGrid, UVar
+from pyugrid.ugrid import UGrid, UVar, IND_DT
 
 from .utilities import chdir, two_triangles
 
@@ -80,6 +80,39 @@ def test_with_just_nodes_and_depths():
     assert expected.data['depth'].attributes == grid.data['depth'].attributes
 
 
+def test_compact_dtypes():
+    expected = two_triangles()
+
+    fname = '2_triangles.nc'
+    with chdir(test_files):
+        expected.save_as_netcdf(fname)
+        grid = UGrid.from_ncfile(fname, index_dtype='auto',
+                                 node_dtype=np.float32)
+        grid.save_as_netcdf(fname)
+        grid2 = UGrid.from_ncfile(fname, index_dtype='auto')
+        grid3 = UGrid.from_ncfile(fname)
+        os.remove(fname)
+
+    assert grid.nodes.dtype == np.float32
+    # 'auto' picks the type from the largest (and smallest) value in each
+    # array -- not the number of nodes: here all the indexes are < 2**16
+    assert grid.faces.dtype == np.uint16
+    assert grid.edges.dtype == np.uint16
+    assert np.allclose(expected.nodes, grid.nodes)
+    assert np.array_equal(expected.faces, grid.faces)
+
+    # a grid with compact types is written and read back the same --
+    # compact again if asked for, otherwise with the default types.
+    assert grid2.faces.dtype == np.uint16
+    assert grid2.edges.dtype == np.uint16
+    assert grid3.faces.dtype == IND_DT
+    assert np.array_equal(expected.faces, grid3.faces)
+    assert np.array_equal(expected.faces, grid2.faces)
+    assert np.array_equal(expected.edges, grid2.edges)
+    assert np.allclose(expected.nodes, grid2.nodes)
+
+
 if __name__ == "__main__":
     test_with_faces()
     test_without_faces()
+    test_compact_dtypes()
@@ -8,6 +8,7 @@ from __future__ import (absolute_import, division, print_function)
 import os
 import contextlib
 
+import numpy as np
 import pytest
 
 from pyugrid import ugrid
@@ -111,6 +112,30 @@ def twenty_one_triangles():
     return grid
 
 
+def rect_grid(nx=10, ny=8, shuffle=False):
+    """
+    Returns a regular grid of (nx - 1) * (ny - 1) squares, each split
+    into two triangles: nx * ny nodes.
+
+    If shuffle is True, the faces come out in random (but repeatable) order.
+
+    """
+    x, y = np.meshgrid(np.arange(nx, dtype=np.float64),
+                       np.arange(ny, dtype=np.float64))
+    nodes = np.column_stack((x.ravel(), y.ravel()))
+
+    ind = np.arange(nx * ny).reshape(ny, nx)
+    ll = ind[:-1, :-1].ravel()
+    lr = ind[:-1, 1:].ravel()
+    ul = ind[1:, :-1].ravel()
+    ur = ind[1:, 1:].ravel()
+    faces = np.vstack((np.column_stack((ll, lr, ur)),
+                       np.column_stack((ll, ur, ul))))
+    if shuffle:
+        faces = faces[np.random.RandomState(42).permutation(len(faces))]
+    return ugrid.UGrid(nodes, faces)
+
+
 @contextlib.contextmanager
 def chdir(dirname=None):
     curdir = os.getcwd()
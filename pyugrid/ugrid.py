@@ -18,18 +18,401 @@ NOTE: only support for triangular mesh grids at the moment.
 
 from __future__ import (absolute_import, division, print_function)
 
+import itertools
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 
+from . import cache
+from . import consistency
+from . import locate
+from . import merge
+from . import partition
+from . import quality
 from . import read_netcdf
-from .util import point_in_tri
+from .util import (points_in_tris, hilbert_index, points_in_polygon,
+                   component_labels, colored_scatter_add, hash_arrays,
+                   unit_vectors, edge_keys, segment_keys, key_nodes)
 from .uvar import UVar
 
 __all__ = ['UGrid',
            'UVar']
 
-# datatype used for indexes -- might want to change for 64 bit some day.
+# default datatype used for indexes -- a grid can be set to use 'auto',
+# to get the smallest type that can hold its indexes (see index_dtype_for).
 IND_DT = np.int32
-NODE_DT = np.float64  # datatype used for node coordinates.
+NODE_DT = np.float64  # default datatype used for node coordinates.
+
+
+def index_dtype_for(min_index, max_index):
+    """
+    The smallest integer dtype that can hold the given range of indexes:
+    uint16, uint32 or int64 -- or int16, int32 or int64 if there are
+    negative values (-1 is used as a flag for "no neighbor", etc.)
+
+    :param min_index: the smallest value to hold
+    :param max_index: the largest value to hold
+    """
+    if min_index < 0:
+        for dtype in (np.int16, np.int32):
+            info = np.iinfo(dtype)
+            if min_index >= info.min and max_index <= info.max:
+                return np.dtype(dtype)
+    else:
+        for dtype in (np.uint16, np.uint32):
+            if max_index <= np.iinfo(dtype).max:
+                return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+# number of elements the vectorized builders work on at once --
+# big enough to be fast, small enough to keep the temporaries in check.
+CHUNK_SIZE = 2 ** 20
+
+# mean radius of the Earth (m), for spherical areas
+EARTH_RADIUS = 6371008.8
+
+
+# What is derived from what: when one of these changes, the things listed
+# are out of date. Names starting with an underscore are private caches.
+_DEPENDENTS = {
+    'nodes': ('_kdtree', '_tree', '_bins', '_quality', '_orientation',
+              '_fingerprint', '_node_vectors', '_sphere_kdtree',
+              '_sphere_bins', 'face_coordinates', 'edge_coordinates',
+              'boundary_coordinates', 'face_areas', 'node_areas'),
+    'faces': ('_tree', '_bins', '_sphere_bins', '_quality', '_orientation',
+              '_fingerprint', '_node_face_connectivity',
+              '_node_node_connectivity', '_face_coloring',
+              'face_face_connectivity',
+              'face_edge_connectivity', 'edges', 'boundaries',
+              'face_coordinates', 'face_areas', 'node_areas'),
+    'edges': ('_fingerprint', 'face_edge_connectivity',
+              'edge_face_connectivity', 'edge_coordinates'),
+    'face_face_connectivity': ('boundaries',),
+    'face_edge_connectivity': ('edge_face_connectivity',),
+    'boundaries': ('_fingerprint', 'boundary_coordinates'),
+    'face_areas': ('node_areas',),
+}
+
+# The method that (re)builds each of the derived arrays.
+_BUILDERS = {'face_face_connectivity': 'build_face_face_connectivity',
+             'face_edge_connectivity': 'build_face_edge_connectivity',
+             'edge_face_connectivity': 'build_edge_face_connectivity',
+             'edges': 'build_edges',
+             'boundaries': 'build_boundaries',
+             'face_coordinates': 'build_face_coordinates',
+             'edge_coordinates': 'build_edge_coordinates',
+             'boundary_coordinates': 'build_boundary_coordinates',
+             'face_areas': 'build_face_areas',
+             'node_areas': 'build_node_areas',
+             }
+
+# Connectivity can't be right once what it connects has changed.
+_CONNECTIVITY = ('face_face_connectivity',
+                 'face_edge_connectivity',
+                 'edge_face_connectivity')
+
+
+def _really_changed(old, new):
+    """
+    Check if an array has changed.
+
+    The same array object is assumed to have changed, as it may have been
+    modified in place.
+    """
+    if old is None or new is None:
+        return old is not new
+    if old is new:
+        return True
+    return old.shape != new.shape or not np.array_equal(old, new)
+
+
+def _build_edge_topology(faces, edge_face=False):
+    """
+    Finds all the edges of the faces in one pass.
+
+    :param faces: (num_faces, num_vertices) array of node indexes
+
+    :param edge_face=False: if True, also build the edge_face_connectivity
+
+    :returns: edges, face_edge_connectivity, edge_face_connectivity
+              (the last is None unless asked for)
+
+    The edges are (low, high) node index pairs, sorted -- so the order only
+    depends on the faces.
+    """
+    num_faces, num_vertices = faces.shape
+    # not faces.max() + 1 -- that wraps around for compact dtypes
+    num_nodes = int(faces.max()) + 1 if faces.size else 1
+    keys = edge_keys(faces, num_nodes)
+    unique_keys, inverse = np.unique(keys.ravel(), return_inverse=True)
+    edges = np.empty((len(unique_keys), 2), dtype=np.intp)
+    edges[:, 0], edges[:, 1] = key_nodes(unique_keys, num_nodes)
+    face_edge = inverse.reshape(num_faces, num_vertices)
+
+    edge_faces = None
+    if edge_face:
+        edge_faces = _edge_face_from_face_edge(face_edge, len(edges))
+    return edges, face_edge, edge_faces
+
+
+def _edge_face_from_face_edge(face_edge, num_edges):
+    """
+    Inverts the face_edge_connectivity: the two faces on either side of
+    each edge, -1 for an edge on the boundary.
+
+    For non-manifold edges (more than two faces) only the first two faces
+    are kept.
+    """
+    num_vertices = face_edge.shape[1]
+    face_edge = face_edge.ravel()
+    order = np.argsort(face_edge, kind='stable')
+    sorted_edges = face_edge[order]
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = sorted_edges[1:] != sorted_edges[:-1]
+    is_second = np.zeros(len(order), dtype=bool)
+    is_second[1:] = is_first[:-1] & ~is_first[1:]
+
+    edge_faces = np.empty((num_edges, 2), dtype=np.intp)
+    edge_faces.fill(-1)
+    edge_faces[sorted_edges[is_first], 0] = order[is_first] // num_vertices
+    edge_faces[sorted_edges[is_second], 1] = order[is_second] // num_vertices
+    return edge_faces
+
+
+def _segment_midpoints(nodes, segments, chunk_size=CHUNK_SIZE):
+    """
+    The average of the two nodes of each segment (edge or boundary).
+    """
+    midpoints = np.empty((len(segments), 2), dtype=nodes.dtype)
+    for start in range(0, len(segments), chunk_size):
+        chunk = segments[start:start + chunk_size]
+        midpoints[start:start + chunk_size] = (nodes[chunk[:, 0]] +
+                                               nodes[chunk[:, 1]]) / 2
+    return midpoints
+
+
+def _vertex_mean(points):
+    """
+    points: (N, num_vertices, 2) array of the face nodes
+    """
+    return points.mean(axis=1)
+
+
+def _area_centroid(points):
+    """
+    Center of area of each polygon, from a fan of triangles around the
+    first vertex.  Falls back to the vertex mean for zero area faces.
+    """
+    num_vertices = points.shape[1]
+    if num_vertices == 3:
+        # the same thing for a triangle
+        return points.mean(axis=1)
+    p0 = points[:, :1, :]
+    d1 = points[:, 1:-1, :] - p0
+    d2 = points[:, 2:, :] - p0
+    areas = d1[:, :, 0] * d2[:, :, 1] - d1[:, :, 1] * d2[:, :, 0]
+    # center of each triangle of the fan, relative to p0 (times 3)
+    centers = d1 + d2
+    total = areas.sum(axis=1)
+    ok = total != 0
+    centroids = points.mean(axis=1)
+    centroids[ok] = (p0[ok, 0, :] +
+                     (centers[ok] * areas[ok, :, None]).sum(axis=1) /
+                     (3 * total[ok, None]))
+    return centroids
+
+
+def _circumcenter(points):
+    """
+    Center of the circle through the three nodes of each triangle.
+    """
+    p0 = points[:, 0, :]
+    a = points[:, 1, :] - p0
+    b = points[:, 2, :] - p0
+    a2 = (a ** 2).sum(axis=1)
+    b2 = (b ** 2).sum(axis=1)
+    d = 2 * (a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0])
+    centers = np.empty_like(p0)
+    centers[:, 0] = (b[:, 1] * a2 - a[:, 1] * b2) / d
+    centers[:, 1] = (a[:, 0] * b2 - b[:, 0] * a2) / d
+    return centers + p0
+
+
+def _incenter(points):
+    """
+    Center of the circle inscribed in each triangle: the nodes weighted by
+    the length of the opposite side.
+    """
+    lengths = np.sqrt(((np.roll(points, -1, axis=1) -
+                        np.roll(points, 1, axis=1)) ** 2).sum(axis=2))
+    return ((points * lengths[:, :, None]).sum(axis=1) /
+            lengths.sum(axis=1)[:, None])
+
+
+_face_center_methods = {'mean': _vertex_mean,
+                        'centroid': _area_centroid,
+                        'circumcenter': _circumcenter,
+                        'incenter': _incenter,
+                        }
+
+
+def _signed_areas(x, y):
+    """
+    Signed area of each polygon (shoelace formula): positive for
+    counter-clockwise.
+
+    x, y: (num_vertices, N) arrays of the coordinates of the face nodes
+    """
+    num_vertices = len(x)
+    twice_area = sum(x[i] * y[(i + 1) % num_vertices] -
+                     x[(i + 1) % num_vertices] * y[i]
+                     for i in range(num_vertices))
+    return twice_area / 2
+
+
+def _kdtree_query(query, *args, **kwargs):
+    """
+    Calls one of the query methods of a cKDTree -- passing the number of
+    workers only if it was given, under the name the installed scipy
+    knows it by (n_jobs before scipy 1.6).
+    """
+    workers = kwargs.pop('workers', None)
+    if workers is None:
+        return query(*args, **kwargs)
+    workers = max(int(workers), 1)
+    try:
+        return query(*args, workers=workers, **kwargs)
+    except TypeError:
+        return query(*args, n_jobs=workers, **kwargs)
+
+
+def _chord_length(angle):
+    """
+    The straight line distance between points on the unit sphere, from
+    the angle between them (radians)
+    """
+    return 2 * np.sin(np.minimum(np.asarray(angle, dtype=np.float64),
+                                 np.pi) / 2)
+
+
+def _chord_angle(length):
+    """
+    The angle between points on the unit sphere (radians), from the
+    straight line distance between them -- inf stays inf.
+    """
+    with np.errstate(invalid='ignore'):
+        return np.where(np.isinf(length), np.inf,
+                        2 * np.arcsin(np.minimum(length, 2.0) / 2))[()]
+
+
+def _spherical_areas(x, y, z, radius):
+    """
+    Area of each polygon on a sphere, with great circle sides: the sum of
+    the spherical excess of a fan of triangles around the first vertex.
+
+    x, y, z: (num_vertices, N) arrays of the face nodes, as unit vectors
+    """
+    excess = np.zeros(x.shape[1:])
+    for k in range(1, len(x) - 1):
+        # tan(E / 2) = a . (b x c) / (1 + a . b + b . c + c . a)
+        a = (x[0], y[0], z[0])
+        b = (x[k], y[k], z[k])
+        c = (x[k + 1], y[k + 1], z[k + 1])
+        triple = (a[0] * (b[1] * c[2] - b[2] * c[1]) +
+                  a[1] * (b[2] * c[0] - b[0] * c[2]) +
+                  a[2] * (b[0] * c[1] - b[1] * c[0]))
+        dot_ab = a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+        dot_bc = b[0] * c[0] + b[1] * c[1] + b[2] * c[2]
+        dot_ca = c[0] * a[0] + c[1] * a[1] + c[2] * a[2]
+        excess += 2 * np.arctan2(triple, 1 + dot_ab + dot_bc + dot_ca)
+    return np.abs(excess) * radius ** 2
+
+
+def _median_dual_fractions(points):
+    """
+    The fraction of the area of each polygon that is in the median dual
+    control volume of each of its nodes: the quadrilateral made by the
+    node, the midpoints of the edges on either side, and the vertex mean.
+
+    points: (N, num_vertices, 2) array of the face nodes
+
+    returns: (N, num_vertices) array -- each row adds up to one.
+    """
+    num_vertices = points.shape[1]
+    if num_vertices == 3:
+        # exactly a third each for a triangle
+        return np.full(points.shape[:2], 1.0 / 3)
+    center = points.mean(axis=1)[:, None, :]
+    next_mid = (points + np.roll(points, -1, axis=1)) / 2
+    prev_mid = np.roll(next_mid, 1, axis=1)
+    # twice the area of (node, next_mid, center, prev_mid) -- the
+    # cross product of its diagonals
+    d1 = center - points
+    d2 = prev_mid - next_mid
+    parts = np.abs(d1[:, :, 0] * d2[:, :, 1] - d1[:, :, 1] * d2[:, :, 0])
+    total = parts.sum(axis=1)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, parts / total, 1.0 / num_vertices)
+
+
+def _csr_from_pairs(rows, cols, num_rows):
+    """
+    Builds a compressed sparse row (offsets, indices) structure from
+    (row, col) pairs.  The indices in each row are sorted.
+    """
+    order = np.lexsort((cols, rows))
+    offsets = np.zeros(num_rows + 1, dtype=np.intp)
+    np.cumsum(np.bincount(rows, minlength=num_rows), out=offsets[1:])
+    return offsets, np.asarray(cols)[order]
+
+
+def _order_segment_rings(segments):
+    """
+    Links up (start, end) segments that form closed rings.
+
+    :param segments: (N, 2) array of node indexes
+
+    :returns: ring_id, ring_pos: for each segment, the ring it is on
+              (numbered by its lowest segment), and its position along it.
+
+    Each segment is followed by the one starting at its end node. Where
+    more than one ring passes through a node, the segments are matched up
+    in order -- which still gives closed rings.
+
+    Pointer jumping is used, so it's all vectorized: log2(N) passes.
+    """
+    num_segs = len(segments)
+    by_start = np.argsort(segments[:, 0], kind='stable')
+    by_end = np.argsort(segments[:, 1], kind='stable')
+    if not np.array_equal(segments[by_start, 0], segments[by_end, 1]):
+        raise ValueError("boundary segments do not form closed rings: "
+                         "the faces may not be consistently wound")
+    successor = np.empty(num_segs, dtype=np.intp)
+    successor[by_end] = by_start
+
+    num_passes = int(np.ceil(np.log2(num_segs))) + 1 if num_segs > 1 else 1
+
+    # label each ring with its lowest segment index
+    ring_id = np.arange(num_segs)
+    jump = successor.copy()
+    for _ in range(num_passes):
+        ring_id = np.minimum(ring_id, ring_id[jump])
+        jump = jump[jump]
+
+    # cut each ring open just before its first segment, and count the
+    # number of steps from each segment to the cut.
+    is_last = successor == ring_id
+    jump = np.where(is_last, np.arange(num_segs), successor)
+    steps = (~is_last).astype(np.intp)
+    for _ in range(num_passes):
+        steps = steps + steps[jump]
+        jump = jump[jump]
+
+    ring_len = np.bincount(ring_id, minlength=num_segs)[ring_id]
+    ring_pos = ring_len - 1 - steps
+    return ring_id, ring_pos
 
 
 class UGrid(object):
@@ -46,11 +429,14 @@ class UGrid(object):
                  boundaries=None,
                  face_face_connectivity=None,
                  face_edge_connectivity=None,
+                 edge_face_connectivity=None,
                  edge_coordinates=None,
                  face_coordinates=None,
                  boundary_coordinates=None,
                  data=None,
                  mesh_name="mesh",
+                 index_dtype=IND_DT,
+                 node_dtype=NODE_DT,
                  ):
         """
         ugrid class -- holds, saves, etc. an unstructured grid
@@ -73,6 +459,7 @@ class UGrid(object):
 
         :param face_face_connectivity=None: connectivity arrays.
         :param face_edge_connectivity=None: connectivity arrays.
+        :param edge_face_connectivity=None: connectivity arrays.
 
         :param edge_coordinates=None: representative coordinate of the edges.
         :param face_coordinates=None: representative coordinate of the faces.
@@ -98,9 +485,49 @@ class UGrid(object):
         :param mesh_name = "mesh": optional name for the mesh
         :type mesh_name: string
 
+        :param index_dtype=IND_DT: the dtype used for all the index arrays
+                                   (faces, edges, connectivity, ...). If
+                                   'auto', each array gets the smallest
+                                   type that will hold the smallest and
+                                   largest values in it (uint16, uint32
+                                   or int64 -- or signed, if there are
+                                   -1 flags, see index_dtype_for), which
+                                   can save a lot of memory.
+        :type index_dtype: numpy dtype or 'auto'
+
+        :param node_dtype=NODE_DT: the dtype used for the node (and other)
+                                   coordinates -- float32 halves the memory.
+        :type node_dtype: numpy dtype
+
         Often this is too much data to pass in as literals -- so usually
         specialized constructors will be used instead (load from file, etc).
         """
+        # What has been built by the grid itself (and how), and what of
+        # that needs to be rebuilt as something it depends on has changed.
+        self._built = {}
+        self._stale = set()
+
+        self._index_dtype = (index_dtype if index_dtype == 'auto'
+                             else np.dtype(index_dtype))
+        self._node_dtype = np.dtype(node_dtype)
+
+        # A kdtree is used to locate nodes, and a celltree (or bins) to
+        # locate faces. They will be created if/when they are needed.
+        self._kdtree = None
+        self._tree = None
+        self._bins = None
+        # and the same on the sphere, for lon/lat grids
+        self._node_vectors = None
+        self._sphere_kdtree = None
+        self._sphere_bins = None
+        self._node_face_connectivity = None
+        self._node_node_connectivity = None
+        self._face_coloring = None
+        self._quality = None
+        self._orientation = None
+        self._face_areas = None
+        self._node_areas = None
+        self._fingerprint = None
 
         self.nodes = nodes
         self.faces = faces
@@ -109,6 +536,7 @@ class UGrid(object):
 
         self.face_face_connectivity = face_face_connectivity
         self.face_edge_connectivity = face_edge_connectivity
+        self.edge_face_connectivity = edge_face_connectivity
 
         self.edge_coordinates = edge_coordinates
         self.face_coordinates = face_coordinates
@@ -123,13 +551,9 @@ class UGrid(object):
             for dataset in data.values():
                 self.add_data(dataset)
 
-        # A kdtree is used to locate nodes.
-        # It will be created if/when it is needed.
-        self._kdtree = None
-        self._tree = None
-
     @classmethod
-    def from_ncfile(klass, nc_url, mesh_name=None, load_data=False):
+    def from_ncfile(klass, nc_url, mesh_name=None, load_data=False,
+                    index_dtype=IND_DT, node_dtype=NODE_DT):
         """
         create a UGrid object from a netcdf file name (or opendap url)
 
@@ -147,14 +571,18 @@ class UGrid(object):
                                 This could be huge!
         :type load_data: boolean
 
+        :param index_dtype=IND_DT: dtype for the index arrays, or 'auto'
+        :param node_dtype=NODE_DT: dtype for the coordinates
+
         """
-        grid = klass()
+        grid = klass(index_dtype=index_dtype, node_dtype=node_dtype)
         read_netcdf.load_grid_from_ncfilename(nc_url, grid,
                                               mesh_name, load_data)
         return grid
 
     @classmethod
-    def from_nc_dataset(klass, nc, mesh_name=None, load_data=False):
+    def from_nc_dataset(klass, nc, mesh_name=None, load_data=False,
+                        index_dtype=IND_DT, node_dtype=NODE_DT):
         """
         create a UGrid object from a netcdf file (or opendap url)
 
@@ -175,18 +603,92 @@ class UGrid(object):
 
         :type load_data: boolean
 
+        :param index_dtype=IND_DT: dtype for the index arrays, or 'auto'
+        :param node_dtype=NODE_DT: dtype for the coordinates
+
         """
-        grid = klass()
+        grid = klass(index_dtype=index_dtype, node_dtype=node_dtype)
         read_netcdf.load_grid_from_nc_dataset(nc, grid, mesh_name, load_data)
         return grid
 
-    def check_consistent(self):
+    @classmethod
+    def merge(klass, grids, tol=0.0, mesh_name=None, index_dtype=None,
+              node_dtype=None):
+        """
+        create a UGrid object by stitching together a number of grids
+
+        :param grids: the grids to merge -- they must all have faces with
+                      the same number of vertices.
+        :type grids: sequence of UGrid objects
+
+        :param tol=0.0: nodes closer together than this are merged into
+                        one (the first of them). If 0, only nodes in exactly
+                        the same place are merged.
+
+        :param mesh_name=None: name of the new mesh -- default: the name of
+                               the first grid.
+        :param index_dtype=None: dtype for the index arrays, or 'auto' --
+                                 default: that of the first grid.
+        :param node_dtype=None: dtype for the coordinates -- default: that
+                                of the first grid.
+
+        The nodes and faces are concatenated, in order, then the nodes
+        along the seams merged. Duplicate edges are dropped, and so are
+        boundaries that are not on the boundary any more. Connectivity any
+        of the grids had is rebuilt for the whole grid.
+
+        Data with the same name and location is concatenated -- the parts
+        of it on grids that don't have it are masked.
+
+        The nodes are found with a spatial hash, so it scales with the
+        number of nodes, not the square of it.
+        """
+        return merge.merge_grids(klass, grids, tol, mesh_name, index_dtype,
+                                 node_dtype)
+
+    def check_consistent(self, quick=False, sample_size=100000):
         """
         Check if the various data is consistent: the edges and faces reference
         existing nodes, etc.
 
+        :param quick=False: if True, only check a random sample of the faces,
+                            edges and boundaries -- fast, but may miss
+                            problems.
+        :param sample_size=100000: the size of the sample for a quick check.
+
+        :returns: a ConsistencyReport: a dict of what failed each check.
+                  report.ok is True if everything passed.
+
+        Checks for: node indexes out of range, degenerate and duplicate
+        faces, faces wound the wrong way, non-manifold edges, arrays of
+        the wrong shape, connectivity out of range, and data that doesn't
+        match the size of the grid.
+
+        """
+        return consistency.check_grid(self, quick, sample_size)
+
+    def quality(self, chunk_size=CHUNK_SIZE):
+        """
+        Quality metrics of all the faces: area, smallest and largest
+        angles, aspect ratio and ratio of the longest to shortest edge.
+
+        :param chunk_size=CHUNK_SIZE: the number of faces to work on at
+                                      once.
+
+        :returns: a MeshQuality: a dict of an array of each metric, with
+                  histogram() and summary() methods. e.g.::
+
+                      q = grid.quality()
+                      counts, bins = q.histogram('min_angle', bins=18,
+                                                 range=(0, 90))
+                      print(q)
+
+        The result is cached until the nodes or faces change -- don't
+        change it in place.
         """
-        raise NotImplementedError
+        if self._quality is None:
+            self._quality = quality.face_quality(self, chunk_size)
+        return self._quality
 
     @property
     def num_vertices(self):
@@ -208,17 +710,17 @@ class UGrid(object):
         # Room here to do consistency checking, etc.
         # For now -- simply make sure it's a numpy array.
         if nodes_coords is None:
-            self.nodes = np.zeros((0, 2), dtype=NODE_DT)
+            self.nodes = np.zeros((0, 2), dtype=self._node_dtype)
         else:
-            self._nodes = np.asarray(nodes_coords, dtype=NODE_DT)
+            self._set('nodes', self._as_coords(nodes_coords))
 
     @nodes.deleter
     def nodes(self):
         # If there are no nodes, there can't be anything else.
-        self._nodes = np.zeros((0, 2), dtype=NODE_DT)
-        self._edges = None
-        self._faces = None
-        self._boundaries = None
+        self._set('nodes', np.zeros((0, 2), dtype=self._node_dtype))
+        self._set('edges', None)
+        self._set('faces', None)
+        self._set('boundaries', None)
 
     @property
     def faces(self):
@@ -229,101 +731,395 @@ class UGrid(object):
         # Room here to do consistency checking, etc.
         # For now -- simply make sure it's a numpy array.
         if faces_indexes is not None:
-            self._faces = np.asarray(faces_indexes, dtype=IND_DT)
-        else:
-            self._faces = None
-            # Other things are no longer valid.
-            self._face_face_connectivity = None
-            self._face_edge_connectivity = None
+            faces_indexes = self._as_index(faces_indexes)
+        # Other things are no longer valid if it has changed.
+        self._set('faces', faces_indexes)
 
     @faces.deleter
     def faces(self):
-        self._faces = None
-        self._faces = None
-        # Other things are no longer valid.
-        self._face_face_connectivity = None
-        self._face_edge_connectivity = None
+        self._set('faces', None)
         self.edge_coordinates = None
 
     @property
     def edges(self):
-        return self._edges
+        return self._get('edges')
 
     @edges.setter
     def edges(self, edges_indexes):
         # Room here to do consistency checking, etc.
         # For now -- simply make sure it's a numpy array.
         if edges_indexes is not None:
-            self._edges = np.asarray(edges_indexes, dtype=IND_DT)
-        else:
-            self._edges = None
-            self._face_edge_connectivity = None
+            edges_indexes = self._as_index(edges_indexes)
+        self._set('edges', edges_indexes)
 
     @edges.deleter
     def edges(self):
-        self._edges = None
-        self._face_edge_connectivity = None
+        self._set('edges', None)
         self.edge_coordinates = None
 
     @property
     def boundaries(self):
-        return self._boundaries
+        return self._get('boundaries')
 
     @boundaries.setter
     def boundaries(self, boundaries_indexes):
         # Room here to do consistency checking, etc.
         # For now -- simply make sure it's a numpy array.
         if boundaries_indexes is not None:
-            self._boundaries = np.asarray(boundaries_indexes, dtype=IND_DT)
-        else:
-            self._boundaries = None
+            boundaries_indexes = self._as_index(boundaries_indexes)
+        self._set('boundaries', boundaries_indexes)
 
     @boundaries.deleter
     def boundaries(self):
-        self._boundaries = None
+        self._set('boundaries', None)
         self.boundary_coordinates = None
 
     @property
     def face_face_connectivity(self):
-        return self._face_face_connectivity
+        return self._get('face_face_connectivity')
 
     @face_face_connectivity.setter
     def face_face_connectivity(self, face_face_connectivity):
         # Add more checking?
         if face_face_connectivity is not None:
-            face_face_connectivity = np.asarray(face_face_connectivity,
-                                                dtype=IND_DT)
+            face_face_connectivity = self._as_index(face_face_connectivity)
             if face_face_connectivity.shape != (len(self.faces),
                                                 self.num_vertices):
                 msg = ("face_face_connectivity must be size "
                        "(num_faces, {})").format
                 raise ValueError(msg(self.num_vertices))
-        self._face_face_connectivity = face_face_connectivity
+        self._set('face_face_connectivity', face_face_connectivity)
 
     @face_face_connectivity.deleter
     def face_face_connectivity(self):
-        self._face_face_connectivity = None
+        self._set('face_face_connectivity', None)
 
     @property
     def face_edge_connectivity(self):
-        return self._face_edge_connectivity
+        return self._get('face_edge_connectivity')
 
     @face_edge_connectivity.setter
     def face_edge_connectivity(self, face_edge_connectivity):
         # Add more checking?
         if face_edge_connectivity is not None:
-            face_edge_connectivity = np.asarray(face_edge_connectivity,
-                                                dtype=IND_DT)
+            face_edge_connectivity = self._as_index(face_edge_connectivity)
             if face_edge_connectivity.shape != (len(self.faces),
                                                 self.num_vertices):
                 msg = ("face_face_connectivity must be size "
                        "(num_face, {})").format
                 raise ValueError(msg(self.num_vertices))
-        self._face_edge_connectivity = face_edge_connectivity
+        self._set('face_edge_connectivity', face_edge_connectivity)
 
     @face_edge_connectivity.deleter
     def face_edge_connectivity(self):
-        self._face_edge_connectivity = None
+        self._set('face_edge_connectivity', None)
+
+    @property
+    def edge_face_connectivity(self):
+        return self._get('edge_face_connectivity')
+
+    @edge_face_connectivity.setter
+    def edge_face_connectivity(self, edge_face_connectivity):
+        # Add more checking?
+        if edge_face_connectivity is not None:
+            edge_face_connectivity = self._as_index(edge_face_connectivity)
+            if edge_face_connectivity.shape != (len(self.edges), 2):
+                raise ValueError("edge_face_connectivity must be size "
+                                 "(num_edges, 2)")
+        self._set('edge_face_connectivity', edge_face_connectivity)
+
+    @edge_face_connectivity.deleter
+    def edge_face_connectivity(self):
+        self._set('edge_face_connectivity', None)
+
+    @property
+    def face_coordinates(self):
+        return self._get('face_coordinates')
+
+    @face_coordinates.setter
+    def face_coordinates(self, face_coordinates):
+        if face_coordinates is not None:
+            face_coordinates = self._as_coords(face_coordinates)
+        self._set('face_coordinates', face_coordinates)
+
+    @property
+    def edge_coordinates(self):
+        return self._get('edge_coordinates')
+
+    @edge_coordinates.setter
+    def edge_coordinates(self, edge_coordinates):
+        if edge_coordinates is not None:
+            edge_coordinates = self._as_coords(edge_coordinates)
+        self._set('edge_coordinates', edge_coordinates)
+
+    @property
+    def boundary_coordinates(self):
+        return self._get('boundary_coordinates')
+
+    @boundary_coordinates.setter
+    def boundary_coordinates(self, boundary_coordinates):
+        if boundary_coordinates is not None:
+            boundary_coordinates = self._as_coords(boundary_coordinates)
+        self._set('boundary_coordinates', boundary_coordinates)
+
+    @property
+    def index_dtype(self):
+        """
+        The dtype used for the index arrays -- or 'auto' if each gets the
+        smallest dtype that can hold its smallest and largest values.
+        """
+        return self._index_dtype
+
+    @property
+    def node_dtype(self):
+        """
+        The dtype used for the node (and other) coordinates.
+        """
+        return self._node_dtype
+
+    def _as_index(self, indexes):
+        """
+        Converts an index array to the dtype set for this grid.
+        """
+        if not isinstance(self._index_dtype, str):
+            return np.asarray(indexes, dtype=self._index_dtype)
+        indexes = np.asarray(indexes)
+        if indexes.size == 0:
+            return np.asarray(indexes, dtype=index_dtype_for(0, 0))
+        return np.asarray(indexes,
+                          dtype=index_dtype_for(indexes.min(), indexes.max()))
+
+    def _as_coords(self, coords):
+        """
+        Converts a coordinate array to the dtype set for this grid.
+        """
+        return np.asarray(coords, dtype=self._node_dtype)
+
+    def _get(self, name):
+        """
+        Returns one of the grid arrays -- rebuilding it first if it was
+        built from something that has since changed.
+        """
+        if name in self._stale:
+            self._stale.discard(name)
+            getattr(self, _BUILDERS[name])(**self._built[name])
+        return getattr(self, '_' + name)
+
+    def _set(self, name, value, built=None):
+        """
+        Sets one of the grid arrays, and invalidates everything that
+        depends on it -- but only if it has really changed.
+
+        :param built=None: the keyword arguments it was built with, so
+                           that it can be rebuilt the same way. None if
+                           it was passed in by the user.
+        """
+        attr = '_' + name
+        old = getattr(self, attr, None)
+        setattr(self, attr, value)
+        if built is None:
+            self._built.pop(name, None)
+        else:
+            self._built[name] = built
+        self._stale.discard(name)
+        if _really_changed(old, value):
+            self._changed(name)
+
+    def _changed(self, name):
+        """
+        Invalidates everything that depends on name, all the way down.
+
+        Cached search trees, etc. are simply dropped. Arrays that were
+        built by the grid are rebuilt on next access -- or dropped if what
+        they were built from is gone. Connectivity arrays that were passed
+        in are dropped, as there is no way they can still be right. Other
+        arrays that were passed in (edges, coordinates, ...) may carry the
+        user's own definitions, so they are left alone.
+        """
+        gone = getattr(self, '_' + name, None) is None
+        for dep in _DEPENDENTS.get(name, ()):
+            if dep.startswith('_'):
+                setattr(self, dep, None)
+            elif dep in self._built and not gone:
+                if dep not in self._stale:
+                    self._stale.add(dep)
+                    self._changed(dep)
+            elif ((dep in self._built or dep in _CONNECTIVITY) and
+                  getattr(self, '_' + dep, None) is not None):
+                self._set(dep, None)
+
+    def mark_changed(self, name):
+        """
+        Tell the grid that one of its arrays has been changed in place,
+        e.g.::
+
+            grid.nodes[10] = (-70.1, 42.3)
+            grid.mark_changed('nodes')
+
+        so that everything derived from it is rebuilt the next time it
+        is needed.
+
+        :param name: name of the array: 'nodes', 'faces', 'edges', etc.
+
+        Setting a new array (``grid.nodes = new_nodes``) does this for you.
+        """
+        if not hasattr(self, '_' + name) or name.startswith('_'):
+            raise ValueError("UGrid has no array named {!r}".format(name))
+        self._stale.discard(name)
+        self._changed(name)
+
+    def fingerprint(self, workers=None):
+        """
+        A hash of the contents of the grid: its nodes, faces, and the edges
+        and boundaries if they were passed in -- a hex string.
+
+        :param workers=None: number of threads to hash with -- default:
+                             one per cpu.
+
+        Grids with the same fingerprint are the same grid, however they
+        were loaded, and whatever dtypes they are stored in: the indexes
+        are hashed as int64 and the coordinates as float64. What the grid
+        builds from the faces (edges, connectivity, ...) adds nothing, so
+        is left out -- building it doesn't change the fingerprint.
+
+        It is kept until one of the arrays is changed -- if you change one
+        in place, call mark_changed().
+        """
+        if self._fingerprint is None:
+            arrays = [self.nodes, self.faces]
+            for name in ('edges', 'boundaries'):
+                if name not in self._built:
+                    arrays.append(getattr(self, '_' + name))
+                else:
+                    arrays.append(None)
+            dtypes = [np.float64] + [np.int64] * 3
+            self._fingerprint = hash_arrays(arrays, dtypes, workers)
+        return self._fingerprint
+
+    def equals(self, other):
+        """
+        True if the other grid has the same nodes, faces, edges and
+        boundaries as this one -- compared by fingerprint(), so it's
+        quick once they have been computed.
+        """
+        return self.fingerprint() == other.fingerprint()
+
+    @property
+    def node_face_connectivity(self):
+        """
+        The faces around each node, in compressed sparse row (CSR) form:
+
+          (offsets, indices): the faces of node i are
+                              indices[offsets[i]:offsets[i + 1]]
+
+        Built from the faces on first access. Read only. The indices are
+        the grid's index dtype, the offsets are always intp: there are
+        more of the faces around the nodes than there are faces.
+        """
+        if self._node_face_connectivity is None:
+            num_vertices = self.num_vertices
+            nodes = self.faces.ravel()
+            offsets, indices = _csr_from_pairs(
+                nodes, np.arange(len(nodes)) // num_vertices,
+                self._num_nodes_referenced())
+            self._node_face_connectivity = (offsets,
+                                            self._as_index(indices))
+        return self._node_face_connectivity
+
+    @property
+    def node_node_connectivity(self):
+        """
+        The nodes connected to each node by an edge, in compressed sparse
+        row (CSR) form:
+
+          (offsets, indices): the neighbors of node i are
+                              indices[offsets[i]:offsets[i + 1]]
+
+        Built from the faces on first access. Read only. The offsets are
+        intp, as for node_face_connectivity.
+        """
+        if self._node_node_connectivity is None:
+            faces = self.faces
+            num_nodes = self._num_nodes_referenced()
+            keys = np.unique(edge_keys(faces, num_nodes))
+            low, high = key_nodes(keys, num_nodes)
+            offsets, indices = _csr_from_pairs(
+                np.concatenate((low, high)), np.concatenate((high, low)),
+                num_nodes)
+            self._node_node_connectivity = (offsets,
+                                            self._as_index(indices))
+        return self._node_node_connectivity
+
+    def _num_nodes_referenced(self):
+        """
+        The number of nodes, or enough to hold all the node indexes in the
+        faces if there are no nodes.
+        """
+        if self.faces is None:
+            raise ValueError("faces must be defined to build node "
+                             "connectivity")
+        num_nodes = len(self.nodes)
+        if self.faces.size:
+            num_nodes = max(num_nodes, int(self.faces.max()) + 1)
+        return num_nodes
+
+    @property
+    def face_areas(self):
+        """
+        The area of each face.
+
+        Built (planar) on first access -- call build_face_areas() for
+        spherical areas. Kept until the nodes or faces change, then
+        rebuilt the same way. Read only.
+        """
+        if self._get('face_areas') is None:
+            self.build_face_areas()
+        return self._face_areas
+
+    @property
+    def node_areas(self):
+        """
+        The area of the median dual control volume of each node: the part
+        of each face around it that is closer to it than to the other
+        nodes (to the edge midpoints and the face center). They add up to
+        the total of the face_areas.
+
+        Built on first access, from the face_areas. Kept until the nodes
+        or faces change. Read only.
+        """
+        if self._get('node_areas') is None:
+            self.build_node_areas()
+        return self._node_areas
+
+    @property
+    def orientation(self):
+        """
+        Which way the faces are wound: 'ccw' if they are all
+        counter-clockwise, 'cw' if they are all clockwise, or 'mixed'.
+        Faces with no area don't count.
+
+        Kept until the nodes or faces change. Read only -- see
+        orient_faces() to make them all the same.
+        """
+        if self._orientation is None:
+            positive = negative = False
+            for areas in self._signed_face_areas():
+                positive = positive or (areas > 0).any()
+                negative = negative or (areas < 0).any()
+            self._orientation = ('mixed' if positive and negative else
+                                 'cw' if negative else 'ccw')
+        return self._orientation
+
+    def _signed_face_areas(self, chunk_size=CHUNK_SIZE):
+        """
+        Generates the signed areas of the faces, a chunk at a time.
+        """
+        faces = self.faces
+        x = self.nodes[:, 0]
+        y = self.nodes[:, 1]
+        for start in range(0, len(faces), chunk_size):
+            vertices = faces[start:start + chunk_size].T
+            yield _signed_areas(x[vertices], y[vertices])
 
     @property
     def data(self):
@@ -390,7 +1186,8 @@ class UGrid(object):
                 found.add(ds)
         return found
 
-    def locate_nodes(self, points):
+    def locate_nodes(self, points, k=1, return_distances=False,
+                     max_distance=None, workers=None, spherical=False):
         """
         Returns the index of the closest nodes to the input locations.
 
@@ -399,15 +1196,119 @@ class UGrid(object):
         :type point: a (N, 2) ndarray of points
                      (or something that can be converted).
 
-        :returns: the index of the closest node.
+        :param k=1: the number of nodes to find for each point -- if more
+                    than one, they come back nearest first.
 
-        """
-        if self._kdtree is None:
-            self._build_kdtree()
+        :param return_distances=False: if True, return the distances to
+                                       the nodes as well.
+
+        :param max_distance=None: nodes further away than this are not
+                                  found -- their index is -1 (and distance
+                                  inf).
+
+        :param workers=None: number of threads to search with -- default:
+                             scipy's (one). Needs scipy 1.6 or newer
+                             (n_jobs is used for older versions).
 
-        node_inds = self._kdtree.query(points, k=1)[1]
+        :param spherical=False: if True, the nodes and points are (lon, lat)
+                                in degrees, and the distances are great
+                                circle distances, in radians (times the
+                                radius of the sphere for a length).
+
+        :returns: the index of the closest node: one for each point, or
+                  (N, k) if k > 1 -- or a (indices, distances) tuple if
+                  return_distances is True.
+
+        """
+        if spherical:
+            tree = self._get_sphere_kdtree()
+            points = self._unit_points(points)
+            bound = (np.inf if max_distance is None
+                     else _chord_length(max_distance))
+        else:
+            if self._kdtree is None:
+                self._build_kdtree()
+            tree = self._kdtree
+            bound = np.inf if max_distance is None else max_distance
+
+        distances, node_inds = _kdtree_query(tree.query, points, k=k,
+                                             distance_upper_bound=bound,
+                                             workers=workers)
+        if spherical:
+            distances = _chord_angle(distances)
+        # scipy flags the missing ones (too far away, or k more than there
+        # are nodes) with an index of len(nodes)
+        node_inds = np.where(node_inds == len(self.nodes), -1, node_inds)[()]
+        if return_distances:
+            return node_inds, distances
         return node_inds
 
+    def nodes_within(self, points, radius, return_distances=False,
+                     workers=None, spherical=False):
+        """
+        Finds all the nodes within a distance of each point.
+
+        :param points: the lons/lats of the locations
+        :type point: a (N, 2) ndarray of points
+                     (or something that can be converted).
+
+        :param radius: the distance -- the same for all the points, or an
+                       (N,) array of one for each.
+
+        :param return_distances=False: if True, return the distances to
+                                       the nodes as well.
+
+        :param workers=None: number of threads to search with -- default:
+                             scipy's (one).
+
+        :param spherical=False: if True, the nodes and points are (lon, lat)
+                                in degrees, and radius and the distances
+                                are great circle distances, in radians.
+
+        :returns: (offsets, indices) in compressed sparse row (CSR) form:
+                  the nodes near point i are
+                  indices[offsets[i]:offsets[i + 1]], in order of node
+                  index. Or (offsets, indices, distances) if
+                  return_distances is True.
+
+        """
+        if spherical:
+            tree = self._get_sphere_kdtree()
+            points = self._unit_points(points).reshape(-1, 3)
+            radius = _chord_length(radius)
+        else:
+            if self._kdtree is None:
+                self._build_kdtree()
+            tree = self._kdtree
+            points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+        found = _kdtree_query(tree.query_ball_point, points, radius,
+                              workers=workers)
+        counts = np.fromiter((len(nodes) for nodes in found), dtype=np.intp,
+                             count=len(found))
+        offsets = np.zeros(len(points) + 1, dtype=np.intp)
+        np.cumsum(counts, out=offsets[1:])
+        indices = np.fromiter(itertools.chain.from_iterable(found),
+                              dtype=np.intp, count=offsets[-1])
+
+        rows = np.repeat(np.arange(len(points)), counts)
+        # newer scipy sorts them -- older may not
+        keys = rows.astype(np.int64) * len(self.nodes) + indices
+        if np.any(keys[1:] < keys[:-1]):
+            indices = np.sort(keys) % len(self.nodes)
+
+        if return_distances:
+            if spherical:
+                nodes = self._unit_nodes()
+            else:
+                nodes = np.asarray(self.nodes, dtype=np.float64)
+            distances = np.sqrt(sum((nodes[indices, k] - points[rows, k]) ** 2
+                                    for k in range(points.shape[1])))
+            if spherical:
+                distances = _chord_angle(distances)
+            return offsets, indices, distances
+        return offsets, indices
+
     def _build_kdtree(self):
         # Only import if it's used.
         try:
@@ -416,7 +1317,33 @@ class UGrid(object):
             raise ImportError("the scipy package must be installed to use locate_nodes")
         self._kdtree = cKDTree(self.nodes)
 
-    def locate_faces(self, points, method='celltree'):
+    def _unit_nodes(self):
+        """
+        The (lon, lat) nodes as (N, 3) unit vectors -- kept until the nodes
+        change.
+        """
+        if self._node_vectors is None:
+            self._node_vectors = unit_vectors(self.nodes[:, 0],
+                                              self.nodes[:, 1])
+        return self._node_vectors
+
+    @staticmethod
+    def _unit_points(points):
+        points = np.asarray(points, dtype=np.float64)
+        return unit_vectors(points[..., 0], points[..., 1])
+
+    def _get_sphere_kdtree(self):
+        if self._sphere_kdtree is None:
+            try:
+                from scipy.spatial import cKDTree
+            except ImportError:
+                raise ImportError("the scipy package must be installed to "
+                                  "use locate_nodes")
+            self._sphere_kdtree = cKDTree(self._unit_nodes())
+        return self._sphere_kdtree
+
+    def locate_faces(self, points, method='celltree', hint=None,
+                     spherical=False, workers=1):
         """
         Returns the face indices, one per point.
 
@@ -431,44 +1358,183 @@ class UGrid(object):
         :type point: array-like containing one or more points: shape (2,) for one point, shape (N, 2)
                      for more than one point.
 
-        :param method='celltree': method to use. Options are 'celltree', 'simple'. 
+        :param method='celltree': method to use. Options are 'celltree',
+                                  'bins', 'simple'.
                                   for 'celltree' the celltree2d pacakge must be installed:
                                   https://github.com/NOAA-ORR-ERD/cell_tree2d/
-                                  'simple' is very, very slow for large grids.
+                                  'bins' needs nothing but numpy: see
+                                  build_face_bins(). Faces must be convex.
+                                  'simple' checks every face for every point
+                                  (vectorized) -- fine for small grids, but
+                                  slow for large ones.
         :type simple: str
 
+        :param hint=None: the face each point is in, or near, if known --
+                          e.g. where each particle was on the last time
+                          step (-1 if not known). The points walk across
+                          the faces (face_face_connectivity) from there,
+                          so if they are close it's only a few steps. The
+                          ones that don't make it are found with method.
+
+        :param spherical=False: if True, the nodes and points are (lon, lat)
+                                in degrees, and the faces have great circle
+                                sides -- right at the poles and across the
+                                antimeridian. This always uses bins (see
+                                build_face_bins(spherical=True)), whatever
+                                the method.
+
+        :param workers=1: number of threads to search with -- None for
+                          one per cpu. The points are split between them,
+                          all using the same celltree or bins, which are
+                          built first if need be. Only the bins and the
+                          walk (hint) are known to scale with threads.
+
         This version utilizes the CellTree data structure.
 
         """
+        # checked here, as a spherical search or a hint may not use it
+        if method not in ('celltree', 'bins', 'simple'):
+            raise ValueError('"method" must be one of: "celltree", "bins", '
+                             '"simple"')
         points = np.asarray(points, dtype=np.float64)
         just_one = (points.ndim == 1)
         points.shape = (-1, 2)
-        if method == 'celltree':
+        if hint is not None:
+            hint = np.asarray(hint).reshape(-1)
+            if len(hint) != len(points):
+                raise ValueError("there must be one hint per point")
+            # a face that's not in the grid (any more) is no help
+            hint = np.where(hint < len(self.faces), hint, -1)
+
+        workers = cpu_count() if workers is None else max(int(workers), 1)
+        # not worth a thread for fewer points than this
+        num_chunks = min(workers, -(-len(points) // 10000))
+        if num_chunks > 1:
+            # built once, up front, for all the threads to share
+            if hint is not None and self.face_face_connectivity is None:
+                self.build_face_face_connectivity()
+            self._face_index(method, spherical)
+            indices = np.empty(len(points), dtype=np.intp)
+            bounds = np.linspace(0, len(points), num_chunks + 1).astype(int)
+
+            def search(k):
+                chunk = slice(bounds[k], bounds[k + 1])
+                indices[chunk] = self._locate_faces(
+                    points[chunk], method,
+                    None if hint is None else hint[chunk], spherical)
+
+            pool = ThreadPool(num_chunks)
             try:
-                import cell_tree2d
-            except ImportError:
-                raise ImportError("the cell_tree2d package must be installed to use the celltree search:\n"
-                                  "https://github.com/NOAA-ORR-ERD/cell_tree2d/")
-            if self._tree is None:
-                self.build_celltree()
-            indices = self._tree.multi_locate(points)
-        elif method == 'simple':
-            indices = np.zeros((points.shape[0]), dtype=IND_DT)
-            for n, point in enumerate(points):
-                for i, face in enumerate(self._faces):
-                    f = self._nodes[face]
-                    if point_in_tri(f, point):
-                        indices[n] = i
-                        break
-                    else:
-                        indices[n] = -1
+                pool.map(search, range(num_chunks))
+            finally:
+                pool.close()
+                pool.join()
         else:
-            raise ValueError('"method" must be one of: "celltree", "simple"')
+            indices = self._locate_faces(points, method, hint, spherical)
         if just_one:
             return indices[0]
         else:
             return indices
 
+    def _locate_faces(self, points, method, hint, spherical):
+        """
+        The face indices of an (N, 2) array of points -- see locate_faces.
+        """
+        if hint is not None:
+            if self.face_face_connectivity is None:
+                self.build_face_face_connectivity()
+            if spherical:
+                nodes, walkers = self._unit_nodes(), self._unit_points(points)
+            else:
+                nodes, walkers = self.nodes, points
+            indices = locate.walk(nodes, self.faces,
+                                  self.face_face_connectivity, walkers, hint)
+            lost = np.nonzero(indices < 0)[0]
+            if len(lost):
+                indices[lost] = self._locate_faces(points[lost], method,
+                                                   None, spherical)
+            return indices
+
+        self._face_index(method, spherical)
+        if spherical:
+            indices = self._sphere_bins.locate(self._unit_points(points),
+                                               CHUNK_SIZE)
+        elif method == 'celltree':
+            indices = self._tree.multi_locate(points)
+        elif method == 'bins':
+            indices = self._bins.locate(points, CHUNK_SIZE)
+        else:
+            indices = self._locate_faces_simple(points)
+        return indices
+
+    def _locate_faces_simple(self, points):
+        """
+        locate_faces(method='simple'): checks every face for every point --
+        a block of faces at a time, all the points at once.
+
+        Faces with more than three sides are checked as a fan of
+        triangles, so they must be convex.
+        """
+        found = np.empty(len(points), dtype=np.intp)
+        found.fill(-1)
+        faces = self.faces
+        remaining = np.arange(len(points))
+        # the most (point, face) pairs in a block -- the buffers for
+        # points_in_tris are made once, for all of them.
+        size = min(max(CHUNK_SIZE, len(points)), len(points) * len(faces))
+        work = np.empty((10, size))
+        in_tri = np.empty(size, dtype=bool)
+        in_face = np.empty(size, dtype=bool)
+        start = 0
+        while start < len(faces) and len(remaining):
+            block = faces[start:start + max(CHUNK_SIZE // len(remaining), 1)]
+            # every (point, face) pair -- in order of point, then face
+            point_of = np.repeat(remaining, len(block))
+            face_of = np.tile(np.arange(len(block)), len(remaining))
+            pair_faces = block[face_of]
+            num_pairs = len(point_of)
+            inside = in_face[:num_pairs]
+            inside.fill(False)
+            for k in range(1, faces.shape[1] - 1):
+                inside |= points_in_tris(points[point_of], self.nodes,
+                                         pair_faces[:, (0, k, k + 1)],
+                                         out=(in_tri[:num_pairs], None),
+                                         work=work[:, :num_pairs])
+            # the first (lowest numbered) face each point is in
+            hits = point_of[inside]
+            first = np.ones(len(hits), dtype=bool)
+            first[1:] = hits[1:] != hits[:-1]
+            found[hits[first]] = start + face_of[inside][first]
+            remaining = remaining[found[remaining] < 0]
+            start += len(block)
+        return found
+
+    def _face_index(self, method, spherical):
+        """
+        Builds what is used to locate faces with method, if it's not there
+        already.
+        """
+        if spherical:
+            if self._sphere_bins is None:
+                self.build_face_bins(spherical=True)
+        elif method == 'celltree':
+            try:
+                import cell_tree2d  # noqa
+            except ImportError:
+                raise ImportError(
+                    "the cell_tree2d package must be installed to use the "
+                    "celltree search:\n"
+                    "https://github.com/NOAA-ORR-ERD/cell_tree2d/\n"
+                    "or use method='bins', which needs only numpy")
+            if self._tree is None:
+                self.build_celltree()
+        elif method == 'bins':
+            if self._bins is None:
+                self.build_face_bins()
+        elif method != 'simple':
+            raise ValueError('"method" must be one of: "celltree", "bins", '
+                             '"simple"')
+
     def build_celltree(self):
         """
         Tries to build the celltree for the current UGrid. Will fail if nodes
@@ -480,6 +1546,84 @@ class UGrid(object):
                 "Nodes and faces must be defined in order to create and use CellTree")
         self._tree = CellTree(self.nodes, self.faces)
 
+    def build_face_bins(self, faces_per_bin=1.0, chunk_size=CHUNK_SIZE,
+                        spherical=False):
+        """
+        Builds the bins used by locate_faces(method='bins'): a uniform grid
+        of bins over the faces, each holding the faces whose bounding box
+        overlaps it.
+
+        :param faces_per_bin=1.0: about how many faces to put in each bin:
+                                  more makes the bins smaller in memory,
+                                  but slower to search.
+        :param chunk_size=CHUNK_SIZE: number of faces to work on at once.
+
+        :param spherical=False: if True, build the bins used by
+                                locate_faces(spherical=True) instead: the
+                                (lon, lat) faces on a sphere, binned on
+                                the six sides of a cube around it. The
+                                faces must be less than about 30 degrees
+                                across.
+
+        Built for you the first time it's needed, and kept until the nodes
+        or faces change.
+        """
+        if self.nodes is None or self.faces is None:
+            raise ValueError("Nodes and faces must be defined in order to "
+                             "bin the faces")
+        if spherical:
+            self._sphere_bins = locate.SphereBins(self._unit_nodes(),
+                                                  self.faces, faces_per_bin,
+                                                  chunk_size)
+        else:
+            self._bins = locate.FaceBins(self.nodes, self.faces,
+                                         faces_per_bin, chunk_size)
+
+    def save_cache(self, directory, max_size=None, max_age=None):
+        """
+        Saves the search trees and connectivity that have been built for
+        this grid to a cache directory, so other processes using the same
+        grid can load them (load_cache()) rather than build them again.
+
+        :param directory: the cache directory -- created if need be.
+
+        :param max_size=None: the most bytes to keep in the cache -- the
+                              least recently used grids are removed.
+        :param max_age=None: remove grids not used in this many seconds.
+
+        :returns: list of the names of what was saved.
+
+        The entry is keyed by the grid's fingerprint() and index dtype, so
+        a grid that has changed gets a new one. Trees that can't be pickled
+        (some versions of the celltree) are skipped.
+
+        NOTE: the trees are pickled -- only use a directory you trust.
+        """
+        if self.nodes is None or self.faces is None:
+            raise ValueError("Nodes and faces must be defined in order to "
+                             "cache what is built from them")
+        saved = cache.save(self, directory)
+        if max_size is not None or max_age is not None:
+            cache.evict(directory, max_size, max_age)
+        return saved
+
+    def load_cache(self, directory):
+        """
+        Loads the search trees and connectivity saved for this grid by
+        save_cache() -- only what the grid doesn't already have.
+
+        :param directory: the cache directory
+
+        :returns: list of the names of what was loaded -- empty if nothing
+                  was saved for this grid.
+
+        The arrays are memory-mapped, so only read from disk as they are
+        used.
+        """
+        if self.nodes is None or self.faces is None:
+            return []
+        return cache.load(self, directory)
+
     def interpolation_alphas(self, points, indices=None):
         """
         Given an array of points, this function will return the bilinear interpolation alphas
@@ -545,7 +1689,45 @@ class UGrid(object):
         """
         Builds the face_face_connectivity array: giving the neighbors of each triangle.
 
-        Note: arbitrary order and CW vs CCW may not be consistent.
+        Every edge of every face is packed into a single key, and
+        the keys are sorted, so that faces sharing an edge end up next to
+        each other. Edges with no match are on the boundary and get -1.
+
+        Note: arbitrary order and CW vs CCW may not be consistent -- use
+        orient_faces() first if that matters.
+        """
+        num_faces, num_vertices = self.faces.shape
+        keys = edge_keys(self.faces).ravel()
+
+        # A stable sort keeps the faces that share an edge in face order,
+        # so the pairing is the same as walking the faces one at a time.
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+
+        # position of each sorted edge within its run of identical edges
+        positions = np.arange(len(keys))
+        run_start = np.ones(len(keys), dtype=bool)
+        run_start[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        rank = positions - np.maximum.accumulate(np.where(run_start,
+                                                          positions, 0))
+        # pair up the 1st and 2nd occurrence, the 3rd and 4th, etc.
+        second = order[rank % 2 == 1]
+        first = order[np.nonzero(rank % 2 == 1)[0] - 1]
+
+        face_face = np.empty((num_faces, num_vertices), dtype=np.intp)
+        face_face.fill(-1)
+        face_face.flat[second] = first // num_vertices
+        face_face.flat[first] = second // num_vertices
+        self._set('face_face_connectivity', self._as_index(face_face),
+                  built={})
+
+    def _build_face_face_connectivity_loop(self):
+        """
+        Reference (pure python) version of build_face_face_connectivity.
+
+        Very slow for large grids -- kept to check the vectorized version.
+
+        Returns the face_face_connectivity array, rather than setting it.
         """
 
         num_vertices = self.num_vertices
@@ -572,34 +1754,33 @@ class UGrid(object):
                     face_face[face_num, edge_num] = i
                 else:
                     edges[edge] = (i, j)  # face num, edge_num.
-        self._face_face_connectivity = face_face
+        return face_face
 
-    def build_edges(self):
+    def build_edges(self, edge_face=False):
         """
         Builds the edges array: all the edges defined by the triangles
 
         This will replace the existing edge array, if there is one.
 
-        NOTE: arbitrary order -- should the order be preserved?
-        """
+        The face_edge_connectivity is built at the same time (it comes for
+        free, and would not match the new edges anyway).
 
-        num_vertices = self.num_vertices
-        num_faces = self.faces.shape[0]
-        face_face = np.zeros((num_faces, num_vertices), dtype=IND_DT)
-        face_face += -1  # Fill with -1.
+        :param edge_face=False: if True, the edge_face_connectivity is
+                                built as well.
 
-        # Loop through all the faces to find all the edges:
-        edges = set()  # Use a set so no duplicates.
-        for i, face in enumerate(self.faces):
-            # Loop through edges:
-            for j in range(num_vertices):
-                edge = (face[j - 1], face[j])
-                if edge[0] > edge[1]:  # Flip them
-                    edge = (edge[1], edge[0])
-                edges.add(edge)
-        self._edges = np.array(list(edges), dtype=IND_DT)
-
-    def build_boundaries(self):
+        The edges are sorted by node index, so the order is deterministic.
+        """
+        edges, face_edge, edge_faces = _build_edge_topology(self.faces,
+                                                            edge_face)
+        self._set('edges', self._as_index(edges),
+                  built={'edge_face': edge_face})
+        self._set('face_edge_connectivity', self._as_index(face_edge),
+                  built={})
+        if edge_face:
+            self._set('edge_face_connectivity', self._as_index(edge_faces),
+                      built={})
+
+    def build_boundaries(self, ordered=False):
         """
         Builds the boundary segments from the cell array.
 
@@ -607,73 +1788,193 @@ class UGrid(object):
 
         This will over-write the existing boundaries array if there is one.
 
-        This is a not-very-smart just loop through all the faces method.
+        :param ordered=False: if True, the segments are ordered ring by
+                              ring, as returned by boundary_rings(), so
+                              that each segment ends where the next starts.
+
+        The segments keep the winding of the face they belong to.
 
         """
-        boundaries = []
-        for i, face in enumerate(self.face_face_connectivity):
-            for j, neighbor in enumerate(face):
-                if neighbor == -1:
-                    if j == self.num_vertices - 1:
-                        bound = (self.faces[i, -1], self.faces[i, 0])
-                    else:
-                        bound = (self.faces[i, j], self.faces[i, j + 1])
-                    boundaries.append(bound)
-        self.boundaries = boundaries
+        if self.face_face_connectivity is None:
+            self.build_face_face_connectivity()
+        if ordered:
+            rings, orientation = self.boundary_rings()
+            starts = (np.concatenate(rings) if rings
+                      else np.zeros((0,), np.intp))
+            ends = (np.concatenate([np.roll(ring, -1) for ring in rings])
+                    if rings else starts)
+            boundaries = np.column_stack((starts, ends))
+        else:
+            boundaries = self._boundary_segments()
+        self._set('boundaries', self._as_index(boundaries),
+                  built={'ordered': ordered})
+
+    def _boundary_segments(self):
+        """
+        The (start, end) nodes of all the face edges with no neighbor.
+        """
+        num_vertices = self.num_vertices
+        face_ind, vert_ind = np.nonzero(self.face_face_connectivity == -1)
+        return np.column_stack((self.faces[face_ind, vert_ind],
+                                self.faces[face_ind,
+                                           (vert_ind + 1) % num_vertices]))
+
+    def boundary_rings(self):
+        """
+        Joins the boundary segments into closed rings.
+
+        :returns: rings, orientation
+
+          rings: list of arrays of node indexes, one for each ring, in order
+                 around the ring. The ring is closed: the last node connects
+                 back to the first.
+
+          orientation: array with one value per ring: 1 for counter-clockwise,
+                       -1 for clockwise.
+
+        The rings are sorted by the area they enclose, largest first, so
+        for a single connected mesh the outer boundary comes first, and the
+        islands after that. With counter-clockwise faces, the outer
+        boundary is counter-clockwise, and the islands clockwise.
+
+        Raises a ValueError if the faces are not consistently wound, as the
+        segments can not be joined up then.
+        """
+        if self.face_face_connectivity is None:
+            self.build_face_face_connectivity()
+        segments = self._boundary_segments()
+        if len(segments) == 0:
+            return [], np.zeros((0,), dtype=np.int8)
+
+        ring_id, ring_pos = _order_segment_rings(segments)
+        order = np.lexsort((ring_pos, ring_id))
+        ring_nodes = segments[order, 0]
+        ring_ids = ring_id[order]
+
+        cuts = np.nonzero(ring_ids[1:] != ring_ids[:-1])[0] + 1
+        starts = np.concatenate(([0], cuts))
+
+        # twice the signed area of each ring (shoelace formula)
+        x, y = self.nodes[ring_nodes].T
+        x_next, y_next = self.nodes[segments[order, 1]].T
+        areas = np.add.reduceat(x * y_next - x_next * y, starts)
+
+        rings = np.split(ring_nodes, cuts)
+        by_size = np.argsort(-np.abs(areas), kind='stable')
+        rings = [rings[i] for i in by_size]
+        orientation = np.where(areas[by_size] >= 0, 1, -1).astype(np.int8)
+        return rings, orientation
 
     def build_face_edge_connectivity(self):
         """
-        Builds the face-edge connectivity array
+        Builds the face-edge connectivity array: the index of the edges
+        of each face.  Edge j of a face runs from vertex j to vertex j + 1.
 
-        Not implemented yet.
+        If there is no edges array, it is built as well. If there is one,
+        it is used as is -- a ValueError is raised if it does not hold all
+        the edges of the faces.
 
         """
-        raise NotImplementedError
+        if self.edges is None:
+            self.build_edges()
+            return
+        msg = "edges array does not hold all the edges of the faces"
+        if len(self.edges) == 0:
+            raise ValueError(msg)
+        edges = self.edges
+        num_nodes = max(int(self.faces.max()), int(edges.max())) + 1
+        keys = edge_keys(self.faces, num_nodes)
+        edge_ids = segment_keys(edges[:, 0], edges[:, 1], num_nodes)
+        order = np.argsort(edge_ids, kind='stable')
+        pos = np.searchsorted(edge_ids, keys, sorter=order)
+        pos[pos == len(order)] = 0
+        face_edge = order[pos]
+        if not np.array_equal(edge_ids[face_edge], keys):
+            raise ValueError(msg)
+        self._set('face_edge_connectivity', self._as_index(face_edge),
+                  built={})
+
+    def build_edge_face_connectivity(self):
+        """
+        Builds the edge-face connectivity array: the two faces on either
+        side of each edge, -1 for an edge on the boundary.
+
+        The face_edge_connectivity is used (built if need be) so that this
+        matches the existing edges array.
 
-    def build_face_coordinates(self):
+        """
+        if self.face_edge_connectivity is None:
+            self.build_face_edge_connectivity()
+        edge_faces = _edge_face_from_face_edge(self.face_edge_connectivity,
+                                               len(self.edges))
+        self._set('edge_face_connectivity', self._as_index(edge_faces),
+                  built={})
+
+    def build_face_coordinates(self, method='mean', chunk_size=CHUNK_SIZE):
         """
         Builds the face_coordinates array, using the average of the
-        nodes defining each face.
+        nodes defining each face by default.
 
         Note that you may want a different definition of the face
         coordinates than this computes, but this is here to have
         an easy default.
 
+        :param method='mean': which definition of the face center to use:
+                              'mean': the average of the nodes
+                              'centroid': the center of area
+                              'circumcenter': the center of the circle
+                                              through the nodes (triangles
+                                              only)
+                              'incenter': the center of the circle
+                                          inscribed in the triangle
+                                          (triangles only)
+        :type method: string
+
+        :param chunk_size=CHUNK_SIZE: number of faces to work on at once --
+                                      keeps the temporary arrays small for
+                                      very large grids.
+
         This will write-over an existing face_coordinates array.
 
         Useful if you want this in the output file.
 
         """
-        face_coordinates = np.zeros((len(self.faces), 2), dtype=NODE_DT)
-        # FIXME: there has got to be a way to vectorize this.
-        for i, face in enumerate(self.faces):
-            coords = self.nodes[face]
-            face_coordinates[i] = coords.mean(axis=0)
-        self.face_coordinates = face_coordinates
-
-    def build_edge_coordinates(self):
+        if method not in _face_center_methods:
+            raise ValueError('"method" must be one of: {}'.format(
+                ", ".join(sorted(_face_center_methods))))
+        if (method in ('circumcenter', 'incenter') and
+           self.num_vertices != 3):
+            raise ValueError('The {} is only defined for '
+                             'triangles'.format(method))
+        center = _face_center_methods[method]
+        faces = self.faces
+        face_coordinates = np.empty((len(faces), 2), dtype=self._node_dtype)
+        for start in range(0, len(faces), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            face_coordinates[chunk] = center(self.nodes[faces[chunk]])
+        self._set('face_coordinates', face_coordinates,
+                  built={'method': method})
+
+    def build_edge_coordinates(self, chunk_size=CHUNK_SIZE):
         """
-        Builds the face_coordinates array, using the average of the
+        Builds the edge_coordinates array, using the average of the
         nodes defining each edge.
 
         Note that you may want a different definition of the edge
         coordinates than this computes, but this is here to have
         an easy default.
 
+        :param chunk_size=CHUNK_SIZE: number of edges to work on at once.
 
-        This will write-over an existing face_coordinates array
+        This will write-over an existing edge_coordinates array
 
         Useful if you want this in the output file
 
         """
-        edge_coordinates = np.zeros((len(self.edges), 2), dtype=NODE_DT)
-        # FIXME: there has got to be a way to vectorize this.
-        for i, edge in enumerate(self.edges):
-            coords = self.nodes[edge]
-            edge_coordinates[i] = coords.mean(axis=0)
-        self.edge_coordinates = edge_coordinates
+        midpoints = _segment_midpoints(self.nodes, self.edges, chunk_size)
+        self._set('edge_coordinates', self._as_coords(midpoints), built={})
 
-    def build_boundary_coordinates(self):
+    def build_boundary_coordinates(self, chunk_size=CHUNK_SIZE):
         """
         Builds the boundary_coordinates array, using the average of the
         nodes defining each boundary segment.
@@ -682,18 +1983,508 @@ class UGrid(object):
         coordinates than this computes, but this is here to have
         an easy default.
 
-        This will write-over an existing face_coordinates array
+        :param chunk_size=CHUNK_SIZE: number of segments to work on at once.
+
+        This will write-over an existing boundary_coordinates array
 
         Useful if you want this in the output file
 
         """
-        boundary_coordinates = np.zeros((len(self.boundaries), 2),
-                                        dtype=NODE_DT)
-        # FXIME: there has got to be a way to vectorize this.
-        for i, bound in enumerate(self.boundaries):
-            coords = self.nodes[bound]
-            boundary_coordinates[i] = coords.mean(axis=0)
-        self.boundary_coordinates = boundary_coordinates
+        midpoints = _segment_midpoints(self.nodes, self.boundaries,
+                                       chunk_size)
+        self._set('boundary_coordinates', self._as_coords(midpoints),
+                  built={})
+
+    def orient_faces(self, ccw=True, chunk_size=CHUNK_SIZE):
+        """
+        Winds all the faces the same way, by reversing the order of the
+        nodes of the ones that are wound the other way -- in place.
+
+        :param ccw=True: if True, the faces are made counter-clockwise,
+                         otherwise clockwise.
+        :param chunk_size=CHUNK_SIZE: number of faces to work on at once.
+
+        :returns: the indexes of the faces that were flipped.
+
+        The first node of each face is kept first, so the edges are
+        simply reversed: the face_face_connectivity and
+        face_edge_connectivity are reversed to match, rather than rebuilt.
+        The search trees and the fingerprint() are dropped, and boundaries
+        built from the faces are rebuilt; nothing else that depends on the
+        faces is changed by this.
+
+        Faces with no area are left alone.
+        """
+        if self.faces is None:
+            raise ValueError("faces must be defined to orient them")
+        flip = np.concatenate(
+            [areas < 0 if ccw else areas > 0
+             for areas in self._signed_face_areas(chunk_size)] or
+            [np.zeros((0,), dtype=bool)])
+        flipped = np.nonzero(flip)[0]
+        if len(flipped):
+            num_vertices = self.num_vertices
+            # (0, n - 1, ..., 1): new edge j is old edge n - 1 - j
+            node_order = np.roll(np.arange(num_vertices)[::-1], 1)
+            self._faces[flipped] = self._faces[flipped][:, node_order]
+            for name in ('face_face_connectivity', 'face_edge_connectivity'):
+                array = getattr(self, '_' + name)
+                if array is not None and name not in self._stale:
+                    array[flipped] = array[flipped][:, ::-1]
+            # the faces are not the same ones any more: what was built
+            # from (or keyed on) them has to go.
+            self._tree = None
+            self._bins = None
+            self._sphere_bins = None
+            self._fingerprint = None
+            if self._boundaries is not None and 'boundaries' in self._built:
+                self._stale.add('boundaries')
+                self._changed('boundaries')
+        self._orientation = 'ccw' if ccw else 'cw'
+        return flipped
+
+    def build_face_areas(self, spherical=False, radius=EARTH_RADIUS,
+                         chunk_size=CHUNK_SIZE):
+        """
+        Builds the face_areas array.
+
+        :param spherical=False: if True, the nodes are (lon, lat) in
+                                degrees, and the areas are of the faces on
+                                a sphere, with great circle sides.
+        :param radius=EARTH_RADIUS: the radius of the sphere -- the default
+                                    is the mean radius of the Earth, in
+                                    meters.
+        :param chunk_size=CHUNK_SIZE: number of faces to work on at once.
+        """
+        if self.faces is None:
+            raise ValueError("faces must be defined to compute areas")
+        faces = self.faces
+        areas = np.empty((len(faces),), dtype=self._node_dtype)
+        if spherical:
+            # once for each node, rather than for each face it is on
+            coords = self._unit_nodes().T
+        else:
+            coords = (self.nodes[:, 0], self.nodes[:, 1])
+        for start in range(0, len(faces), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            # one contiguous array for each vertex is faster to work on
+            vertices = faces[chunk].T
+            points = [coord[vertices] for coord in coords]
+            if spherical:
+                areas[chunk] = _spherical_areas(*points, radius=radius)
+            else:
+                areas[chunk] = np.abs(_signed_areas(*points))
+        self._set('face_areas', areas,
+                  built={'spherical': spherical, 'radius': radius,
+                         'chunk_size': chunk_size})
+
+    def build_node_areas(self, chunk_size=CHUNK_SIZE):
+        """
+        Builds the node_areas array: each face's area (from face_areas) is
+        shared out between its nodes in proportion to their median dual
+        areas -- a third each for a triangle.
+
+        :param chunk_size=CHUNK_SIZE: number of faces to work on at once.
+        """
+        face_areas = self.face_areas
+        faces = self.faces
+        node_areas = np.zeros((len(self.nodes),), dtype=np.float64)
+        for start in range(0, len(faces), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            shares = (_median_dual_fractions(self.nodes[faces[chunk]]) *
+                      face_areas[chunk, None])
+            node_areas += np.bincount(faces[chunk].ravel(),
+                                      weights=shares.ravel(),
+                                      minlength=len(node_areas))
+        self._set('node_areas', self._as_coords(node_areas),
+                  built={'chunk_size': chunk_size})
+
+    def connected_components(self):
+        """
+        Labels the pieces of the grid that are not connected to each other:
+        islands, stray faces, separately meshed lakes, etc.
+
+        Faces are connected if they share an edge (see
+        face_face_connectivity) -- faces that only touch at a node are in
+        separate pieces.
+
+        :returns: (num_faces,) array of the component each face is in,
+                  numbered from 0 in order of their first face.
+        """
+        if self.face_face_connectivity is None:
+            self.build_face_face_connectivity()
+        face_face = np.asarray(self.face_face_connectivity, dtype=np.intp)
+        num_faces, num_vertices = face_face.shape
+        faces = np.repeat(np.arange(num_faces), num_vertices)
+        neighbors = face_face.ravel()
+        links = faces < neighbors  # each link once, and not the -1s
+        label = component_labels(num_faces, faces[links], neighbors[links])
+        is_first = label == np.arange(num_faces)
+        return (np.cumsum(is_first) - 1)[label]
+
+    def face_coloring(self):
+        """
+        Colors the faces so that no two faces of the same color share a
+        node: the faces of one color can then be worked on in parallel,
+        scattering to their nodes with no races -- see sum_to_nodes().
+
+        :returns: (num_faces,) array of the color of each face, numbered
+                  from 0. There are at least as many colors as the most
+                  faces around any one node, and at most one more than the
+                  most faces any face shares a node with.
+
+        Greedy (Jones-Plassmann), in vectorized passes: each pass, the
+        faces that have the highest (random) priority of the uncolored
+        faces around all of their nodes take the lowest color not yet
+        used at any of their nodes. No two of them share a node, so they
+        can all be colored at once. The colors used at each node are kept
+        as bit masks.
+
+        Cached until the faces change.
+        """
+        if self._face_coloring is None:
+            faces = self.faces
+            num_faces, num_vertices = faces.shape
+            num_nodes = self._num_nodes_referenced()
+            priority = np.random.RandomState(0).permutation(num_faces)
+            colors = np.empty(num_faces, dtype=np.intp)
+            # bit c of word w: color 64 * w + c is used at the node.
+            used = np.zeros((num_nodes, 1), dtype=np.uint64)
+            all_used = ~np.uint64(0)
+            uncolored = np.arange(num_faces)
+            while len(uncolored):
+                nodes = faces[uncolored]
+                best = np.empty(num_nodes, dtype=np.intp)
+                best.fill(-1)
+                np.maximum.at(best, nodes.ravel(),
+                              np.repeat(priority[uncolored], num_vertices))
+                chosen = (best[nodes] == priority[uncolored, None]).all(axis=1)
+                nodes = nodes[chosen]
+                taken = np.bitwise_or.reduce(used[nodes], axis=1)
+                if (taken == all_used).all(axis=1).any():
+                    # more than 64 * words colors around a node
+                    used = np.column_stack((used, np.zeros(num_nodes,
+                                                           np.uint64)))
+                    taken = np.bitwise_or.reduce(used[nodes], axis=1)
+                word = np.argmin(taken == all_used, axis=1)
+                taken = taken[np.arange(len(taken)), word]
+                free = ~taken & (taken + np.uint64(1))  # lowest zero bit
+                bit = np.log2(free.astype(np.float64)).astype(np.intp)
+                colors[uncolored[chosen]] = word * 64 + bit
+                used[nodes, word[:, None]] |= free[:, None]
+                uncolored = uncolored[~chosen]
+            self._face_coloring = self._as_index(colors)
+        return self._face_coloring
+
+    def sum_to_nodes(self, values, workers=None):
+        """
+        Adds up values on the faces at each node: each face adds to all
+        of its nodes.
+
+        :param values: (num_faces,) array of a value for each face, or
+                       (num_faces, num_vertices) array of a value for
+                       each node of each face.
+        :param workers=None: number of threads to use -- default: one per
+                             cpu. The faces are split up by
+                             face_coloring(), so there are no races.
+
+        :returns: (num_nodes,) array of the sums
+        """
+        values = np.asarray(values)
+        out = np.zeros(len(self.nodes), dtype=values.dtype)
+        return colored_scatter_add(out, self.faces, values,
+                                   self.face_coloring(), workers)
+
+    def drop_small_components(self, min_faces, copy=True):
+        """
+        Makes a new grid without the pieces of this one that have fewer
+        than min_faces faces -- see connected_components().
+
+        :param min_faces: the smallest number of faces in a piece to keep.
+        :param copy=True: if False, the new grid shares memory with this
+                          one where it can -- see subset().
+
+        :returns: grid, maps: the new grid, and a dict of the index in this
+                  grid of each node, face, edge and boundary of the new one,
+                  as from subset().
+        """
+        labels = self.connected_components()
+        sizes = np.bincount(labels)
+        return self.subset(faces=sizes[labels] >= min_faces, copy=copy)
+
+    def partition(self, num_parts, method='rcb', halo=0):
+        """
+        Splits the grid into a number of spatially compact parts, so that
+        work on it can be spread across processes.
+
+        :param num_parts: the number of parts.
+
+        :param method='rcb': how to split the faces:
+                             'rcb': recursive coordinate bisection of the
+                                    face centers.
+                             'graph': recursive bisection of the face graph
+                                      (face_face_connectivity), by breadth
+                                      first search.
+        :type method: string
+
+        :param halo=0: the number of layers of neighboring faces (sharing a
+                       node) to add to each part.
+
+        :returns: list of Partition namedtuples: (grid, node_map, face_map,
+                  num_owned). The grid of each part has its own faces first,
+                  then the halo. node_map and face_map give the index in
+                  this grid of each node and face of the part.
+
+        The data on the nodes and faces comes along with each part.
+        """
+        return partition.partition_grid(self, num_parts, method, halo)
+
+    def subset(self, bbox=None, polygon=None, faces=None, copy=True):
+        """
+        Cuts out part of the grid as a new grid.
+
+        :param bbox=None: (min_lon, min_lat, max_lon, max_lat) bounding box
+        :param polygon=None: (N, 2) array of the vertices of a polygon
+        :param faces=None: indexes of the faces wanted, or a boolean array
+                           flagging them.
+
+        The faces selected are the ones with all their nodes in the bounding
+        box and the polygon (if given), out of the faces given (if given).
+
+        :param copy=True: if False, the new grid shares memory with this
+                          one where it can -- for contiguous runs of faces,
+                          nodes, etc. -- so changing one may change the
+                          other.
+
+        :returns: grid, maps: the new grid, and a dict of the index in this
+                  grid of each node, face, edge and boundary of the new one:
+                  {'node': node_map, 'face': face_map, ...}
+
+        The nodes are renumbered, the connectivity remapped (neighbors
+        that are not in the new grid become -1), and the data sliced along
+        with it.
+        """
+        selected = np.ones(len(self.faces), dtype=bool)
+        if faces is not None:
+            faces = np.asarray(faces)
+            if faces.dtype == bool:
+                selected &= faces
+            else:
+                mask = np.zeros(len(self.faces), dtype=bool)
+                mask[faces] = True
+                selected &= mask
+        if bbox is not None or polygon is not None:
+            # check the nodes once, rather than once for each face.
+            nodes_in = np.ones(len(self.nodes), dtype=bool)
+            if bbox is not None:
+                min_lon, min_lat, max_lon, max_lat = bbox
+                nodes_in &= ((self.nodes[:, 0] >= min_lon) &
+                             (self.nodes[:, 0] <= max_lon) &
+                             (self.nodes[:, 1] >= min_lat) &
+                             (self.nodes[:, 1] <= max_lat))
+            if polygon is not None:
+                candidates = np.nonzero(nodes_in)[0]
+                nodes_in[candidates] = points_in_polygon(
+                    self.nodes[candidates], polygon)
+            selected &= nodes_in[self.faces].all(axis=1)
+        return self._extract(np.nonzero(selected)[0], copy=copy)
+
+    def _extract(self, face_indexes, copy=True):
+        """
+        Builds a new grid out of some of the faces of this one.
+
+        :param face_indexes: indexes of the faces wanted, in the order
+                             wanted.
+
+        :param copy=True: if False, contiguous runs of indexes are
+                          sliced as views, rather than copied.
+
+        :returns: grid, maps: the new grid, and a dict of the index in this
+                  grid of each node, face, edge and boundary of the new one:
+                  {'node': node_map, 'face': face_map, ...}
+
+        The nodes are renumbered to just the ones used, and all the
+        connectivity is remapped -- neighbors that are not in the new grid
+        become -1. The edges and boundaries are the ones along the faces
+        wanted, and the data is sliced to match.
+        """
+        def take(array, index):
+            """array[index] -- as a view if it can be"""
+            if (not copy and len(index) and
+               index[-1] - index[0] == len(index) - 1 and
+               np.all(np.diff(index) == 1)):
+                return array[index[0]:index[-1] + 1]
+            return array[index]
+
+        face_map = np.asarray(face_indexes, dtype=np.intp)
+        faces = take(self.faces, face_map)
+        used = np.zeros(len(self.nodes), dtype=bool)
+        used[faces] = True
+        node_map = np.nonzero(used)[0]
+        node_rank = np.empty(len(self.nodes), dtype=np.intp)
+        node_rank[node_map] = np.arange(len(node_map))
+        face_rank = np.empty(len(self.faces) + 1, dtype=np.intp)
+        face_rank.fill(-1)  # and face_rank[-1] keeps -1 flags as -1
+        face_rank[face_map] = np.arange(len(face_map))
+
+        maps = {'node': node_map, 'face': face_map}
+        arrays = {'nodes': take(self.nodes, node_map)}
+        if len(node_map) and node_map[-1] - node_map[0] == len(node_map) - 1:
+            # a contiguous run of nodes: renumbering is just a shift
+            arrays['faces'] = faces - node_map[0] if node_map[0] else faces
+        else:
+            arrays['faces'] = node_rank[faces]
+        if self.face_face_connectivity is not None:
+            arrays['face_face_connectivity'] = face_rank[
+                take(self.face_face_connectivity, face_map)]
+        if self.face_coordinates is not None:
+            arrays['face_coordinates'] = take(self.face_coordinates, face_map)
+
+        # the edges and boundaries that are on the faces wanted
+        num_nodes = len(self.nodes)
+        face_keys = None
+        for name, location in (('edges', 'edge'), ('boundaries', 'boundary')):
+            segments = getattr(self, name)
+            if segments is None:
+                continue
+            if face_keys is None:
+                face_keys = np.unique(edge_keys(faces, num_nodes))
+            keys = segment_keys(segments[:, 0], segments[:, 1], num_nodes)
+            segment_map = np.nonzero(np.isin(keys, face_keys))[0]
+            maps[location] = segment_map
+            arrays[name] = node_rank[segments[segment_map]]
+            coords = getattr(self, location + '_coordinates')
+            if coords is not None:
+                arrays[location + '_coordinates'] = take(coords, segment_map)
+
+        if 'edge' in maps:
+            edge_map = maps['edge']
+            edge_rank = np.empty(len(self.edges), dtype=np.intp)
+            edge_rank[edge_map] = np.arange(len(edge_map))
+            if self.face_edge_connectivity is not None:
+                arrays['face_edge_connectivity'] = edge_rank[
+                    take(self.face_edge_connectivity, face_map)]
+            if self.edge_face_connectivity is not None:
+                arrays['edge_face_connectivity'] = face_rank[
+                    self.edge_face_connectivity[edge_map]]
+
+        grid = type(self)(mesh_name=self.mesh_name,
+                          index_dtype=self._index_dtype,
+                          node_dtype=self._node_dtype,
+                          **arrays)
+        for uvar in self._data.values():
+            data = take(np.asarray(uvar.data), maps[uvar.location])
+            grid.add_data(UVar(uvar.name, uvar.location, data=data,
+                               attributes=dict(uvar.attributes)))
+        return grid, maps
+
+    def reorder(self, method='hilbert'):
+        """
+        Reorders the nodes and faces so that ones close together in space
+        are close together in memory -- this can make a big difference to
+        the speed of interpolation, locating points, etc. on grids that
+        come out of the mesh generator in effectively random order.
+
+        :param method='hilbert': how to order the nodes:
+                                 'hilbert': along a Hilbert space filling
+                                            curve.
+                                 'rcm': reverse Cuthill-McKee ordering of
+                                        the node graph -- scipy must be
+                                        installed.
+        :type method: string
+
+        :returns: node_order, face_order: the permutations used. For any
+                  array of data on the old nodes: new_data = data[node_order]
+                  and the same for faces.
+
+        All the connectivity arrays are remapped, and the data on the nodes
+        and faces is permuted to match. The edges and boundaries keep their
+        order: only the node indexes in them are changed.
+        """
+        if method == 'hilbert':
+            node_order = np.argsort(hilbert_index(self.nodes), kind='stable')
+        elif method == 'rcm':
+            node_order = self._rcm_node_order()
+        else:
+            raise ValueError('"method" must be one of: "hilbert", "rcm"')
+
+        # new index of each old node
+        node_rank = np.empty(len(node_order), dtype=np.intp)
+        node_rank[node_order] = np.arange(len(node_order))
+
+        # pull these through now, so nothing is rebuilt from the new
+        # nodes and faces that can simply be remapped.
+        names = ('edges', 'face_face_connectivity', 'boundaries',
+                 'face_edge_connectivity', 'edge_face_connectivity',
+                 'face_coordinates', 'edge_coordinates',
+                 'boundary_coordinates')
+        arrays = dict((name, getattr(self, name)) for name in names)
+        built = dict((name, self._built.get(name)) for name in names)
+
+        if self.faces is None:
+            face_order = np.zeros((0,), dtype=np.intp)
+            faces = None
+        else:
+            faces = node_rank[self.faces]
+            if method == 'hilbert':
+                # faces along the same curve, through their centers
+                key = hilbert_index(self.nodes[self.faces].mean(axis=1))
+            else:
+                # faces in the order of their lowest new node
+                key = faces.min(axis=1)
+            face_order = np.argsort(key, kind='stable')
+            faces = faces[face_order]
+        face_rank = np.empty(len(face_order) + 1, dtype=np.intp)
+        face_rank[face_order] = np.arange(len(face_order))
+        face_rank[-1] = -1  # so -1 for no neighbor stays -1
+
+        self.nodes = self.nodes[node_order]
+        self.faces = faces
+
+        remapped = {'edges': lambda a: node_rank[a],
+                    'boundaries': lambda a: node_rank[a],
+                    'face_face_connectivity':
+                        lambda a: face_rank[a[face_order]],
+                    'face_edge_connectivity': lambda a: a[face_order],
+                    'edge_face_connectivity': lambda a: face_rank[a],
+                    'face_coordinates': lambda a: a[face_order],
+                    'edge_coordinates': lambda a: a,
+                    'boundary_coordinates': lambda a: a,
+                    }
+        for name in names:
+            if arrays[name] is not None:
+                array = remapped[name](arrays[name])
+                if name.endswith('coordinates'):
+                    array = self._as_coords(array)
+                else:
+                    array = self._as_index(array)
+                self._set(name, array, built=built[name])
+
+        for uvar in self._data.values():
+            if uvar.location == 'node':
+                uvar.data = np.asarray(uvar.data)[node_order]
+            elif uvar.location == 'face':
+                uvar.data = np.asarray(uvar.data)[face_order]
+        return node_order, face_order
+
+    def _rcm_node_order(self):
+        """
+        Reverse Cuthill-McKee ordering of the nodes, from the
+        node_node_connectivity.
+        """
+        try:
+            from scipy.sparse import csr_matrix
+            from scipy.sparse.csgraph import reverse_cuthill_mckee
+        except ImportError:
+            raise ImportError("the scipy package must be installed to use "
+                              "the 'rcm' ordering")
+        offsets, indices = self.node_node_connectivity
+        num_nodes = len(offsets) - 1
+        graph = csr_matrix((np.ones(len(indices), dtype=np.int8),
+                            indices.astype(np.intp), offsets.astype(np.intp)),
+                           shape=(num_nodes, num_nodes))
+        return np.asarray(reverse_cuthill_mckee(graph, symmetric_mode=True),
+                          dtype=np.intp)
 
     def save_as_netcdf(self, filepath):
         """
@@ -761,7 +2552,8 @@ class UGrid(object):
             # separate for each type of data see the coordinates example below.
             if self.faces is not None:
                 nc_create_var = nclocal.createVariable
-                face_nodes = nc_create_var(mesh_name + "_face_nodes", IND_DT,
+                face_nodes = nc_create_var(mesh_name + "_face_nodes",
+                                           self.faces.dtype,
                                            (mesh_name + '_num_face',
                                             mesh_name + '_num_vertices'),)
                 face_nodes[:] = self.faces
@@ -773,7 +2565,8 @@ class UGrid(object):
 
             if self.edges is not None:
                 nc_create_var = nclocal.createVariable
-                edge_nodes = nc_create_var(mesh_name + "_edge_nodes", IND_DT,
+                edge_nodes = nc_create_var(mesh_name + "_edge_nodes",
+                                           self.edges.dtype,
                                            (mesh_name + '_num_edge', 'two'),)
                 edge_nodes[:] = self.edges
 
@@ -785,7 +2578,7 @@ class UGrid(object):
             if self.boundaries is not None:
                 nc_create_var = nclocal.createVariable
                 boundary_nodes = nc_create_var(mesh_name + "_boundary_nodes",
-                                               IND_DT,
+                                               self.boundaries.dtype,
                                                (mesh_name + '_num_boundary',
                                                 'two'),)
                 boundary_nodes[:] = self.boundaries
@@ -803,7 +2596,8 @@ class UGrid(object):
                         nc_create_var = nclocal.createVariable
                         name = "{0}_{1}_{2}".format(mesh_name, location, axis)
                         dimensions = "{0}_num_{1}".format(mesh_name, location)
-                        var = nc_create_var(name, NODE_DT,
+                        var = nc_create_var(name,
+                                            getattr(self, loc).dtype,
                                             dimensions=(dimensions),)
                         loc = "{0}_coordinates".format(location)
                         var[:] = getattr(self, loc)[:, ind]
@@ -5,6 +5,10 @@ Miscellaneous util functions.
 
 from __future__ import (absolute_import, division, print_function)
 
+import hashlib
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 
 
@@ -13,50 +17,428 @@ epsilon = 1.e-5
 
 def point_in_tri(face_points, point, return_weights=False):
     """
-    Calculates whether point is internal/external
-    to element by comparing summed area of sub triangles with area of triangle
-    element.
-
-    """
-    sub_tri_areas = np.zeros(3)
-    sub_tri_areas[0] = _signed_area_tri(np.vstack((face_points[(0, 1), :],
-                                                   point)))
-    sub_tri_areas[1] = _signed_area_tri(np.vstack((face_points[(1, 2), :],
-                                                   point)))
-    sub_tri_areas[2] = _signed_area_tri(np.vstack((face_points[(0, 2), :],
-                                                   point)))
-    tri_area = _signed_area_tri(face_points)
-
-    if abs(np.abs(sub_tri_areas).sum()-tri_area)/tri_area <= epsilon:
-        if return_weights:
-            raise NotImplementedError
-            # weights = sub_tri_areas/tri_area
-            # weights[1] = max(0., min(1., weights[1]))
-            # weights[2] = max(0., min(1., weights[2]))
-            # if (weights[0]+weights[1]>1):
-            #     weights[2] = 0
-            #     weights[1] = 1-weights[0]
-            # else:
-            #     weights[2] = 1-weights[0]-weights[1]
-            #
-            # return weights
-        else:
-            return True
+    Calculates whether point is internal/external to a triangle.
+
+    :param face_points: (3, 2) array of the coordinates of the vertices
+    :param point: (x, y) of the point
+
+    :param return_weights=False: if True, return the barycentric weights
+                                 of the point (see points_in_tris) rather
+                                 than True, if it is in the triangle.
+
+    Points a little outside the triangle (within epsilon, relative to its
+    area) count as inside, as they always have. For many points at once,
+    use points_in_tris.
+    """
+    inside, weights = points_in_tris(point, face_points, np.arange(3),
+                                     return_weights=True, tolerance=epsilon)
+    if inside[0]:
+        return weights[0] if return_weights else True
     return False
 
 
-def _signed_area_tri(points):
+def points_in_tris(points, nodes, tris, return_weights=False, out=None,
+                   work=None, tolerance=0.0):
+    """
+    Checks if each of a number of points is in a triangle -- all at once.
+
+    :param points: (N, 2) array of the points
+    :param nodes: (K, 2) array of the node coordinates
+    :param tris: (N, 3) array of the nodes of the triangle to check each
+                 point against -- e.g. faces[candidates].
+
+    :param return_weights=False: if True, return the barycentric weights
+                                 of each point as well.
+
+    :param out=None: (inside, weights) arrays to put the results in --
+                     (N,) bool and (N, 3) float -- rather than making new
+                     ones. weights may be None if not returned.
+
+    :param work=None: (10, N) float64 array to work in -- so calling this
+                      over and over (on chunks of the same size) allocates
+                      nothing.
+
+    :param tolerance=0.0: how far outside the triangle a point can be and
+                          still count as inside: the sum of the absolute
+                          values of its weights can be up to 1 + tolerance.
+
+    :returns: inside: (N,) boolean array -- True if in the triangle, or on
+              its edge. Or (inside, weights) if return_weights is True.
+
+    The weights are clamped to [0, 1] (and add up to 1), so for points just
+    off the triangle (round off...) they are those of a point on its edge.
+    Triangles with no area have nothing inside, and weights of nan. The
+    triangles can be wound either way.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    nodes = np.asarray(nodes)
+    tris = np.asarray(tris).reshape(-1, 3)
+    num_points = len(points)
+    if out is None:
+        inside = np.empty(num_points, dtype=bool)
+        weights = np.empty((num_points, 3)) if return_weights else None
+    else:
+        inside, weights = out
+    if work is None:
+        work = np.empty((10, num_points))
+    x, y, sub_areas, area = work[0:3], work[3:6], work[6:9], work[9]
+
+    for k in range(3):
+        np.take(nodes[:, 0], tris[:, k], out=x[k])
+        x[k] -= points[:, 0]
+        np.take(nodes[:, 1], tris[:, k], out=y[k])
+        y[k] -= points[:, 1]
+    # twice the signed areas of the triangles made by the point and each
+    # side: in proportion to the weight of the vertex across from it.
+    for k in range(3):
+        i, j = (k + 1) % 3, (k + 2) % 3
+        np.multiply(x[i], y[j], out=sub_areas[k])
+        np.multiply(x[j], y[i], out=area)
+        sub_areas[k] -= area
+    np.add(sub_areas[0], sub_areas[1], out=area)
+    area += sub_areas[2]
+
+    # inside if the sub areas all have the same sign: then they add up to
+    # the area (exactly -- it's the same sum), otherwise to more.
+    total, limit = x[0], x[1]
+    np.abs(sub_areas[0], out=total)
+    for k in (1, 2):
+        np.abs(sub_areas[k], out=limit)
+        total += limit
+    np.abs(area, out=limit)
+    limit *= 1.0 + tolerance
+    np.less_equal(total, limit, out=inside)
+    np.logical_and(inside, area, out=inside)
+
+    if weights is None:
+        return inside
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k in range(3):
+            np.divide(sub_areas[k], area, out=weights[:, k])
+        np.clip(weights, 0.0, 1.0, out=weights)
+        np.add(weights[:, 0], weights[:, 1], out=total)
+        total += weights[:, 2]
+        # nan for the triangles with no area
+        np.divide(area, area, out=limit)
+        total /= limit
+        weights /= total[:, None]
+    return inside, weights
+
+
+def unit_vectors(lon, lat):
+    """
+    The points on the unit sphere at lon, lat (in degrees), as an (N, 3)
+    array of (x, y, z)
+    """
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    vectors = np.empty(lon.shape + (3,))
+    cos_lat = np.cos(lat)
+    vectors[..., 0] = cos_lat * np.cos(lon)
+    vectors[..., 1] = cos_lat * np.sin(lon)
+    vectors[..., 2] = np.sin(lat)
+    return vectors
+
+
+def hilbert_index(points, order=16):
+    """
+    The position of each point along a Hilbert (space filling) curve
+    through the bounding box of the points.
+
+    Sorting by this index puts points that are close in space close
+    together in memory.
+
+    :param points: (N, 2) array of coordinates
+    :param order=16: number of levels of the curve: the bounding box is
+                     divided into 2**order by 2**order cells.
+
+    :returns: (N,) int64 array of the index along the curve
     """
-    points : the coordinates of the triangle vertices -- (3x2) float array
-    returns signed area of the triangle.
+    points = np.asarray(points, dtype=np.float64)
+    n = 2 ** order
+    if len(points) == 0:
+        return np.zeros((0,), dtype=np.int64)
+    lower = points.min(axis=0)
+    extent = (points.max(axis=0) - lower).max()
+    if extent == 0:
+        extent = 1.0
+    cells = ((points - lower) / extent * (n - 1)).astype(np.int64)
+    x = cells[:, 0]
+    y = cells[:, 1]
+    index = np.zeros(len(points), dtype=np.int64)
+    s = n // 2
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        index += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant so the curve joins up
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        x, y = np.where(ry, x, y), np.where(ry, y, x)
+        s //= 2
+    return index
+
+
+def points_in_polygon(points, polygon):
+    """
+    Flags the points that are inside the polygon (even-odd rule).
+
+    :param points: (N, 2) array of points
+    :param polygon: (M, 2) array of the polygon vertices -- it is closed
+                    for you.
+
+    :returns: (N,) boolean array
 
+    Vectorized over the points: one pass for each side of the polygon.
     """
+    points = np.asarray(points, dtype=np.float64)
+    polygon = np.asarray(polygon, dtype=np.float64)
+    inside = np.zeros(len(points), dtype=bool)
+    # only the points in the bounding box of the polygon need checking
+    candidates = np.nonzero(((points >= polygon.min(axis=0)) &
+                             (points <= polygon.max(axis=0))).all(axis=1))[0]
+    x, y = points[candidates].T
+    crossings = np.zeros(len(candidates), dtype=bool)
+    for (x1, y1), (x2, y2) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        if y1 == y2:
+            continue
+        straddle = (y1 > y) != (y2 > y)
+        x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        crossings ^= straddle & (x < x_cross)
+    inside[candidates] = crossings
+    return inside
+
+
+def csr_rows(offsets, indices, rows):
+    """
+    Gathers the entries of a number of rows of a compressed sparse row
+    (offsets, indices) structure, all at once.
+
+    :param offsets, indices: the CSR structure: the entries of row i are
+                             indices[offsets[i]:offsets[i + 1]]
+    :param rows: the rows wanted
+
+    :returns: entries, row_of_entry: the entries of all the rows, one row
+              after the other, and which of the rows each came from.
+    """
+    rows = np.asarray(rows, dtype=np.intp)
+    starts = np.asarray(offsets[rows], dtype=np.intp)
+    lengths = np.asarray(offsets[rows + 1], dtype=np.intp) - starts
+    row_of_entry = np.repeat(np.arange(len(rows)), lengths)
+    # position of each entry within its row
+    ends = np.cumsum(lengths)
+    total = ends[-1] if len(ends) else 0
+    within = np.arange(total) - np.repeat(ends - lengths, lengths)
+    return indices[starts[row_of_entry] + within], row_of_entry
+
+
+def component_labels(num, first, second):
+    """
+    Labels the connected components of a graph.
+
+    :param num: the number of vertices of the graph
+    :param first, second: arrays of the two ends of each link
+
+    :returns: (num,) array of the lowest index of the vertices in the
+              component each vertex is in.
+
+    Vectorized union-find: each pass hooks the root of the larger label of
+    each link onto the smaller one, then jumps pointers until everything
+    points straight at its root. Only the links that still join two trees
+    are kept for the next pass.
+    """
+    first = np.asarray(first, dtype=np.intp)
+    second = np.asarray(second, dtype=np.intp)
+    label = np.arange(num)
+    while True:
+        first_label = label[first]
+        second_label = label[second]
+        differ = first_label != second_label
+        if not differ.any():
+            return label
+        first = first[differ]
+        second = second[differ]
+        first_label = first_label[differ]
+        second_label = second_label[differ]
+        np.minimum.at(label, np.maximum(first_label, second_label),
+                      np.minimum(first_label, second_label))
+        while True:
+            jumped = label[label]
+            if np.array_equal(jumped, label):
+                break
+            label = jumped
+
+
+# the most nodes that the segments between them can be packed into one
+# int64 key: low * num_nodes + high < num_nodes ** 2 <= 2 ** 63 - 1
+MAX_PACKED_NODES = 3037000499
+
+# the key of a segment between more nodes than that: sorts by low, then
+# high, the same as the packed key.
+SEGMENT_KEY_DT = np.dtype([('low', np.int64), ('high', np.int64)])
+
+
+def segment_keys(first, second, num_nodes):
+    """
+    A single key for each segment between two nodes, whichever way round
+    it is -- so the keys can be sorted, np.unique-d, searched, etc. to
+    match up the segments.
+
+    :param first, second: arrays of the nodes at the two ends
+    :param num_nodes: one more than the largest node index
+
+    :returns: int64 array of low * num_nodes + high -- or, for more than
+              MAX_PACKED_NODES nodes, where that would overflow, a
+              SEGMENT_KEY_DT array of (low, high). Use key_nodes() to get
+              the nodes back.
+    """
+    first = np.asarray(first, dtype=np.int64)
+    second = np.asarray(second, dtype=np.int64)
+    low = np.minimum(first, second)
+    high = np.maximum(first, second)
+    if num_nodes <= MAX_PACKED_NODES:
+        low *= num_nodes
+        low += high
+        return low
+    keys = np.empty(low.shape, dtype=SEGMENT_KEY_DT)
+    keys['low'] = low
+    keys['high'] = high
+    return keys
+
+
+def edge_keys(faces, num_nodes=None):
+    """
+    The segment_keys of the edges of each face.
+
+    Edge j of a face runs from vertex j to vertex j + 1 (wrapping around).
+
+    :param faces: (num_faces, num_vertices) array of node indexes
+
+    :param num_nodes=None: one more than the largest node index --
+                           computed from faces if not given.
+
+    :returns: (num_faces, num_vertices) array of edge keys
+    """
+    faces = np.asarray(faces, dtype=np.int64)
+    if num_nodes is None:
+        num_nodes = int(faces.max()) + 1 if faces.size else 1
+    return segment_keys(faces, np.roll(faces, -1, axis=1), num_nodes)
+
+
+def key_nodes(keys, num_nodes):
+    """
+    The (low, high) nodes of segment_keys -- int64 arrays.
+    """
+    if keys.dtype == SEGMENT_KEY_DT:
+        return keys['low'], keys['high']
+    return keys // num_nodes, keys % num_nodes
+
+
+def colored_scatter_add(out, indices, values, colors, workers=None):
+    """
+    out[indices] += values, with repeated indexes adding up (like
+    numpy.add.at), spread across a pool of threads.
+
+    :param out: the array to add to -- changed in place
+    :param indices: (N, M) array of the indexes into out of each of N
+                    items: e.g. the nodes of each face.
+    :param values: (N,) or (N, M) array of what to add: the same for all
+                   the indexes of an item, or one for each.
+    :param colors: (N,) array of the color of each item: no two items of
+                   the same color may share an index (see
+                   UGrid.face_coloring).
+    :param workers=None: number of threads -- default: one per cpu.
+
+    :returns: out
+
+    Each color is done in turn. The items of one color don't share any
+    indexes, so they can be split up between the threads with no races,
+    and plain fancy indexing (which numpy can do without holding the GIL)
+    can be used rather than the much slower add.at.
+    """
+    indices = np.asarray(indices)
+    values = np.asarray(values)
+    if values.ndim == 1:
+        values = values[:, None]
+    colors = np.asarray(colors)
+    workers = cpu_count() if workers is None else max(int(workers), 1)
+
+    order = np.argsort(colors, kind='stable')
+    bounds = np.searchsorted(colors[order],
+                             np.arange(colors.max() + 2 if len(colors) else 1))
+
+    def add(items):
+        out[indices[items]] += values[items]
+
+    pool = ThreadPool(workers) if workers > 1 else None
+    try:
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            items = order[start:stop]
+            if pool is None or len(items) < 2 * workers:
+                add(items)
+            else:
+                pool.map(add, np.array_split(items, workers))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return out
+
+
+def hash_arrays(arrays, dtypes=None, workers=None, block_size=2 ** 24):
+    """
+    A hash of the contents of a number of arrays -- a hex string.
+
+    :param arrays: sequence of the arrays (None is allowed)
+    :param dtypes=None: the dtype to hash each array as -- so arrays of
+                        the same values hash the same, whatever type they
+                        are stored as. Default: as they are.
+    :param workers=None: number of threads -- default: one per cpu.
+    :param block_size=2**24: about how many bytes to hash at a time.
+
+    The arrays are hashed a block of rows at a time -- converted to the
+    dtype a block at a time, so they are never copied all at once. Each
+    block gets its own SHA-1 (which releases the GIL, so they can be done
+    in parallel), then those are hashed, in order, along with the shape
+    and dtype of each array.
+    """
+    if dtypes is None:
+        dtypes = [None] * len(arrays)
+    blocks = []
+    parts = []
+    for array, dtype in zip(arrays, dtypes):
+        if array is None:
+            parts.append(b'None')
+            continue
+        dtype = np.dtype(array.dtype if dtype is None else dtype)
+        parts.append('{}{}'.format(dtype.str, array.shape).encode('ascii'))
+        row_bytes = max(dtype.itemsize * int(np.prod(array.shape[1:])), 1)
+        rows = max(block_size // row_bytes, 1)
+        for start in range(0, len(array), rows):
+            parts.append(len(blocks))
+            blocks.append((array, dtype, start, start + rows))
+
+    def digest(block):
+        array, dtype, start, stop = block
+        data = np.ascontiguousarray(array[start:stop], dtype=dtype)
+        return hashlib.sha1(data.reshape(-1).view(np.uint8)).digest()
 
-    x1, y1 = points[0]
-    x2, y2 = points[1]
-    x3, y3 = points[2]
+    workers = cpu_count() if workers is None else max(int(workers), 1)
+    if workers > 1 and len(blocks) > 1:
+        pool = ThreadPool(min(workers, len(blocks)))
+        try:
+            digests = pool.map(digest, blocks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        digests = [digest(block) for block in blocks]
 
-    return(((x1-x3)*(y2-y3)-(x2-x3)*(y1-y3))/2)
+    hasher = hashlib.sha1()
+    for part in parts:
+        hasher.update(part if isinstance(part, bytes) else digests[part])
+    return hasher.hexdigest()
 
 
 must_have = ['dtype', 'shape', 'ndim','__len__', '__getitem__', '__getattribute__']
@@ -85,6 +85,7 @@ class UVar(object):
     @data.setter
     def data(self, data):
         self._data = asarraylike(data)
+        self._cache.clear()
 
     @data.deleter
     def data(self):